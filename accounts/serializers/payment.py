@@ -23,6 +23,14 @@ class PaymentApiSerializer(serializers.ModelSerializer):
         return data
 
 
+class PaymentBulkItemSerializer(serializers.Serializer):
+    booking = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    bill = serializers.CharField(max_length=20, required=False, allow_blank=True)
+    comment = serializers.CharField(required=False, allow_blank=True)
+    payed_date = serializers.DateTimeField(required=False, allow_null=True)
+
+
 class PayFilterSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     payed_date = serializers.DateTimeField(format="%d.%m.%Y %H:%M", required=False)
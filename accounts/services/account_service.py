@@ -1,24 +1,98 @@
-from django.shortcuts import get_object_or_404
+from datetime import timedelta
 
+from django.db import transaction
+from django.db.models import F, Case, When, Value, DateTimeField
+from rest_framework.exceptions import APIException
+
+from dormitory.filters import student_name_q
 from dormitory.models import Booking, Payment
+from .payment_daily import PaymentDailyService
+
+
+def latest_payed(payed_date):
+    # last_payed only moves forward, a back-dated payment keeps the newer date
+    if payed_date is None:
+        return F('last_payed')
+    return Case(When(last_payed__gt=payed_date, then=F('last_payed')), default=Value(payed_date))
+
+
+def overpay_message(total_price, payed, amount):
+    limit = abs(total_price - (payed + amount))
+    return f'Студент переплачивает {limit}'
 
 
 class PaymentService:
 
     @staticmethod
+    def pay_list(date_start, date_end, full_name=None):
+        # the end date is inclusive: everything paid before the next midnight
+        payments = Payment.objects.filter(payed_date__gte=date_start, payed_date__lt=date_end + timedelta(days=1))
+        if full_name:
+            payments = payments.filter(student_name_q(full_name, 'booking__student__'))
+        return payments
+
+    @staticmethod
+    @transaction.atomic
     def pay_logic(payment_data):
         book_id = payment_data.get('booking').id
-        print(book_id, 'boook id')
+        amount = payment_data.get('amount')
+        # one conditional UPDATE: concurrent cashiers never lose an increment and can not overpay the contract
+        updated = Booking.objects.filter(pk=book_id, total_price__gte=F('payed') + amount) \
+            .update(payed=F('payed') + amount, debt=F('debt') - amount,
+                    last_payed=latest_payed(payment_data.get('payed_date')))
+        if not updated:
+            book = Booking.objects.get(pk=book_id)
+            raise APIException({'total': overpay_message(book.total_price, book.payed, amount)})
+
         payment = Payment(**payment_data)
         payment.save()
-        if payment:
-            book = get_object_or_404(Booking, pk=book_id)
-            book.payed += payment_data.get('amount')
-            book.save()
-        else:
-            pass
-
-        # print(book_id, 'book_id')
-        # payment.save()
-        # print(payment_data, 'payment data')
+        PaymentDailyService.add([(payment.payed_date, payment.amount)])
         return payment
+
+    @staticmethod
+    @transaction.atomic
+    def bulk_pay(rows):
+        # rows: validated PaymentBulkItemSerializer data, posted in order; each row succeeds or fails on its own
+        book_ids = {row['booking'] for row in rows}
+        books = {book_id: [total_price, payed, last_payed] for book_id, total_price, payed, last_payed in
+                 Booking.objects.select_for_update().filter(pk__in=book_ids).order_by('id')
+                 .values_list('id', 'total_price', 'payed', 'last_payed')}
+
+        results = []
+        payments = []
+        paid_books = set()
+        for index, row in enumerate(rows):
+            book = books.get(row['booking'])
+            amount = row['amount']
+            if book is None:
+                results.append({'row': index, 'errors': {'booking': 'Контракт не найден'}})
+                continue
+            if amount <= 0:
+                results.append({'row': index, 'errors': {'amount': 'Сумма оплата должно быт больше чем 0'}})
+                continue
+            if book[0] < book[1] + amount:
+                results.append({'row': index, 'errors': {'total': overpay_message(book[0], book[1], amount)}})
+                continue
+            book[1] += amount
+            if row.get('payed_date') is not None and (book[2] is None or row['payed_date'] > book[2]):
+                book[2] = row['payed_date']
+            paid_books.add(row['booking'])
+            payments.append(Payment(booking_id=row['booking'], amount=amount, bill=row.get('bill', ''),
+                                    comment=row.get('comment', ''), payed_date=row.get('payed_date')))
+            results.append({'row': index, 'booking': row['booking'], 'payed': str(book[1])})
+
+        Payment.objects.bulk_create(payments, batch_size=500)
+        PaymentDailyService.add((payment.payed_date, payment.amount) for payment in payments)
+        changed = [(book_id, *books[book_id]) for book_id in sorted(paid_books)]
+        for start in range(0, len(changed), 500):
+            chunk = changed[start:start + 500]
+            Booking.objects.filter(pk__in=[book[0] for book in chunk]).update(
+                payed=Case(*[When(pk=book_id, then=Value(payed)) for book_id, _, payed, _ in chunk],
+                           default=F('payed')),
+                debt=Case(*[When(pk=book_id, then=Value(total_price - payed))
+                            for book_id, total_price, payed, _ in chunk], default=F('debt')),
+                last_payed=Case(*[When(pk=book_id, then=Value(last_payed)) for book_id, _, _, last_payed in chunk],
+                                default=F('last_payed'), output_field=DateTimeField()),
+            )
+
+        return {'created': len(payments), 'results': results}
@@ -0,0 +1,49 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import F, Sum, Count
+from django.db.models.functions import TruncDate
+
+from dormitory.models import Payment, PaymentDaily
+
+
+class PaymentDailyService:
+
+    @staticmethod
+    def compute(payments=None):
+        payments = Payment.objects.all() if payments is None else payments
+        rows = payments.filter(payed_date__isnull=False).annotate(day=TruncDate('payed_date')).values('day') \
+            .annotate(total=Sum('amount'), number=Count('id')).order_by('day')
+        return {row['day']: (row['total'], row['number']) for row in rows}
+
+    @staticmethod
+    def recompute():
+        days = PaymentDailyService.compute()
+        PaymentDaily.objects.exclude(date__in=days).delete()
+        PaymentDaily.objects.bulk_create(
+            [PaymentDaily(date=day, amount=amount, count=count) for day, (amount, count) in days.items()],
+            update_conflicts=True, unique_fields=['date'], update_fields=['amount', 'count'], batch_size=500,
+        )
+        return days
+
+    @staticmethod
+    def add(payments):
+        # payments: iterable of (payed_date, amount); runs inside the caller's transaction
+        days = defaultdict(lambda: [Decimal(0), 0])
+        for payed_date, amount in payments:
+            if payed_date is None:
+                continue
+            day = payed_date.date() if hasattr(payed_date, 'date') else payed_date
+            days[day][0] += amount
+            days[day][1] += 1
+        for day in sorted(days):
+            amount, count = days[day]
+            PaymentDaily.objects.get_or_create(date=day)
+            PaymentDaily.objects.filter(date=day).update(amount=F('amount') + amount, count=F('count') + count)
+
+    @staticmethod
+    def totals(date_start, date_end):
+        # both ends inclusive, returns {'amount': sum or None, 'count': number of payments}
+        totals = PaymentDaily.objects.filter(date__gte=date_start, date__lte=date_end) \
+            .aggregate(amount=Sum('amount'), count=Sum('count'))
+        return {'amount': totals['amount'], 'count': totals['count'] or 0}
@@ -1,3 +1,140 @@
-from django.test import TestCase
+import datetime
+import threading
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.db.models import Sum
+from django.test import TransactionTestCase, skipUnlessDBFeature
+from rest_framework.exceptions import APIException
+from rest_framework.test import APIClient
+
+from accounts.services.account_service import PaymentService
+from accounts.services.payment_daily import PaymentDailyService
+from dormitory.models import Booking, Payment, PaymentDaily
+from dormitory.services.booking import BookingService
+from dormitory.tests.base import DormitoryTestCase, seed
+
+
+def book_students(data, students):
+    rows = [{'student': student.id, 'room': data['rooms'][0].id, 'book_date': datetime.date(2023, 9, 1)}
+            for student in students]
+    BookingService.bulk_add_students(rows, data['admin'].id)
+    return list(Booking.objects.filter(student__in=students).order_by('student_id'))
+
+
+def paid_state(book):
+    book = Booking.objects.get(pk=book.pk)
+    return book.payed, book.debt, book.last_payed
+
+
+class PaymentServiceTest(DormitoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book, self.twin = book_students(self.data, [self.data['students'][0], self.data['students'][2]])
+        self.assertEqual(self.book.total_price, self.twin.total_price)
+
+    def pay(self, book, amount, day):
+        return PaymentService.pay_logic({'booking': book, 'amount': Decimal(amount), 'bill': '1',
+                                         'payed_date': datetime.datetime(2023, 9, day, 12)})
+
+    def test_payment_moves_payed_debt_and_last_payed(self):
+        self.pay(self.book, 300, 10)
+        self.pay(self.book, 200, 5)
+        payed, debt, last_payed = paid_state(self.book)
+        self.assertEqual(payed, 500)
+        self.assertEqual(debt, self.book.total_price - 500)
+        # a back-dated payment does not move last_payed back
+        self.assertEqual(last_payed, datetime.datetime(2023, 9, 10, 12))
+
+    def test_overpay_is_refused_without_a_payment(self):
+        self.pay(self.book, self.book.total_price - 10, 2)
+        with self.assertRaises(APIException):
+            self.pay(self.book, 11, 3)
+        self.assertEqual(paid_state(self.book)[0], self.book.total_price - 10)
+        self.assertEqual(Payment.objects.filter(booking=self.book).count(), 1)
+
+    def test_bulk_posting_equals_posting_one_by_one(self):
+        amounts = [(Decimal(300), 10), (Decimal(200), 5), (self.book.total_price, 12), (Decimal(50), 20)]
+        rows = [{'booking': self.book.pk, 'amount': amount, 'bill': '1',
+                 'payed_date': datetime.datetime(2023, 9, day, 12)} for amount, day in amounts]
+        rows += [{'booking': 0, 'amount': Decimal(1)}, {'booking': self.book.pk, 'amount': Decimal(0)}]
+        result = PaymentService.bulk_pay(rows)
+
+        errors = []
+        for index, (amount, day) in enumerate(amounts):
+            try:
+                self.pay(self.twin, amount, day)
+            except APIException:
+                errors.append(index)
+        self.assertEqual(result['created'], len(amounts) - len(errors))
+        self.assertEqual([row['row'] for row in result['results'] if 'errors' in row], errors + [4, 5])
+        self.assertEqual(paid_state(self.book), paid_state(self.twin))
+        self.assertEqual(Payment.objects.filter(booking=self.book).aggregate(total=Sum('amount'))['total'],
+                         paid_state(self.book)[0])
+
+    def test_bulk_body_must_be_an_object(self):
+        client = APIClient()
+        client.force_authenticate(self.data['admin'])
+        row = {'booking': self.book.pk, 'amount': '10'}
+        self.assertEqual(client.post('/api/payment/bulk', [row], format='json').status_code, 400)
+        self.assertEqual(client.post('/api/payment/bulk', {'payments': [row]}, format='json').status_code, 200)
+        self.assertEqual(Payment.objects.filter(booking=self.book).count(), 1)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentPaymentTest(TransactionTestCase):
+
+    def test_parallel_payments_are_neither_lost_nor_overpaid(self):
+        data = seed()
+        book, = book_students(data, [data['students'][0]])
+        amount = (book.total_price / 4).quantize(Decimal('0.01'))
+        barrier = threading.Barrier(6)
+        results = []
+
+        def pay():
+            try:
+                barrier.wait()
+                PaymentService.pay_logic({'booking': book, 'amount': amount, 'bill': '1',
+                                          'payed_date': datetime.datetime(2023, 9, 2, 12)})
+                results.append('ok')
+            except APIException:
+                results.append('overpay')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=pay) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), ['ok'] * 4 + ['overpay'] * 2)
+        payed, debt, _ = paid_state(book)
+        self.assertEqual(payed, amount * 4)
+        self.assertEqual(payed, Payment.objects.filter(booking=book).aggregate(total=Sum('amount'))['total'])
+        self.assertEqual(debt, book.total_price - payed)
+
+
+class PaymentDailyTest(DormitoryTestCase):
+
+    def test_rollup_matches_a_recount(self):
+        book, twin = book_students(self.data, [self.data['students'][0], self.data['students'][2]])
+        PaymentService.pay_logic({'booking': book, 'amount': Decimal('100.25'), 'bill': '1',
+                                  'payed_date': datetime.datetime(2023, 9, 1, 23, 59)})
+        PaymentService.bulk_pay([
+            {'booking': book.pk, 'amount': Decimal(50), 'payed_date': datetime.datetime(2023, 9, 1, 8)},
+            {'booking': twin.pk, 'amount': Decimal(70), 'payed_date': datetime.datetime(2023, 9, 3)},
+            {'booking': twin.pk, 'amount': Decimal(5)},
+            {'booking': twin.pk, 'amount': Decimal(10 ** 6), 'payed_date': datetime.datetime(2023, 9, 3)},
+        ])
+        stored = {row.date: (row.amount, row.count) for row in PaymentDaily.objects.all()}
+        self.assertEqual(stored, PaymentDailyService.compute())
+        self.assertEqual(stored[datetime.date(2023, 9, 1)], (Decimal('150.25'), 2))
+
+        client = APIClient()
+        client.force_authenticate(self.data['admin'])
+        response = client.get('/api/payment/pay_list', {'start_date': '2023-09-01', 'end_date': '2023-09-02'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.data['total_sum']), Decimal('150.25'))
+        self.assertEqual(response.data['pagination']['total'], 2)
+        self.assertEqual(len(response.data['results']), 2)
@@ -2,9 +2,11 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import mixins, viewsets, serializers
 from dormitory.models import Payment
-from dormitory.utils import CustomPagination
-from .serializers.payment import PaymentApiSerializer, PayFilterSerializer
+from dormitory.utils import CustomPagination, body_list
+from .serializers.payment import PaymentApiSerializer, PayFilterSerializer, PaymentBulkItemSerializer
 from accounts.services.account_service import PaymentService
+from accounts.services.payment_daily import PaymentDailyService
+from rest_framework.exceptions import APIException
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import F, Q, Sum
 from datetime import datetime
@@ -29,23 +31,39 @@ class PaymentApi(mixins.ListModelMixin,
         PaymentService.pay_logic(payment.validated_data)
         return Response({'data': payment.data})
 
+    @action(methods=['post'], detail=False)
+    def bulk(self, request, *args, **kwargs):
+        payments = PaymentBulkItemSerializer(data=body_list(request.data, 'payments'), many=True)
+        payments.is_valid(raise_exception=True)
+        result = PaymentService.bulk_pay(payments.validated_data)
+        return Response({'data': result})
+
     @action(methods=['get'], detail=False)
     def pay_list(self, request):
         query = request.query_params
-        date_start = query.get('start_date')
-        date_end = query.get('end_date')
+        try:
+            date_start = datetime.strptime(query.get('start_date', ''), '%Y-%m-%d').date()
+            date_end = datetime.strptime(query.get('end_date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            raise APIException({'date': 'Укажите start_date и end_date в формате ГГГГ-ММ-ДД'})
         full_name = query.get('full_name')
-        payment = Payment.objects.filter(payed_date__range=(date_start, date_end))\
-            .values('id', 'amount', 'bill', 'booking__student__name', 'booking__student__last_name', 'payed_date')\
-            .order_by('-payed_date')
-        total_sum = payment.aggregate(Sum('amount'))
+        payment = PaymentService.pay_list(date_start, date_end, full_name)
+        if full_name:
+            total_sum = payment.aggregate(Sum('amount'))['amount__sum']
+        else:
+            totals = PaymentDailyService.totals(date_start, date_end)
+            total_sum = totals['amount']
+            # the paginator reuses the rollup count instead of COUNT(*) over the range
+            self.total_count = totals['count']
+        payment = payment.values('id', 'amount', 'bill', 'booking__student__name', 'booking__student__last_name',
+                                 'payed_date').order_by('-payed_date')
         page = self.paginate_queryset(payment)
         if page is not None:
             serializer = PayFilterSerializer(page, many=True)
             result = self.get_paginated_response(serializer.data)
             data = result.data  # pagination data
         else:
-            serializer = PayFilterSerializer(query, many=True)
-            data = serializer.data
-        data['total_sum'] = total_sum['amount__sum']
-        return Response(data)
\ No newline at end of file
+            serializer = PayFilterSerializer(payment, many=True)
+            data = {'results': serializer.data}
+        data['total_sum'] = total_sum
+        return Response(data)
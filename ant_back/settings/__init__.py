@@ -1,4 +1,5 @@
 from .base import *
 from .database import *
 from .drf import *
-from .jwt import *
\ No newline at end of file
+from .jwt import *
+from .cache import *
\ No newline at end of file
@@ -0,0 +1,9 @@
+import os
+
+# use a shared backend (memcached, redis, file based) in production so every worker sees the same indexes
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
@@ -1,3 +1,59 @@
-from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from commandant.models import Commandant
+from dormitory.tests.base import DormitoryTestCase
+
+
+class CommandantAccessTest(DormitoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        response = self.client.post('/api/token/', {'email': 'com@test.com', 'password': 'pw'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.refresh, self.access = response.data['refresh'], response.data['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def test_token_carries_role_and_building(self):
+        access = AccessToken(self.access)
+        self.assertEqual(access['role'], '3')
+        self.assertEqual(access['building_id'], self.data['buildings'][1].id)
+
+    def test_floor_plan_of_own_building_only(self):
+        own, other = self.data['buildings'][1], self.data['buildings'][0]
+        # the user comes from the token claims, the plan is the only query
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/building/{own.id}/floor_plan')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['building']['id'], own.id)
+        self.assertEqual(self.client.get(f'/api/building/{other.id}/floor_plan').status_code, 404)
+
+    def test_building_comes_from_the_token(self):
+        own, other = self.data['buildings'][1], self.data['buildings'][0]
+        # the reassignment is only seen after a refresh, the access token still scopes to the old building
+        Commandant.objects.filter(user=self.data['commandant']).update(building=other)
+        response = self.client.get('/api/main-dorm')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['build_id'] for row in response.data['data']], [own.id])
+        self.assertEqual(self.client.get(f'/api/building/{own.id}/floor_plan').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/building/{other.id}/floor_plan').status_code, 404)
+
+    def test_token_without_claims_reads_the_building(self):
+        own, other = self.data['buildings'][1], self.data['buildings'][0]
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.data["commandant"])}')
+        response = self.client.get('/api/main-dorm')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['build_id'] for row in response.data['data']], [own.id])
+        self.assertEqual(self.client.get(f'/api/building/{other.id}/floor_plan').status_code, 404)
+
+    def test_refresh_reads_the_claims_again(self):
+        Commandant.objects.filter(user=self.data['commandant']).update(building=self.data['buildings'][0])
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.data['access'])['building_id'], self.data['buildings'][0].id)
+
+        self.data['commandant'].is_active = False
+        self.data['commandant'].save()
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
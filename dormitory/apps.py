@@ -6,4 +6,6 @@ class DormitoryConfig(AppConfig):
     name = 'dormitory'
 
     def ready(self):
+        import dormitory.checks
         import dormitory.signals
+        import dormitory.exports
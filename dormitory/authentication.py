@@ -0,0 +1,56 @@
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from commandant.models import Commandant
+
+
+def user_claims(user):
+    # role and commandant building travel in the token; they can be stale for at most one access token lifetime
+    building_id = None
+    if user.role == '3':
+        building_id = Commandant.objects.filter(user_id=user.id).values_list('building_id', flat=True).first()
+    return {'role': user.role, 'building_id': building_id}
+
+
+def tokens_for_user(user):
+    refresh = RefreshToken.for_user(user)
+    for claim, value in user_claims(user).items():
+        refresh[claim] = value
+    return refresh
+
+
+class ClaimsUser(TokenUser):
+    # request.user built from the access token alone, no database query
+
+    @cached_property
+    def role(self):
+        return self.token.get('role')
+
+    @cached_property
+    def building_id(self):
+        return self.token.get('building_id')
+
+
+def user_building(user):
+    # the commandant's building: from the token claims, read from the database for tokens issued before them
+    if isinstance(user, ClaimsUser):
+        return user.building_id
+    return user_claims(user)['building_id']
+
+
+def scope_bookings(bookings, user):
+    # a commandant only sees the bookings of its own building
+    if user.role == '3':
+        return bookings.filter(room__building_id=user_building(user))
+    return bookings
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        if 'role' not in validated_token:
+            # tokens issued before the claims were added
+            return super().get_user(validated_token)
+        return ClaimsUser(validated_token)
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+
+@register()
+def shared_cache(app_configs, **kwargs):
+    # the availability index, reference bundles and the search change log live in the cache and are
+    # invalidated through it; a per-process cache keeps every other worker on stale data
+    if settings.DEBUG or settings.CACHES['default']['BACKEND'] not in LOCAL_CACHES:
+        return []
+    return [Warning(
+        'The default cache is local to each process.',
+        hint='Set CACHE_BACKEND and CACHE_LOCATION to a shared backend (redis, memcached, file based) '
+             'when running more than one worker.',
+        id='dormitory.W001',
+    )]
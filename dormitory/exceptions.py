@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+
+# unique indexes over the normalized names: the name_key columns, the group and student composite constraints
+NAME_KEY_CONSTRAINTS = ('name_key', 'group_faculty_name_uniq', 'student_identity_uniq')
+
+
+def is_duplicate_name(exc):
+    # only unique violations of the name keys; FK, NOT NULL and CHECK failures are real errors and stay 500
+    message = str(exc)
+    unique = any(marker in message for marker in ('Duplicate entry', 'UNIQUE constraint failed', 'duplicate key'))
+    return unique and any(name in message for name in NAME_KEY_CONSTRAINTS)
+
+
+@contextmanager
+def duplicate_names_as(detail):
+    # the name checks in validate() race with a concurrent insert, the unique index has the last word
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError as exc:
+        if not is_duplicate_name(exc):
+            raise
+        raise ValidationError(detail) from exc
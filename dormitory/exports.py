@@ -0,0 +1,66 @@
+from .authentication import scope_bookings
+from .filters import BookFilter
+from .models import Country, Faculty, Group, Booking
+from .services.debt_aging import DebtAgingService
+from .services.dimension_stats import DimensionStatsService
+from .services.export_jobs import register_export
+from .utils import export_to_excel
+
+
+@register_export('country')
+def country_export(params, user):
+    country = DimensionStatsService.annotate(Country.objects.all(), 'country')
+    totals = DimensionStatsService.totals(country, 'country')
+    return export_to_excel.data_sheet(country, totals, 'country')
+
+
+@register_export('faculty')
+def faculty_export(params, user):
+    faculty = DimensionStatsService.annotate(Faculty.objects.all(), 'faculty')
+    totals = DimensionStatsService.totals(faculty, 'faculty')
+    return export_to_excel.data_sheet(faculty, totals, 'faculty')
+
+
+@register_export('group')
+def group_export(params, user):
+    group = DimensionStatsService.annotate(Group.objects.all(), 'group')
+    totals = DimensionStatsService.totals(group, 'group')
+    return export_to_excel.group_sheet(group, totals, 'group')
+
+
+@register_export('booking')
+def booking_export(params, user):
+    # params are the same query params BookView.list accepts
+    query = BookFilter(params, queryset=scope_bookings(Booking.objects.order_by('created_at'), user)).qs
+    columns = [
+        ('#', 5),
+        ('Студент', 30),
+        ('Здание', 15),
+        ('Комната', 10),
+        ('Сумма', 15),
+        ('Оплачено', 15),
+        ('Долг', 15),
+    ]
+    rows = query.values_list(
+        'student__name', 'student__last_name', 'room__building__name', 'room__number', 'total_price', 'payed', 'debt'
+    ).iterator(chunk_size=export_to_excel.CHUNK_SIZE)
+    rows = ([f'{name} {last_name}', *rest] for name, last_name, *rest in rows)
+    return 'Booking', columns, rows, None
+
+
+@register_export('aging')
+def aging_export(params, user):
+    # params are the BookFilter query params, same as BookView.aging
+    report = DebtAgingService.report(BookFilter(params, queryset=scope_bookings(Booking.objects.all(), user)).qs)
+    columns = [
+        ('#', 5),
+        ('Здание', 15),
+        ('Факультет', 20),
+        ('Долг', 12),
+        ('Без оплаты, дней', 18),
+        ('Контрактов', 12),
+        ('Сумма долга', 15),
+    ]
+    rows = ([row['room__building__name'], row['student__group__faculty__name'], row['debt_bucket'],
+             row['age_bucket'], row['count'], row['total_debt']] for row in report)
+    return 'Aging', columns, rows, None
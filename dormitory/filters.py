@@ -1,11 +1,23 @@
 from django.db.models import Q, F
 from django_filters import rest_framework as filters
 from dormitory.models import Student, Room, Booking, Group
+from dormitory.utils.main_util import normalize_name
+
+
+def student_name_q(value, prefix=''):
+    # prefix match on the indexed name_key / last_name_key columns; "ali vali" matches name and last name together
+    words = normalize_name(value).split()
+    if not words:
+        return Q()
+    if len(words) == 1:
+        return Q(**{f'{prefix}name_key__startswith': words[0]}) | Q(**{f'{prefix}last_name_key__startswith': words[0]})
+    return Q(**{f'{prefix}name_key': words[0], f'{prefix}last_name_key__startswith': words[1]}) | \
+        Q(**{f'{prefix}last_name_key': words[0], f'{prefix}name_key__startswith': words[1]})
 
 
 class StudentFilter(filters.FilterSet):
     course = filters.CharFilter()
-    faculty = filters.NumberFilter(field_name='faculty_id')
+    faculty = filters.NumberFilter(field_name='group__faculty')
     country = filters.NumberFilter(field_name='country_id')
     type = filters.NumberFilter(field_name='student_type')
     search = filters.CharFilter(method='full_name')
@@ -40,23 +52,24 @@ class BookFilter(filters.FilterSet):
     building = filters.NumberFilter(field_name='room__building_id')
     room = filters.CharFilter(field_name='room__number', lookup_expr='startswith')
     search = filters.CharFilter(method='full_name')
-    faculty = filters.NumberFilter(field_name='student__faculty_id')
+    faculty = filters.NumberFilter(field_name='student__group__faculty')
     gender = filters.CharFilter(field_name='student__gender')
     privilege = filters.NumberFilter(method='get_privilege')
     debt = filters.NumberFilter(method='get_debt')
+    debt_from = filters.NumberFilter(field_name='debt', lookup_expr='gte')
 
     class Meta:
         model = Booking
-        fields = ('building', 'search', 'privilege', 'faculty', 'gender', 'debt')
+        fields = ('building', 'search', 'privilege', 'faculty', 'gender', 'debt', 'debt_from')
 
     def full_name(self, queryset, name, value):
         return queryset.filter(Q(student__name__istartswith=value) | Q(student__last_name__istartswith=value))
 
     def get_debt(self, queryset, name, value):
         if value == 1:
-            return queryset.filter(Q(total_price=F('payed')))
+            return queryset.filter(debt__lte=0)
         else:
-            return queryset.exclude(Q(total_price=F('payed')))
+            return queryset.filter(debt__gt=0)
 
     def get_privilege(self, queryset, name, value):
         if value == 1:
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dormitory.services.availability import AvailabilityIndex
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the free bed index or check it against the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='only compare the cached index with the database')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = AvailabilityIndex.check()
+            for building_id, room_id, cached, actual in drift:
+                self.stdout.write(f'building {building_id} room {room_id}: cached {cached}, database {actual}')
+            if drift:
+                raise CommandError(f'{len(drift)} rooms differ, run availability_index to rebuild')
+            self.stdout.write(self.style.SUCCESS('availability index is consistent'))
+            return
+
+        entries = AvailabilityIndex.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'availability index rebuilt for {len(entries)} buildings'))
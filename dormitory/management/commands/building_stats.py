@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dormitory.models import BuildingStats
+from dormitory.services.building_stats import BuildingStatsService, STATS_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard statistics of every building or check them for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='only report buildings whose counters drifted')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            actual = BuildingStatsService.compute()
+            stored = {row['building_id']: row for row in BuildingStats.objects.values('building_id', *STATS_FIELDS)}
+            drift = 0
+            for building_id, values in actual.items():
+                row = stored.get(building_id)
+                if row is None or any(row[field] != values[field] for field in STATS_FIELDS):
+                    drift += 1
+                    self.stdout.write(f'building {building_id}: stored {row}, actual {values}')
+            if drift:
+                raise CommandError(f'{drift} buildings drifted, run building_stats to repair')
+            self.stdout.write(self.style.SUCCESS('building statistics are consistent'))
+            return
+
+        stats = BuildingStatsService.recompute()
+        self.stdout.write(self.style.SUCCESS(f'statistics recomputed for {len(stats)} buildings'))
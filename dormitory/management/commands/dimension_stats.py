@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dormitory.models import DimensionStats
+from dormitory.services.dimension_stats import DimensionStatsService, DIMENSIONS, STATS_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Recompute the group, faculty, country and company counters or check them for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='only report counters that drifted')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = 0
+            for dimension in DIMENSIONS:
+                actual = DimensionStatsService.compute(dimension)
+                stored = {row['key']: row for row in DimensionStats.objects.filter(dimension=dimension)
+                          .values('key', *STATS_FIELDS)}
+                for key, values in actual.items():
+                    row = stored.get(key, dict.fromkeys(STATS_FIELDS, 0))
+                    if any(row[field] != values[field] for field in STATS_FIELDS):
+                        drift += 1
+                        self.stdout.write(f'{dimension} {key}: stored {row}, actual {values}')
+            if drift:
+                raise CommandError(f'{drift} counters drifted, run dimension_stats to repair')
+            self.stdout.write(self.style.SUCCESS('dimension counters are consistent'))
+            return
+
+        stats = DimensionStatsService.recompute()
+        self.stdout.write(self.style.SUCCESS(
+            'counters recomputed for ' + ', '.join(f'{len(rows)} {name}' for name, rows in stats.items())))
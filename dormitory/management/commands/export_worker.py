@@ -0,0 +1,30 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from dormitory.services.export_jobs import ExportJobService
+from dormitory.services.worker import run_task
+
+
+class Command(BaseCommand):
+    help = 'Run pending export jobs and the running ones whose lease expired, e.g. after a restart of the web workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2)
+        parser.add_argument('--loop', action='store_true', help='keep polling for new jobs')
+        parser.add_argument('--interval', type=float, default=5, help='seconds between polls')
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            while True:
+                requeued = ExportJobService.requeue_stale()
+                if requeued:
+                    self.stdout.write(f'{requeued} stale export jobs queued again')
+                job_ids = ExportJobService.pending_ids()
+                list(executor.map(lambda job_id: run_task(ExportJobService.run, job_id), job_ids))
+                if job_ids:
+                    self.stdout.write(f'{len(job_ids)} export jobs processed')
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
@@ -0,0 +1,38 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dormitory.services.occupancy import OccupancySnapshotService
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'{value}: expected a date as YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Write the per floor occupancy snapshot of a day (today by default) or backfill a range of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=parse_date, help='day to snapshot, YYYY-MM-DD')
+        parser.add_argument('--backfill', action='store_true',
+                            help='snapshot every day from --since (or the first book_date) up to --date')
+        parser.add_argument('--since', type=parse_date, help='first day of the backfill, YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        day = options['date'] or datetime.date.today()
+        if not options['backfill']:
+            stats = OccupancySnapshotService.snapshot(day)
+            self.stdout.write(self.style.SUCCESS(f'{day}: snapshot written for {len(stats)} floors'))
+            return
+
+        since = options['since'] or OccupancySnapshotService.first_day()
+        if since is None:
+            self.stdout.write('no bookings, nothing to backfill')
+            return
+        if since > day:
+            raise CommandError(f'--since {since} is after {day}')
+        days = OccupancySnapshotService.backfill(since, day)
+        self.stdout.write(self.style.SUCCESS(f'snapshots written for {days} days, {since} to {day}'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.services.payment_daily import PaymentDailyService
+from dormitory.models import PaymentDaily
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily payment totals from the payment table or check them for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='only report days whose totals drifted')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            actual = PaymentDailyService.compute()
+            stored = {row.date: (row.amount, row.count) for row in PaymentDaily.objects.all()}
+            drift = 0
+            for day in sorted(actual.keys() | stored.keys()):
+                if actual.get(day) != stored.get(day):
+                    drift += 1
+                    self.stdout.write(f'{day}: stored {stored.get(day)}, actual {actual.get(day)}')
+            if drift:
+                raise CommandError(f'{drift} days drifted, run payment_daily to repair')
+            self.stdout.write(self.style.SUCCESS('daily payment totals are consistent'))
+            return
+
+        days = PaymentDailyService.recompute()
+        self.stdout.write(self.style.SUCCESS(f'payment totals rebuilt for {len(days)} days'))
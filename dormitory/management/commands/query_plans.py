@@ -0,0 +1,110 @@
+import datetime
+import json
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from accounts.services.account_service import PaymentService
+from dormitory.filters import StudentFilter, BookFilter, GroupFilter
+from dormitory.models import Room, Booking, Student, Payment, Group
+from dormitory.services.availability import AvailabilityIndex
+from dormitory.services.booking_list import BookingListService
+from dormitory.services.student_search import StudentSearchIndex
+
+# tables that grow with usage, a full scan of any of them is a regression
+LARGE_TABLES = ('room', 'booking', 'student', 'payment', 'group')
+# prefix searches: sqlite's LIKE is case-insensitive and never uses an index, they are only checked on mysql
+PREFIX_QUERIES = ('student search', 'find_student', 'payment pay_list full_name', 'group list')
+
+
+def endpoint_queries():
+    # the queries the endpoints run, built by the same helpers the views call
+    today = datetime.date(2024, 1, 15)
+    bookings = Booking.objects.select_related('room__building', 'student__country', 'student__group', 'user')
+    return {
+        # free-place list, contract free_room and floor counts are served from the rooms the index loads
+        'availability load_buildings': AvailabilityIndex.room_rows([1, 2]),
+        'room list': Room.objects.filter(user_id=1).order_by('-id')[:20],
+        'booking list': BookingListService.values(
+            BookFilter({'building': 1, 'room': '2'}, queryset=bookings.order_by('created_at')).qs, today)[:20],
+        'booking room_place': Booking.objects.filter(room_id=1, status=1),
+        'contract list': BookingListService.values(
+            BookFilter({}, queryset=Booking.objects.filter(user_id=1).order_by('-created_at')).qs)[:20],
+        'student search': StudentFilter({'search': 'ab'}, queryset=Student.objects.all()).qs.order_by('-id')[:20],
+        'find_student': StudentSearchIndex.database_query('ab')[:4],
+        'payment pay_list': PaymentService.pay_list(today, today + datetime.timedelta(days=30))
+        .order_by('-payed_date')[:20],
+        'payment pay_list full_name': PaymentService.pay_list(today, today + datetime.timedelta(days=30), 'ab')
+        .order_by('-payed_date')[:20],
+        'payment list': Payment.objects.filter(booking=1),
+        'group list': GroupFilter({'name': 'ab'}, queryset=Group.objects.select_related('faculty')).qs,
+    }
+
+
+def mysql_tables(node):
+    # every table access of a JSON plan, wherever it is nested
+    if isinstance(node, dict):
+        if 'table_name' in node and 'access_type' in node:
+            yield node
+        for value in node.values():
+            yield from mysql_tables(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from mysql_tables(value)
+
+
+def full_scans(plan, usable_index=False):
+    # usable_index: only report scans with no index to choose from. On small tables (the test database) the
+    # optimizer prefers a scan even where an index exists, the plan then still lists it in possible_keys
+    if connection.vendor == 'mysql':
+        return [table['table_name'] for table in mysql_tables(json.loads(plan))
+                if table['access_type'] == 'ALL' and not (usable_index and table.get('possible_keys'))]
+    return sqlite_scans(plan)
+
+
+def sqlite_scans(plan):
+    # "SCAN student" (or "SCAN TABLE student" on older sqlite) reads the whole table,
+    # "SCAN student USING [COVERING] INDEX x" walks an index
+    tables = []
+    for line in plan.splitlines():
+        match = re.search(r'\bSCAN (?:TABLE )?(\w+)(.*)$', line)
+        if match and 'USING' not in match.group(2):
+            tables.append(match.group(1))
+    return tables
+
+
+def query_scans(usable_index=False):
+    # {query name: large tables it scans} for every endpoint query that can be checked on this backend
+    scans = {}
+    for name, query in endpoint_queries().items():
+        if connection.vendor != 'mysql' and name in PREFIX_QUERIES:
+            continue
+        plan = query.explain(format='JSON') if connection.vendor == 'mysql' else query.explain()
+        scans[name] = [table for table in full_scans(plan, usable_index) if table in LARGE_TABLES]
+    return scans
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot endpoint queries and fail when one of them scans a large table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='print every plan')
+
+    def handle(self, *args, **options):
+        if options['verbose_plans']:
+            for name, query in endpoint_queries().items():
+                plan = query.explain(format='JSON') if connection.vendor == 'mysql' else query.explain()
+                self.stdout.write(f'{name}\n{plan}\n')
+        failures = []
+        scans = query_scans()
+        for name, tables in scans.items():
+            if tables:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'{name}: full scan of {", ".join(tables)}'))
+            else:
+                self.stdout.write(f'{name}: ok')
+        for name in [name for name in endpoint_queries() if name not in scans]:
+            self.stdout.write(f'{name}: not checked on {connection.vendor}')
+        if failures:
+            raise CommandError(f'{len(failures)} queries do a full table scan')
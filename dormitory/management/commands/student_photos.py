@@ -0,0 +1,48 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from dormitory.models import Student
+from dormitory.services.photos import PhotoService
+from dormitory.utils.photos import render_photo
+
+
+def render(name):
+    # runs in a worker process, errors are sent back instead of stopping the pool
+    try:
+        return render_photo(name), None
+    except Exception as error:
+        return None, f'{type(error).__name__}: {error}'
+
+
+class Command(BaseCommand):
+    help = 'Make the normalized copies and thumbnails of pending student photos in parallel processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count())
+        parser.add_argument('--failed', action='store_true', help='retry photos that failed before')
+        parser.add_argument('--all', action='store_true', help='process every photo again, e.g. after new sizes')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            Student.objects.exclude(photo='').exclude(photo=None).update(photo_status='pending')
+        statuses = ('pending', 'failed') if options['failed'] else ('pending',)
+        students = PhotoService.pending(statuses)
+        if not students:
+            self.stdout.write('no photos to process')
+            return
+
+        # the processes only touch image files, the database is written from this process
+        connections.close_all()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['processes']) as executor:
+            results = executor.map(render, [name for _, name in students], chunksize=8)
+            for (student_id, name), (photos, error) in zip(students, results):
+                if error is not None:
+                    self.stdout.write(f'student {student_id} {name}: {error}')
+                    failed += 1
+                if PhotoService.store(student_id, name, photos):
+                    done += 1
+        self.stdout.write(self.style.SUCCESS(f'{done} photos processed, {failed} failed'))
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.2 on 2026-10-18 14:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    Building = apps.get_model('dormitory', 'Building')
+    BuildingStats = apps.get_model('dormitory', 'BuildingStats')
+    Room = apps.get_model('dormitory', 'Room')
+    Booking = apps.get_model('dormitory', 'Booking')
+
+    stats = {building_id: BuildingStats(building_id=building_id)
+             for building_id in Building.objects.values_list('id', flat=True)}
+    rooms = Room.objects.values('building_id').annotate(
+        total=models.Count('id'), busy=models.Count('id', filter=models.Q(is_full=True)))
+    for row in rooms:
+        stats[row['building_id']].rooms = row['total']
+        stats[row['building_id']].busy_rooms = row['busy']
+    books = Booking.objects.filter(status_id=1).values('room__building_id').annotate(
+        men=models.Count('id', filter=models.Q(student__gender='1')),
+        women=models.Count('id', filter=models.Q(student__gender='0')),
+        students=models.Count('student_id', distinct=True),
+    )
+    for row in books:
+        item = stats[row['room__building_id']]
+        item.men, item.women, item.students = row['men'], row['women'], row['students']
+    BuildingStats.objects.bulk_create(stats.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dormitory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildingStats',
+            fields=[
+                ('building', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='dormitory.building')),
+                ('rooms', models.IntegerField(default=0)),
+                ('busy_rooms', models.IntegerField(default=0)),
+                ('men', models.IntegerField(default=0)),
+                ('women', models.IntegerField(default=0)),
+                ('students', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'building_stats',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
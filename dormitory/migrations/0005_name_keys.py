@@ -0,0 +1,95 @@
+# Generated by Django 4.2.2 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+def normalize_name(value):
+    return ' '.join(str(value or '').split()).casefold()
+
+
+def fill_name_keys(apps, schema_editor):
+    # existing duplicates keep a NULL key: the oldest row owns the name, the rest are left for manual cleanup
+    for model_name, scope in (('Building', None), ('Company', None), ('Country', None), ('Faculty', None),
+                              ('Privilege', None), ('Group', 'faculty_id')):
+        model = apps.get_model('dormitory', model_name)
+        seen = set()
+        rows = []
+        for row in model.objects.order_by('id'):
+            key = normalize_name(row.name) or None
+            identity = (getattr(row, scope) if scope else None, key)
+            if key is not None and identity not in seen:
+                seen.add(identity)
+                row.name_key = key
+                rows.append(row)
+        model.objects.bulk_update(rows, ['name_key'], batch_size=500)
+
+    Student = apps.get_model('dormitory', 'Student')
+    seen = set()
+    rows = []
+    for row in Student.objects.order_by('id').only('id', 'name', 'last_name').iterator(chunk_size=2000):
+        row.last_name_key = normalize_name(row.last_name)
+        identity = (normalize_name(row.name), row.last_name_key)
+        if identity not in seen:
+            seen.add(identity)
+            row.name_key = identity[0]
+        rows.append(row)
+    Student.objects.bulk_update(rows, ['name_key', 'last_name_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dormitory', '0004_export_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='building',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=25, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=40, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=40, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='faculty',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=40, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='privilege',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=100, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='last_name_key',
+            field=models.CharField(editable=False, max_length=30, null=True),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=30, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='group',
+            constraint=models.UniqueConstraint(fields=('faculty', 'name_key'), name='group_faculty_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='student',
+            constraint=models.UniqueConstraint(fields=('name_key', 'last_name_key'), name='student_identity_uniq'),
+        ),
+        migrations.RunPython(fill_name_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.2 on 2026-10-18 14:58
+
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def fill_payment_daily(apps, schema_editor):
+    Payment = apps.get_model('dormitory', 'Payment')
+    PaymentDaily = apps.get_model('dormitory', 'PaymentDaily')
+    rows = Payment.objects.filter(payed_date__isnull=False).annotate(day=TruncDate('payed_date')).values('day') \
+        .annotate(total=models.Sum('amount'), number=models.Count('id')).order_by('day')
+    PaymentDaily.objects.bulk_create(
+        [PaymentDaily(date=row['day'], amount=row['total'], count=row['number']) for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dormitory', '0005_name_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentDaily',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'payment_daily',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['last_name_key'], name='student_last_name_key_idx'),
+        ),
+        migrations.RunPython(fill_payment_daily, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:03
+
+from django.db import migrations, models
+
+
+def fill_debt(apps, schema_editor):
+    Booking = apps.get_model('dormitory', 'Booking')
+    Payment = apps.get_model('dormitory', 'Payment')
+    last_payed = Payment.objects.filter(booking_id=models.OuterRef('pk'), payed_date__isnull=False) \
+        .order_by('-payed_date').values('payed_date')[:1]
+    Booking.objects.update(debt=models.F('total_price') - models.F('payed'), last_payed=models.Subquery(last_payed))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dormitory', '0006_payment_daily'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='debt',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='last_payed',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['debt', 'last_payed'], name='booking_debt_idx'),
+        ),
+        migrations.RunPython(fill_debt, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+DIMENSIONS = {
+    'group': 'group_id',
+    'faculty': 'group__faculty_id',
+    'country': 'country_id',
+    'company': 'company_id',
+}
+
+
+def fill_stats(apps, schema_editor):
+    Student = apps.get_model('dormitory', 'Student')
+    Booking = apps.get_model('dormitory', 'Booking')
+    DimensionStats = apps.get_model('dormitory', 'DimensionStats')
+    rows = {}
+    for dimension, field in DIMENSIONS.items():
+        students = Student.objects.exclude(**{field: None}).order_by().values_list(field) \
+            .annotate(total=models.Count('id'))
+        for key, total in students:
+            rows[dimension, key] = DimensionStats(dimension=dimension, key=key, students=total)
+        books = Booking.objects.filter(status_id=1).exclude(**{f'student__{field}': None}).order_by() \
+            .values_list(f'student__{field}').annotate(total=models.Count('id'))
+        for key, total in books:
+            rows.setdefault((dimension, key), DimensionStats(dimension=dimension, key=key)).bookings = total
+    DimensionStats.objects.bulk_create(rows.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dormitory', '0007_booking_debt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DimensionStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('group', 'group'), ('faculty', 'faculty'), ('country', 'country'), ('company', 'company')], max_length=10)),
+                ('key', models.IntegerField()),
+                ('students', models.IntegerField(default=0)),
+                ('bookings', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'dimension_stats',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dimensionstats',
+            constraint=models.UniqueConstraint(fields=('dimension', 'key'), name='dimension_stats_key_uniq'),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
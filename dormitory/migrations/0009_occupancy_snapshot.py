@@ -0,0 +1,35 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dormitory', '0008_dimension_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancySnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('floor', models.PositiveSmallIntegerField()),
+                ('beds', models.IntegerField(default=0)),
+                ('busy', models.IntegerField(default=0)),
+                ('men', models.IntegerField(default=0)),
+                ('women', models.IntegerField(default=0)),
+                ('building', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dormitory.building')),
+            ],
+            options={
+                'db_table': 'occupancy_snapshot',
+                'indexes': [models.Index(fields=['building', 'date'], name='occupancy_building_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='occupancysnapshot',
+            constraint=models.UniqueConstraint(fields=('date', 'building', 'floor'), name='occupancy_snapshot_day_uniq'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:14
+
+from django.db import migrations, models
+import dormitory.utils.main_util
+
+
+def mark_pending(apps, schema_editor):
+    # existing photos get their copies from 'manage.py student_photos'
+    Student = apps.get_model('dormitory', 'Student')
+    Student.objects.exclude(photo='').exclude(photo=None).update(photo_status='pending')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dormitory', '0009_occupancy_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='photo_status',
+            field=models.CharField(blank=True, choices=[('pending', 'pending'), ('ready', 'ready'), ('failed', 'failed')], editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='photo_thumbs',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, upload_to=dormitory.utils.main_util.upload_photo),
+        ),
+        migrations.RunPython(mark_pending, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:48
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dormitory', '0011_export_job_started_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='room',
+            name='room_user_floor_idx',
+        ),
+    ]
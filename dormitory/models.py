@@ -1,3 +1,4 @@
+import uuid
 from datetime import date
 
 from django.contrib.auth.base_user import BaseUserManager
@@ -5,13 +6,40 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
-from imagekit.models import ProcessedImageField
 
 from .utils import main_util
 # Create your models here.
 from ant_back import settings
 
 
+class LegacyKeyMixin:
+    # rows that were duplicates before the unique name keys existed were left with a NULL name_key;
+    # they keep it as long as their names are not edited, so unrelated edits do not hit the unique index
+    name_fields = ('name',)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_names = tuple(instance.__dict__.get(field) for field in cls.name_fields)
+        return instance
+
+    def legacy_duplicate(self):
+        return (self.name_key is None and not self._state.adding
+                and getattr(self, 'loaded_names', None) == tuple(getattr(self, field) for field in self.name_fields))
+
+
+class NameKeyMixin(LegacyKeyMixin):
+    # name_key backs the unique index used for duplicate checks, empty names get no key
+
+    def save(self, *args, **kwargs):
+        if not self.legacy_duplicate():
+            self.name_key = main_util.normalize_name(self.name) or None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_key'}
+        super().save(*args, **kwargs)
+
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -78,9 +106,10 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         super().save(*args, **kwargs)
 
 
-class Company(models.Model):
+class Company(NameKeyMixin, models.Model):
     id = models.SmallAutoField(primary_key=True)
     name = models.CharField(max_length=40)
+    name_key = models.CharField(max_length=40, unique=True, null=True, editable=False)
     phone = models.CharField(max_length=15, blank=True)
     director = models.CharField(max_length=40, blank=True)
     description = models.TextField(blank=True)
@@ -89,9 +118,10 @@ class Company(models.Model):
         db_table = 'company'
 
 
-class Country(models.Model):
+class Country(NameKeyMixin, models.Model):
     id = models.SmallAutoField(primary_key=True)
     name = models.CharField(max_length=40)
+    name_key = models.CharField(max_length=40, unique=True, null=True, editable=False)
 
     class Meta:
         db_table = 'country'
@@ -114,9 +144,10 @@ class Principal(models.Model):
         db_table = 'principal'
 
 
-class Faculty(models.Model):
+class Faculty(NameKeyMixin, models.Model):
     id = models.SmallAutoField(primary_key=True)
     name = models.CharField(max_length=40)
+    name_key = models.CharField(max_length=40, unique=True, null=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -125,9 +156,10 @@ class Faculty(models.Model):
         db_table = 'faculty'
 
 
-class Group(models.Model):
+class Group(NameKeyMixin, models.Model):
     id = models.SmallAutoField(primary_key=True)
     name = models.CharField(max_length=40)
+    name_key = models.CharField(max_length=40, null=True, editable=False)
     faculty = models.ForeignKey(Faculty, on_delete=models.PROTECT)
 
     def __str__(self):
@@ -135,11 +167,18 @@ class Group(models.Model):
 
     class Meta:
         db_table = 'group'
+        indexes = [
+            models.Index(fields=['name'], name='group_name_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['faculty', 'name_key'], name='group_faculty_name_uniq'),
+        ]
 
 
-class Building(models.Model):
+class Building(NameKeyMixin, models.Model):
     id = models.SmallAutoField(primary_key=True)
     name = models.CharField(max_length=25, blank=True)
+    name_key = models.CharField(max_length=25, unique=True, null=True, editable=False)
     address = models.CharField(max_length=100, blank=True)
     floor_count = models.SmallIntegerField(default=5)
     description = models.TextField(blank=True)
@@ -151,6 +190,58 @@ class Building(models.Model):
         db_table = 'building'
 
 
+class BuildingStats(models.Model):
+    building = models.OneToOneField(Building, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    rooms = models.IntegerField(default=0)
+    busy_rooms = models.IntegerField(default=0)
+    men = models.IntegerField(default=0)
+    women = models.IntegerField(default=0)
+    students = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'building_stats'
+
+
+class DimensionStats(models.Model):
+    # student and active booking counters per group, faculty, country and company; key is the id in that table
+    DIMENSION = [
+        ('group', 'group'),
+        ('faculty', 'faculty'),
+        ('country', 'country'),
+        ('company', 'company'),
+    ]
+    dimension = models.CharField(max_length=10, choices=DIMENSION)
+    key = models.IntegerField()
+    students = models.IntegerField(default=0)
+    bookings = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'dimension_stats'
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='dimension_stats_key_uniq'),
+        ]
+
+
+class OccupancySnapshot(models.Model):
+    # beds and residents of one floor at the end of a day, written by the occupancy_snapshot command
+    date = models.DateField()
+    building = models.ForeignKey(Building, on_delete=models.CASCADE)
+    floor = models.PositiveSmallIntegerField()
+    beds = models.IntegerField(default=0)
+    busy = models.IntegerField(default=0)
+    men = models.IntegerField(default=0)
+    women = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'occupancy_snapshot'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'building', 'floor'], name='occupancy_snapshot_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['building', 'date'], name='occupancy_building_date_idx'),
+        ]
+
+
 class StudentType(models.Model):
     TYPE = [
         ('foreigner', 'иностранец'),
@@ -217,9 +308,13 @@ class Room(models.Model):
 
     class Meta:
         db_table = 'room'
+        indexes = [
+            models.Index(fields=['building', 'floor', 'is_full', 'number'], name='room_building_floor_idx'),
+        ]
 
 
-class Student(models.Model):
+class Student(LegacyKeyMixin, models.Model):
+    name_fields = ('name', 'last_name')
     GENDER_CHOICE = (
         ('0', 'женшина'),
         ('1', 'мужчина'),
@@ -228,13 +323,23 @@ class Student(models.Model):
     name = models.CharField(max_length=30)
     last_name = models.CharField(max_length=30, blank=True)
     sure_name = models.CharField(max_length=30, blank=True)
+    name_key = models.CharField(max_length=30, null=True, editable=False)
+    last_name_key = models.CharField(max_length=30, null=True, editable=False)
 
     phone = models.CharField(max_length=15, blank=True)
     born = models.DateField()
     course = models.CharField(max_length=1, default=1)
     address = models.CharField(max_length=100, blank=True)
     gender = models.CharField(max_length=1, choices=GENDER_CHOICE)
-    photo = ProcessedImageField(upload_to=main_util.upload_photo, blank=True, null=True)
+    PHOTO_STATUS = [
+        ('pending', 'pending'),
+        ('ready', 'ready'),
+        ('failed', 'failed'),
+    ]
+    # the upload is kept as is, photo_thumbs holds the storage names of the copies made by PhotoService
+    photo = models.ImageField(upload_to=main_util.upload_photo, blank=True, null=True)
+    photo_status = models.CharField(max_length=10, choices=PHOTO_STATUS, blank=True, editable=False)
+    photo_thumbs = models.JSONField(default=dict, blank=True, editable=False)
     country = models.ForeignKey(Country, on_delete=models.PROTECT)
     nationality = models.CharField(max_length=20, blank=True)
     student_type = models.ForeignKey(StudentType, on_delete=models.PROTECT)
@@ -246,13 +351,32 @@ class Student(models.Model):
     def __str__(self):
         return f'{self.name} {self.last_name}'
 
+    def save(self, *args, **kwargs):
+        # name_key + last_name_key is the student identity, one row per person
+        if not self.legacy_duplicate():
+            self.name_key = main_util.normalize_name(self.name)
+        self.last_name_key = main_util.normalize_name(self.last_name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'name', 'last_name'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'name_key', 'last_name_key'}
+        super().save(*args, **kwargs)
+
     class Meta:
         db_table = 'student'
+        indexes = [
+            models.Index(fields=['name'], name='student_name_idx'),
+            models.Index(fields=['last_name'], name='student_last_name_idx'),
+            models.Index(fields=['last_name_key'], name='student_last_name_key_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['name_key', 'last_name_key'], name='student_identity_uniq'),
+        ]
 
 
-class Privilege(models.Model):
+class Privilege(NameKeyMixin, models.Model):
     id = models.SmallAutoField(primary_key=True)
     name = models.CharField(max_length=100)
+    name_key = models.CharField(max_length=100, unique=True, null=True, editable=False)
     # commandant = models.ForeignKey(Commandant, on_delete=models.CASCADE, blank=True, null=True)
     description = models.CharField(max_length=125, blank=True)
 
@@ -275,12 +399,29 @@ class Booking(models.Model):
     privilege = models.ForeignKey(Privilege, on_delete=models.PROTECT, blank=True, null=True)
     total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     payed = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # total_price - payed, kept in sync by save() and by every bulk UPDATE of either column
+    debt = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    last_payed = models.DateTimeField(null=True, blank=True, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
     status = models.ForeignKey(BookingStatus, on_delete=models.PROTECT, default=1)
     created_at = models.DateTimeField(auto_now_add=True, blank=True)
 
+    def save(self, *args, **kwargs):
+        self.debt = self.total_price - self.payed
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'total_price', 'payed'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'debt'}
+        super().save(*args, **kwargs)
+
     class Meta:
         db_table = 'booking'
+        indexes = [
+            models.Index(fields=['status', 'room'], name='booking_status_room_idx'),
+            models.Index(fields=['student', 'status'], name='booking_student_status_idx'),
+            models.Index(fields=['user', 'created_at'], name='booking_user_created_idx'),
+            models.Index(fields=['created_at'], name='booking_created_idx'),
+            models.Index(fields=['debt', 'last_payed'], name='booking_debt_idx'),
+        ]
 
 
 class Payment(models.Model):
@@ -294,6 +435,42 @@ class Payment(models.Model):
 
     class Meta:
         db_table = 'payment'
+        indexes = [
+            models.Index(fields=['payed_date'], name='payment_payed_date_idx'),
+        ]
+
+
+class PaymentDaily(models.Model):
+    # per-day totals of Payment.amount, kept up to date by PaymentService
+    date = models.DateField(primary_key=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'payment_daily'
+
+
+class ExportJob(models.Model):
+    STATUS = (
+        ('pending', 'pending'),
+        ('running', 'running'),
+        ('done', 'done'),
+        ('failed', 'failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=40)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS, default='pending')
+    file = models.FileField(upload_to=main_util.upload_export, blank=True)
+    error = models.TextField(blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'export_job'
 
 
 class TestBooking(models.Model):
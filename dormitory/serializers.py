@@ -3,39 +3,50 @@ from rest_framework import serializers, status
 from rest_framework.serializers import ModelSerializer, Serializer
 from rest_framework.exceptions import APIException, ValidationError
 from .models import (Country, Faculty, Building,
-                     RoomType, Student, Room, Privilege, Booking, CustomUser, Company, Group, StudentType)
+                     RoomType, Student, Room, Privilege, Booking, CustomUser, Company, Group, StudentType,
+                     ExportJob)
 
 from .validators import (validate_building, validate_room, validate_faculty, common_validate, validate_city_country,
-                         validate_register)
+                         validate_register, name_taken, student_taken, taken_students, student_key)
 from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework.exceptions import AuthenticationFailed
 from datetime import date
+from .services.reference_cache import ReferenceCache
+from .services.photos import PhotoService
+from .authentication import user_claims
+from .exceptions import duplicate_names_as
+
+
+class UniqueNameMixin:
+    # saves under a savepoint, a row that won the race for the same name key since validate() becomes a 400
+    duplicate_error = {'error': 'Такая запись уже существует'}
+
+    def create(self, validated_data):
+        with duplicate_names_as(self.duplicate_error):
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with duplicate_names_as(self.duplicate_error):
+            return super().update(instance, validated_data)
 
 
 class CustomTokenRefreshSerializer(TokenRefreshSerializer):
     def validate(self, attrs):
-        # validated_data = super().validate(attrs)
         try:
-            validated_data = super().validate(attrs)
+            refresh = self.token_class(attrs['refresh'])
         except Exception as e:
             raise AuthenticationFailed({'error': 'refresh_expired', 'status': '401'})
-        # except TokenError as e:
-        #     raise AuthenticationFailed({'error': 'refresh_expired', 'status': '401'})
-
-        # Add custom logic here if needed
-        user = self.context['request'].user  # Get the current user from the request
-
-        # For example, you can check if the user is active
-        # if not user.is_active:
-        #     raise serializers.ValidationError("User is not active.")
-
-        # You can also check for other conditions, such as user roles or permissions
-        # if not user.has_permission('some_permission'):
-        #     raise serializers.ValidationError("User does not have the required permission.")
 
-        # If all custom checks pass, return the validated data
-        return validated_data
+        # claims are re-read on every refresh, so a role change or deactivation applies within one access lifetime
+        user = CustomUser.objects.filter(pk=refresh[api_settings.USER_ID_CLAIM], is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed({'error': 'refresh_expired', 'status': '401'})
+        access = refresh.access_token
+        for claim, value in user_claims(user).items():
+            access[claim] = value
+        return {'access': str(access)}
 
 
 class CustomUserSerializer(serializers.Serializer):
@@ -114,51 +125,50 @@ class UserSerializer(ModelSerializer):
         return user
 
 
-class CountrySerializer(ModelSerializer):
+class CountrySerializer(UniqueNameMixin, ModelSerializer):
     class Meta:
         model = Country
         fields = ('id', 'name')
 
     def validate(self, data):
-        errors = validate_city_country(data, Country)
+        errors = validate_city_country(data, Country, self.instance)
         if errors:
             raise APIException({'error': errors[0]})
         return data
 
 
-class FacultySerializer(ModelSerializer):
+class FacultySerializer(UniqueNameMixin, ModelSerializer):
     class Meta:
         model = Faculty
         fields = ('id', 'name')
 
     def validate(self, data):
-        errors = validate_faculty(data)
+        errors = validate_faculty(data, self.instance)
         if errors:
             raise APIException({'error': errors[0]})
         return data
 
 
-class FacultyEditSerializer(ModelSerializer):
+class FacultyEditSerializer(UniqueNameMixin, ModelSerializer):
     class Meta:
         model = Faculty
         fields = ('id', 'name')
 
     def validate(self, data):
-        faculty = Faculty.objects.filter(name=data['name'])
-        is_exist = faculty[0].name == data['name']
-        if is_exist:
+        if 'name' in data and name_taken(Faculty, data['name'], self.instance):
             raise APIException({'error': 'this faculty exists'})
         return data
 
 
-class GroupSerializer(serializers.ModelSerializer):
+class GroupSerializer(UniqueNameMixin, serializers.ModelSerializer):
     class Meta:
         model = Group
-        fields = '__all__'
+        exclude = ('name_key',)
 
     def validate(self, data):
-        group = Group.objects.filter(name=data['name'], faculty=data['faculty'])
-        if group:
+        faculty = data.get('faculty', getattr(self.instance, 'faculty', None))
+        name = data.get('name', getattr(self.instance, 'name', None))
+        if name is not None and name_taken(Group, name, self.instance, faculty=faculty):
             raise APIException({'error': 'this group exists'})
         return data
 
@@ -169,13 +179,13 @@ class GroupSerializer(serializers.ModelSerializer):
         return response
 
 
-class CompanySerializer(serializers.ModelSerializer):
+class CompanySerializer(UniqueNameMixin, serializers.ModelSerializer):
     class Meta:
         model = Company
-        fields = '__all__'
+        exclude = ('name_key',)
 
     def validate(self, data):
-        return common_validate(Company, data, 'company')
+        return common_validate(Company, data, 'company', self.instance)
         # company = Company.objects.filter(name__iexact=data['name'])
         # if company:
         #     raise APIException({'company': f'{data["name"]} уже добавлено'})
@@ -226,13 +236,13 @@ class OnlyCompanySerializer(Serializer):
     name = serializers.CharField()
 
 
-class BuildingSerializer(ModelSerializer):
+class BuildingSerializer(UniqueNameMixin, ModelSerializer):
     class Meta:
         model = Building
         fields = ('id', 'name', 'address', 'floor_count', 'description')
 
     def validate(self, data):
-        errors = validate_building(data)
+        errors = validate_building(data, self.instance)
         if errors:
             raise APIException({'error': errors[0]})
         return data
@@ -242,17 +252,15 @@ class BuildingSerializer(ModelSerializer):
     #     return response
 
 
-class BuildingEditSerializer(ModelSerializer):
+class BuildingEditSerializer(UniqueNameMixin, ModelSerializer):
     class Meta:
         model = Building
         fields = ('id', 'name', 'address', 'floor_count', 'description')
 
     def validate(self, data):
         name = data.get('name')
-        if name is not None:
-            building = Building.objects.filter(name__icontains=name)
-            if building:
-                raise APIException({'building': f'{name} уже добавлено'})
+        if name is not None and name_taken(Building, name, self.instance):
+            raise APIException({'building': f'{name} уже добавлено'})
         return data
 
     # def to_representation(self, instance):
@@ -352,70 +360,109 @@ class StudentTypeSerializer(ModelSerializer):
         fields = '__all__'
 
 
-class StudentSerializer(ModelSerializer):
+def student_lookups():
+    # country, group, company and student type representations by id, rebuilt when a reference table changes
+    lookups = ReferenceCache.get('student_lookups', lambda: {
+        'country': CountrySerializer(Country.objects.all(), many=True).data,
+        'group': OnlyGroupSerializer(Group.objects.all(), many=True).data,
+        'company': OnlyCompanySerializer(Company.objects.all(), many=True).data,
+        'student_type': StudentTypeSerializer(StudentType.objects.all(), many=True).data,
+    })['data']
+    return {name: {item['id']: item for item in items} for name, items in lookups.items()}
+
+
+class StudentLookupMixin:
+    # list and edit responses resolve the related tables from student_lookups() instead of a query per row
+
+    def lookup(self, name, pk, serializer_class, instance):
+        if 'lookups' not in self.context:
+            self.context['lookups'] = student_lookups()
+        item = self.context['lookups'][name].get(pk)
+        if item is None:
+            # created after the lookups were cached
+            item = serializer_class(getattr(instance, name)).data
+        return item
+
+    def to_representation(self, instance):
+        response = super().to_representation(instance)
+        response['country'] = self.lookup('country', instance.country_id, CountrySerializer, instance)
+        response['group'] = self.lookup('group', instance.group_id, OnlyGroupSerializer, instance)
+        if instance.company_id is not None:
+            response['company'] = self.lookup('company', instance.company_id, OnlyCompanySerializer, instance)
+        else:
+            response['company'] = None
+        response['student_type'] = self.lookup('student_type', instance.student_type_id, StudentTypeSerializer,
+                                               instance)
+        return response
+
+    def get_photos(self, instance):
+        return PhotoService.urls(instance.photo_thumbs)
+
+
+class StudentListSerializer(serializers.ListSerializer):
+
+    def validate(self, attrs):
+        taken = taken_students(attrs)
+        errors = [{'row': index, 'errors': {'student': 'this student uje v baze'}}
+                  for index, row in enumerate(attrs) if student_key(row) in taken]
+        if errors:
+            raise ValidationError({'errors': errors})
+        return attrs
+
+    def create(self, validated_data):
+        with duplicate_names_as({'errors': 'this student uje v baze'}):
+            return super().create(validated_data)
+
+
+class StudentSerializer(UniqueNameMixin, StudentLookupMixin, ModelSerializer):
+    duplicate_error = {'student': ['this student uje v baze']}
+
     user = serializers.CharField(read_only=True)
     created_at = serializers.DateTimeField(format='%Y-%m-%d %H:%M', read_only=True)
+    photo = serializers.ImageField(write_only=True, required=False, allow_null=True)
+    photos = serializers.SerializerMethodField(method_name='get_photos')
 
     class Meta:
         model = Student
         fields = ('id', 'name', 'last_name', 'sure_name', 'country', 'phone', 'born', 'address',
-                  'gender', 'company', 'student_type', 'group', 'course', 'user', 'created_at')
+                  'gender', 'company', 'student_type', 'group', 'course', 'user', 'created_at',
+                  'photo', 'photo_status', 'photos')
+        list_serializer_class = StudentListSerializer
 
     def validate(self, data):
         errors = []
-        student = Student.objects.filter(name__iexact=data['name'], last_name__iexact=data['last_name'])
-        if student:
+        # inside StudentListSerializer the whole batch is checked at once
+        if not isinstance(self.parent, serializers.ListSerializer) and student_taken(data):
             errors.append({'student': 'this student uje v baze'})
 
         if errors:
             raise APIException({'student': errors})
         return data
 
-    def to_representation(self, instance):
-        response = super().to_representation(instance)
-        response['country'] = CountrySerializer(instance.country).data
-        response['group'] = OnlyGroupSerializer(instance.group).data
-        if response['company'] is not None:
-            response['company'] = OnlyCompanySerializer(instance.company).data
-        else:
-            response['company'] = None
-        response['student_type'] = StudentTypeSerializer(instance.student_type).data
-
-        return response
 
+class StudentEditSerializer(UniqueNameMixin, StudentLookupMixin, ModelSerializer):
+    duplicate_error = {'student': ['this student uje v baze']}
 
-class StudentEditSerializer(ModelSerializer):
     user = serializers.CharField(read_only=True)
     created_at = serializers.DateTimeField(format='%Y-%m-%d %H:%M', read_only=True)
+    photo = serializers.ImageField(write_only=True, required=False, allow_null=True)
+    photos = serializers.SerializerMethodField(method_name='get_photos')
 
     class Meta:
         model = Student
         fields = ('id', 'name', 'last_name', 'sure_name', 'country', 'phone', 'born', 'address',
-                  'gender', 'company', 'student_type', 'group', 'course', 'user', 'created_at')
+                  'gender', 'company', 'student_type', 'group', 'course', 'user', 'created_at',
+                  'photo', 'photo_status', 'photos')
 
     def validate(self, data):
         errors = []
-        student = Student.objects.filter(name__iexact=data.get('name'), last_name__iexact=data.get('last_name'))
-        if student:
+        if ('name' in data or 'last_name' in data) and student_taken(data, self.instance):
             errors.append({'student': 'this student uje v baze'})
 
         if errors:
             raise APIException({'student': errors})
         return data
 
-    def to_representation(self, instance):
-        response = super().to_representation(instance)
-        response['country'] = CountrySerializer(instance.country).data
-        response['group'] = OnlyGroupSerializer(instance.group).data
-        response['student_type'] = StudentTypeSerializer(instance.student_type).data
-        if response['company'] is not None:
-            response['company'] = OnlyCompanySerializer(instance.company).data
-        else:
-            response['company'] = None
-        # response['company'] = OnlyCompanySerializer(instance.company).data
-
-        return response
-
 
 class BookSerializer(ModelSerializer):
     created_at = serializers.DateTimeField(format="%d.%m.%Y %H:%M", required=False)
@@ -429,8 +476,7 @@ class BookSerializer(ModelSerializer):
                   'payed', 'debt', 'book_date', 'book_end', 'status', 'day_lives', 'created_at')
 
     def get_debt(self, obj):
-        total_debt = obj.total_price - obj.payed
-        return str(total_debt)
+        return str(obj.debt)
 
     def get_day_lives(self, obj):
         today = date.today()
@@ -466,6 +512,52 @@ class BookSerializer(ModelSerializer):
         return response
 
 
+class BookBulkItemSerializer(Serializer):
+    student = serializers.IntegerField()
+    room = serializers.IntegerField()
+    privilege = serializers.IntegerField(required=False, allow_null=True)
+    book_date = serializers.DateField(required=False)
+
+
+class AllocationSerializer(Serializer):
+    students = serializers.ListField(child=serializers.IntegerField(), required=False)
+    gender = serializers.ChoiceField(choices=Student.GENDER_CHOICE, required=False)
+    group = serializers.IntegerField(required=False)
+    faculty = serializers.IntegerField(required=False)
+    country = serializers.IntegerField(required=False)
+    student_type = serializers.IntegerField(required=False)
+    building = serializers.IntegerField(required=False)
+    floor = serializers.IntegerField(required=False)
+    book_date = serializers.DateField(required=False)
+    dry_run = serializers.BooleanField(default=False)
+
+
+class BookCheckoutSerializer(Serializer):
+    book_end = serializers.DateField()
+    building = serializers.IntegerField(required=False)
+    floor = serializers.IntegerField(required=False)
+    group = serializers.IntegerField(required=False)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate(self, data):
+        if not any(key in data for key in ('building', 'floor', 'group', 'ids')):
+            raise ValidationError({'errors': 'Укажите здание, этаж, группу или список контрактов'})
+        if 'floor' in data and 'building' not in data:
+            # a floor number alone matches that floor in every building
+            raise ValidationError({'building': 'Укажите здание этажа'})
+        return data
+
+
+class BookTransferSerializer(Serializer):
+    booking = serializers.IntegerField(required=False)
+    room = serializers.IntegerField()
+
+    def validate(self, data):
+        if isinstance(self.parent, serializers.ListSerializer) and 'booking' not in data:
+            raise ValidationError({'booking': 'Укажите контракт'})
+        return data
+
+
 class FreeBookSerializer(ModelSerializer):
     # created_at = serializers.DateTimeField(format="%d.%m.%Y %H:%M", required=False)
     user = serializers.CharField(read_only=True, required=False)
@@ -491,15 +583,14 @@ class FreeBookSerializer(ModelSerializer):
         return response
 
 
-class PrivilegeSerializer(ModelSerializer):
+class PrivilegeSerializer(UniqueNameMixin, ModelSerializer):
     class Meta:
         model = Privilege
         fields = ('id', 'name', 'description')
 
     def validate(self, data):
         errors = []
-        privilege = Privilege.objects.filter(name__iexact=data['name'])
-        if privilege:
+        if 'name' in data and name_taken(Privilege, data['name'], self.instance):
             errors.append('Это привилегия уже добавлено')
 
         if errors:
@@ -519,8 +610,7 @@ class ContractSerializer(ModelSerializer):
                   'payed', 'debt', 'book_date', 'book_end', 'status', 'day_lives', 'created_at')
 
     def get_debt(self, obj):
-        total_debt = obj.total_price - obj.payed
-        return str(total_debt)
+        return str(obj.debt)
 
     def get_day_lives(self, obj):
         # today = date.today()
@@ -598,3 +688,13 @@ class FreeRoomSerializer(Serializer):
             return 'мужское'
         else:
             return 'пусто'
+
+
+class ExportJobSerializer(ModelSerializer):
+    created_at = serializers.DateTimeField(format="%d.%m.%Y %H:%M", read_only=True)
+    finished_at = serializers.DateTimeField(format="%d.%m.%Y %H:%M", read_only=True)
+
+    class Meta:
+        model = ExportJob
+        fields = ('id', 'kind', 'params', 'status', 'error', 'created_at', 'finished_at')
+        read_only_fields = ('status', 'error')
@@ -0,0 +1,85 @@
+from django.db.models import Exists, OuterRef
+
+from dormitory.models import Student, Booking
+from .availability import AvailabilityIndex
+from .booking import BookingService
+
+STUDENT_FIELDS = ('id', 'gender', 'group_id', 'group__faculty_id', 'country_id', 'student_type_id')
+
+
+def student_order(student):
+    # students of one group (and inside it one country) come one after another
+    return student['group__faculty_id'], student['group_id'], student['country_id'], student['id']
+
+
+def room_order(room):
+    return room['building_id'], room['floor'], room['number'], room['id']
+
+
+def solve(students, rooms):
+    # students: dicts with STUDENT_FIELDS; rooms: dicts with id, building_id, floor, number, free_place,
+    # person_count and room_gender. Returns (assignments, unassigned), the same input always gives the same output.
+    # every gender first fills its partially occupied rooms, then takes empty rooms in building/floor/number order,
+    # so students of one group end up in the same and neighbouring rooms
+    empty = sorted((room for room in rooms if room['free_place'] > 0 and room['person_count'] == 0), key=room_order)
+    partial = {}
+    for room in sorted(rooms, key=room_order):
+        if room['free_place'] > 0 and room['person_count'] > 0:
+            partial.setdefault(room['room_gender'], []).append(room)
+
+    queues = {}
+    for student in sorted(students, key=student_order):
+        queues.setdefault(student['gender'], []).append(student)
+
+    assignments = []
+    unassigned = []
+    empty_position = 0
+    for gender in sorted(queues):
+        queue = queues[gender]
+        position = 0
+        for room in partial.get(gender, []):
+            take = min(room['free_place'], len(queue) - position)
+            assignments.extend({'student': student['id'], 'room': room['id']}
+                               for student in queue[position:position + take])
+            position += take
+        while position < len(queue) and empty_position < len(empty):
+            room = empty[empty_position]
+            empty_position += 1
+            take = min(room['free_place'], len(queue) - position)
+            assignments.extend({'student': student['id'], 'room': room['id']}
+                               for student in queue[position:position + take])
+            position += take
+        unassigned.extend(student['id'] for student in queue[position:])
+    return assignments, sorted(unassigned)
+
+
+class AllocationService:
+
+    @staticmethod
+    def students(student_ids=None, **filters):
+        # students without any booking, same rule as the booking form; filters: gender, group, faculty,
+        # country, student_type
+        lookups = {'gender': 'gender', 'group': 'group_id', 'faculty': 'group__faculty_id',
+                   'country': 'country_id', 'student_type': 'student_type_id'}
+        query = Student.objects.annotate(
+            has_booking=Exists(Booking.objects.filter(student_id=OuterRef('pk')))
+        ).filter(has_booking=False, **{lookups[name]: value for name, value in filters.items() if value is not None})
+        if student_ids is not None:
+            query = query.filter(pk__in=student_ids)
+        return list(query.values(*STUDENT_FIELDS))
+
+    @staticmethod
+    def rooms(building=None, floor=None, user_id=None):
+        return [room for room in AvailabilityIndex.rooms(building, floor, None, user_id) if room['free_place'] > 0]
+
+    @staticmethod
+    def allocate(students, rooms, user, book_date=None, dry_run=False):
+        assignments, unassigned = solve(students, rooms)
+        result = {'assignments': assignments, 'unassigned': unassigned}
+        if dry_run:
+            return result
+        # bulk_add_students locks the students and rooms and re-checks every row, a plan that went stale between
+        # solving and committing comes back as row errors instead of overfilling a room
+        rows = [dict(assignment, book_date=book_date) for assignment in assignments]
+        result.update(BookingService.bulk_add_students(rows, user))
+        return result
@@ -0,0 +1,223 @@
+import time
+from array import array
+from itertools import groupby
+
+from django.core.cache import cache
+from django.db import transaction
+
+from dormitory.models import Room, Building
+
+CACHE_TIMEOUT = 60 * 10
+GENERATION_KEY = 'availability:generation'
+ROOM_FIELDS = ('id', 'number', 'floor', 'room_type__place', 'person_count', 'room_gender', 'user_id', 'building_id')
+
+
+def make_bucket(rows):
+    # rows are sorted by number; columns are stored as compact parallel arrays
+    return {
+        'ids': array('H', (row[0] for row in rows)),
+        'numbers': tuple(row[1] for row in rows),
+        'places': array('H', (row[3] for row in rows)),
+        'counts': array('H', (row[4] for row in rows)),
+        'users': array('L', (row[6] for row in rows)),
+    }
+
+
+def make_floor(rows):
+    rows = sorted(rows, key=lambda row: (row[5], row[1]))
+    return {gender: make_bucket(list(items)) for gender, items in groupby(rows, key=lambda row: row[5])}
+
+
+def counter(key):
+    # seeded from the clock, so a counter that was evicted never goes back to a value used before
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+def bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted in the meantime
+        cache.set(key, time.time_ns(), None)
+
+
+# free beds per building -> floor -> room gender, kept in the cache. Every building entry is keyed by its own
+# version: a write bumps the version after commit instead of patching the entry, so two writers never overwrite
+# each other and a reader that loaded the rooms before the commit stores its copy under a version nobody reads.
+# The cache backend must be shared by all workers (see ant_back/settings/cache.py), otherwise other workers only
+# see a change after CACHE_TIMEOUT.
+class AvailabilityIndex:
+
+    @staticmethod
+    def generation():
+        return counter(GENERATION_KEY)
+
+    @staticmethod
+    def version_key(building_id):
+        return f'availability:building:{building_id}:version'
+
+    @staticmethod
+    def building_keys(building_ids):
+        # {cache key of the current entry: building_id}
+        generation = AvailabilityIndex.generation()
+        version_keys = {AvailabilityIndex.version_key(building_id): building_id for building_id in building_ids}
+        versions = cache.get_many(version_keys)
+        for key in version_keys.keys() - versions.keys():
+            versions[key] = counter(key)
+        return {f'availability:{generation}:building:{version_keys[key]}:{version}': version_keys[key]
+                for key, version in versions.items()}
+
+    @staticmethod
+    def buildings_key(generation):
+        return f'availability:{generation}:buildings'
+
+    @staticmethod
+    def room_rows(building_ids):
+        # grouped by building and floor, read along room_building_floor_idx
+        return Room.objects.filter(building_id__in=building_ids).values_list(*ROOM_FIELDS) \
+            .order_by('building_id', 'floor')
+
+    @staticmethod
+    def load_buildings(building_ids):
+        names = dict(Building.objects.filter(pk__in=building_ids).values_list('id', 'name'))
+        rows = AvailabilityIndex.room_rows(names)
+        entries = {building_id: {'name': name, 'floors': {}} for building_id, name in names.items()}
+        for (building_id, floor), items in groupby(rows, key=lambda row: (row[7], row[2])):
+            entries[building_id]['floors'][floor] = make_floor(list(items))
+        return entries
+
+    @staticmethod
+    def store(keys, entries):
+        cache.set_many({key: entries[building_id] for key, building_id in keys.items() if building_id in entries},
+                       CACHE_TIMEOUT)
+
+    @staticmethod
+    def rebuild():
+        generation = AvailabilityIndex.generation()
+        building_ids = list(Building.objects.order_by('id').values_list('id', flat=True))
+        # the keys (and so the versions) are read before the rooms
+        keys = AvailabilityIndex.building_keys(building_ids)
+        entries = AvailabilityIndex.load_buildings(building_ids)
+        AvailabilityIndex.store(keys, entries)
+        cache.set(AvailabilityIndex.buildings_key(generation), building_ids, CACHE_TIMEOUT)
+        return entries
+
+    @staticmethod
+    def get_buildings(building_ids=None):
+        if building_ids is None:
+            building_ids = cache.get(AvailabilityIndex.buildings_key(AvailabilityIndex.generation()))
+            if building_ids is None:
+                return AvailabilityIndex.rebuild()
+
+        keys = AvailabilityIndex.building_keys(building_ids)
+        found = cache.get_many(keys)
+        entries = {keys[key]: entry for key, entry in found.items()}
+        missing = [building_id for building_id in building_ids if building_id not in entries]
+        if missing:
+            loaded = AvailabilityIndex.load_buildings(missing)
+            AvailabilityIndex.store({key: building_id for key, building_id in keys.items() if building_id in loaded},
+                                    loaded)
+            entries.update(loaded)
+        return {building_id: entries[building_id] for building_id in building_ids if building_id in entries}
+
+    @staticmethod
+    def buildings_changed(building_ids):
+        for building_id in building_ids:
+            bump(AvailabilityIndex.version_key(building_id))
+
+    @staticmethod
+    def refresh_rooms(room_ids):
+        # the next read reloads the buildings of these rooms
+        AvailabilityIndex.buildings_changed(
+            set(Room.objects.filter(pk__in=room_ids).values_list('building_id', flat=True)))
+
+    @staticmethod
+    def rooms_changed(room_ids):
+        room_ids = list(room_ids)
+        transaction.on_commit(lambda: AvailabilityIndex.refresh_rooms(room_ids))
+
+    @staticmethod
+    def bump_generation():
+        bump(GENERATION_KEY)
+
+    @staticmethod
+    def invalidate():
+        transaction.on_commit(AvailabilityIndex.bump_generation)
+
+    @staticmethod
+    def rooms(building=None, floor=None, gender=None, user_id=None):
+        entries = AvailabilityIndex.get_buildings(None if building is None else [building])
+        for building_id in sorted(entries):
+            entry = entries[building_id]
+            floors = entry['floors'] if floor is None else {floor: entry['floors'].get(floor, {})}
+            for floor_number, buckets in floors.items():
+                for room_gender, bucket in buckets.items():
+                    if gender is not None and room_gender != gender:
+                        continue
+                    for i, room_id in enumerate(bucket['ids']):
+                        if user_id is not None and bucket['users'][i] != user_id:
+                            continue
+                        place = bucket['places'][i]
+                        count = bucket['counts'][i]
+                        yield {
+                            'id': room_id,
+                            'number': bucket['numbers'][i],
+                            'building__name': entry['name'],
+                            'building_id': building_id,
+                            'is_full': count >= place,
+                            'floor': floor_number,
+                            'room_type__place': place,
+                            'person_count': count,
+                            'free_place': place - count,
+                            'room_gender': room_gender,
+                        }
+
+    @staticmethod
+    def free_places(building=None, floor=None, gender=None, user_id=None, number=None, is_full=None, place=None):
+        rooms = AvailabilityIndex.rooms(building, floor, gender, user_id)
+        result = [room for room in rooms
+                  if (number is None or room['number'].startswith(number))
+                  and (is_full is None or room['is_full'] == is_full)
+                  and (place is None or room['free_place'] == place)]
+        result.sort(key=lambda room: (room['building_id'], room['number'], room['is_full']))
+        return result
+
+    @staticmethod
+    def first_free(floor, gender=None, user_id=None, building=None, number=None, limit=10, reverse=False):
+        # rooms of the requested gender plus empty rooms, with at least one free bed
+        rooms = [room for room in AvailabilityIndex.rooms(building, floor, None, user_id)
+                 if room['free_place'] > 0
+                 and (gender is None or room['room_gender'] in (gender, '2'))
+                 and (number is None or room['number'].startswith(number))]
+        rooms.sort(key=lambda room: room['number'], reverse=reverse)
+        return rooms[:limit]
+
+    @staticmethod
+    def check():
+        # compare every cached building with the database, returns a list of (building_id, room_id, cached, actual)
+        building_ids = list(Building.objects.order_by('id').values_list('id', flat=True))
+        keys = {building_id: key for key, building_id in AvailabilityIndex.building_keys(building_ids).items()}
+        actual = AvailabilityIndex.load_buildings(building_ids)
+        drift = []
+        for building_id in building_ids:
+            entry = cache.get(keys[building_id])
+            if entry is None:
+                continue
+            cached_rooms = {}
+            for floor, buckets in entry['floors'].items():
+                for gender, bucket in buckets.items():
+                    for i, room_id in enumerate(bucket['ids']):
+                        cached_rooms[room_id] = (floor, gender, bucket['places'][i], bucket['counts'][i])
+            actual_rooms = {}
+            for floor, buckets in actual[building_id]['floors'].items():
+                for gender, bucket in buckets.items():
+                    for i, room_id in enumerate(bucket['ids']):
+                        actual_rooms[room_id] = (floor, gender, bucket['places'][i], bucket['counts'][i])
+            for room_id in cached_rooms.keys() | actual_rooms.keys():
+                if cached_rooms.get(room_id) != actual_rooms.get(room_id):
+                    drift.append((building_id, room_id, cached_rooms.get(room_id), actual_rooms.get(room_id)))
+        return drift
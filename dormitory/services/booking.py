@@ -1,91 +1,165 @@
 import datetime
-from datetime import timedelta
+from django.db import transaction
+from django.db.models import Case, When, Value, F
 from rest_framework.exceptions import ValidationError, APIException
-from dormitory.models import Room, RoomType
+from dormitory.models import Room, RoomType, Student, StudentType, Privilege
 from dormitory.models import Booking
+from .room_service import RoomService
+from .availability import AvailabilityIndex
+from .building_stats import BuildingStatsService
+from .dimension_stats import DimensionStatsService
+from .student_search import StudentSearchIndex
+from .pricing import stay_price, stay_prices
+
+
+END_MONTH_DEFAULT = "2024-6-30"
 
 
 class BookingService:
 
     @staticmethod
-    def add_student(book, user):
-
-        start_month = book['book_date']
-        privilege = book['privilege']
+    def contract_price(month_price, start_month, privilege):
         # end_month = book['book_end']
         # end_month_default = datetime.date(2024, 6, 30)
-        end_month_default = "2024-6-30"
+        if privilege is not None:
+            return 0
 
-        date1 = datetime.datetime.strptime(end_month_default, "%Y-%m-%d")
+        date1 = datetime.datetime.strptime(END_MONTH_DEFAULT, "%Y-%m-%d")
         date2 = datetime.datetime.strptime(str(start_month), "%Y-%m-%d")
+        # date = end_month_default - start_month  # days
+        # diff_month = date.days // 30  # month
+        diff_month = (date1.year - date2.year) * 12 + date1.month - date2.month
+        return month_price * (diff_month + 1)
 
-        if privilege is None:
-            # date = end_month_default - start_month  # days
-            # diff_month = date.days // 30  # month
-            diff_month = (date1.year - date2.year) * 12 + date1.month - date2.month
-            total_price = book['student'].student_type.price * (diff_month + 1)
-        else:
-            total_price = 0
-
-        book_data = Booking(**book, book_end=end_month_default, total_price=total_price, user_id=user)
-        room = Room.objects.get(pk=book['room'].id)
-        if room.person_count != room.room_type.place:
-            room.person_count += 1
-            room.save()
-            book_data.save()
-            if room.person_count == room.room_type.place:
-                room.is_full = 1
-                room.save()
-            if room.room_gender == '2':
-                room.room_gender = book_data.student.gender
-                room.save()
-        else:
-            raise APIException({'room': 'В этой комнате уже нет мест'})
+    @staticmethod
+    @transaction.atomic
+    def add_student(book, user):
+        total_price = BookingService.contract_price(book['student'].student_type.price, book['book_date'],
+                                                    book['privilege'])
+
+        student = book['student']
+        # serialize concurrent requests for the same student, then re-check under the lock
+        Student.objects.select_for_update().get(pk=student.id)
+        if Booking.objects.filter(student_id=student.id).exists():
+            raise APIException({'student': 'Этот студент уже заселен'})
+
+        room = RoomService.take_place(book['room'].id, student.gender)
+        Booking.objects.create(**book, book_end=END_MONTH_DEFAULT, total_price=total_price, user_id=user)
+        DimensionStatsService.change([DimensionStatsService.instance_keys(student)], bookings=1)
 
         return room
 
+    @staticmethod
+    @transaction.atomic
+    def bulk_add_students(rows, user):
+        student_ids = {row['student'] for row in rows}
+        room_ids = {row['room'] for row in rows}
+        privilege_ids = {row['privilege'] for row in rows if row.get('privilege') is not None}
+
+        # lock order is always students, then rooms (by id) to stay deadlock-free with add_student
+        students = {item['id']: item for item in Student.objects.select_for_update().filter(pk__in=student_ids)
+                    .order_by('id').values('id', 'gender', 'student_type_id')}
+        rooms = {room.id: room for room in Room.objects.select_for_update().filter(pk__in=room_ids).order_by('id')}
+        booked = set(Booking.objects.filter(student_id__in=student_ids).values_list('student_id', flat=True))
+        privileges = set(Privilege.objects.filter(pk__in=privilege_ids).values_list('id', flat=True))
+        prices = dict(StudentType.objects.values_list('id', 'price'))
+        places = dict(RoomType.objects.values_list('id', 'place'))
+
+        bookings = []
+        changed_rooms = {}
+        errors = []
+        for index, row in enumerate(rows):
+            student = students.get(row['student'])
+            room = rooms.get(row['room'])
+            privilege = row.get('privilege')
+            row_errors = {}
+            if student is None:
+                row_errors['student'] = 'Студент не найден'
+            elif student['id'] in booked:
+                row_errors['student'] = 'Этот студент уже заселен'
+            if room is None:
+                row_errors['room'] = 'Комната не найдена'
+            elif room.person_count >= places[room.room_type_id]:
+                row_errors['room'] = 'В этой комнате уже нет мест'
+            elif student is not None and room.room_gender not in ('2', student['gender']):
+                if room.room_gender == '0':
+                    row_errors['gender'] = 'Вы можете заселить только женщин'
+                else:
+                    row_errors['gender'] = 'Вы можете заселить только мужчин'
+            if privilege is not None and privilege not in privileges:
+                row_errors['privilege'] = 'Привилегия не найдена'
+            if row_errors:
+                errors.append({'row': index, 'errors': row_errors})
+                continue
+
+            book_date = row.get('book_date') or datetime.date.today()
+            total_price = BookingService.contract_price(prices[student['student_type_id']], book_date, privilege)
+            bookings.append(Booking(
+                student_id=student['id'], room_id=room.id, privilege_id=privilege, book_date=book_date,
+                book_end=END_MONTH_DEFAULT, user_id=user, total_price=total_price, debt=total_price,
+            ))
+            booked.add(student['id'])
+            room.person_count += 1
+            room.is_full = room.person_count >= places[room.room_type_id]
+            room.room_gender = student['gender']
+            changed_rooms[room.id] = room
+
+        Booking.objects.bulk_create(bookings, batch_size=500)
+        Room.objects.bulk_update(changed_rooms.values(), ['person_count', 'is_full', 'room_gender'], batch_size=500)
+        AvailabilityIndex.rooms_changed(changed_rooms.keys())
+        BuildingStatsService.recompute({room.building_id for room in changed_rooms.values()})
+        StudentSearchIndex.students_changed(booked)
+        DimensionStatsService.change(DimensionStatsService.student_keys(
+            Student.objects.filter(pk__in=[book.student_id for book in bookings])), bookings=1)
+
+        return {'created': len(bookings), 'errors': errors}
+
     @staticmethod
     def un_booking(book, end_date):
         book_end = datetime.datetime.strptime(end_date, "%Y-%m-%d").date()
-        book_start = book.book_date
-
-        current_date = book_start
-        total_31 = 0
-        feb_add_day = 0
-        feb_last_day = 0
-
-        if book_end.day == 31:
-            finish_end = book_end - timedelta(1)
-        else:
-            finish_end = book_end
-
-        while current_date <= finish_end:
-            if current_date.day == 31:
-                total_31 += 1
-            current_date += timedelta(days=1)
-            if current_date.month == 2:
-                next_month = (current_date.month % 12) + 1
-                feb_last_day = (datetime.datetime(current_date.year, next_month, 1) - timedelta(days=1)).day
-        if feb_last_day in [28, 29]:
-            feb_add_day = 30 - feb_last_day
-
-        total_days = (finish_end - book_start).days
-        day_price = (total_days + feb_add_day + 1) * book.student.student_type.day - total_31 * book.student.student_type.day
-        book.book_end = book_end
-        book.total_price = day_price
-        book.status_id = 2
-        book.save()
-
-        room = Room.objects.get(pk=book.room_id)
-        room.person_count -= 1
-        room.save()
-        if room.person_count == 0:
-            room.is_full = 0
-            room.room_gender = 2
-            room.save()
+        with transaction.atomic():
+            # price and write from the locked row: the caller's copy can miss payments posted since it was loaded
+            locked = Booking.objects.select_for_update().select_related('student__student_type', 'student__group') \
+                .filter(pk=book.pk, status_id=1).first()
+            if locked is None:
+                raise APIException({'student': 'студент уже не жывет в обшежитие'})
+            day_price = stay_price(locked.book_date, book_end, locked.student.student_type.day)
+            Booking.objects.filter(pk=locked.pk).update(status_id=2, book_end=book_end, total_price=day_price,
+                                                        debt=day_price - F('payed'))
+            room = RoomService.release_place(locked.room_id, locked.student.gender)
+            DimensionStatsService.change([DimensionStatsService.instance_keys(locked.student)], bookings=-1)
 
         return room
 
+    @staticmethod
+    @transaction.atomic
+    def bulk_un_booking(query, book_end):
+        book_ids = list(query.filter(status_id=1).values_list('id', flat=True))
+        book_ids = list(Booking.objects.select_for_update().filter(pk__in=book_ids, status_id=1)
+                        .order_by('id').values_list('id', flat=True))
+        books = list(Booking.objects.filter(pk__in=book_ids)
+                     .values_list('id', 'room_id', 'book_date', 'student__student_type__day'))
+        early = [book_id for book_id, _, book_date, _ in books if book_date > book_end]
+        if early:
+            raise ValidationError({'book_end': f'Дата выезда раньше даты заселения, контракты: {early}'})
+        prices = stay_prices((book_date, book_end, day) for _, _, book_date, day in books)
+
+        for start in range(0, len(books), 500):
+            chunk = list(zip(books[start:start + 500], prices[start:start + 500]))
+            Booking.objects.filter(pk__in=[book[0] for book, _ in chunk]).update(
+                status_id=2,
+                book_end=book_end,
+                total_price=Case(*[When(pk=book[0], then=Value(price)) for book, price in chunk],
+                                 default=F('total_price')),
+                debt=Case(*[When(pk=book[0], then=Value(price) - F('payed')) for book, price in chunk],
+                          default=F('debt')),
+            )
+
+        room_ids = {room_id for _, room_id, _, _ in books}
+        RoomService.recount_rooms(room_ids)
+        DimensionStatsService.change(DimensionStatsService.student_keys(
+            Booking.objects.filter(pk__in=book_ids), prefix='student__'), bookings=-1)
+        return {'closed': len(books), 'rooms': len(room_ids)}
 
     @staticmethod
     def resettle():
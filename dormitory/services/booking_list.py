@@ -0,0 +1,63 @@
+from django.db.models import F, Value, DateField, DurationField, ExpressionWrapper
+
+BOOKING_LIST_FIELDS = (
+    'id', 'privilege_id', 'user__email', 'total_price', 'payed', 'debt', 'book_date', 'book_end', 'status_id',
+    'day_lives', 'created_at',
+    'room_id', 'room__number', 'room__floor', 'room__building__name', 'room__building_id', 'room__room_gender',
+    'student_id', 'student__name', 'student__last_name', 'student__sure_name', 'student__course',
+    'student__student_type__type', 'student__group_id', 'student__group__name', 'student__country_id',
+    'student__country__name', 'student__gender',
+)
+
+
+def decimal_str(value):
+    return None if value is None else f'{value:.2f}'
+
+
+def date_str(value):
+    return None if value is None else value.isoformat()
+
+
+# booking lists read with one joined query and shaped into the BookSerializer / ContractSerializer layout
+class BookingListService:
+
+    @staticmethod
+    def values(queryset, until=None):
+        # day_lives counts days from book_date up to `until` (today for bookings, book_end for contracts)
+        end = F('book_end') if until is None else Value(until, output_field=DateField())
+        return queryset.annotate(
+            day_lives=ExpressionWrapper(end - F('book_date'), output_field=DurationField()),
+        ).values(*BOOKING_LIST_FIELDS)
+
+    @staticmethod
+    def to_representation(rows):
+        return [{
+            'id': row['id'],
+            'student': {
+                'id': row['student_id'],
+                'full_name': f"{row['student__name']} {row['student__last_name']} {row['student__sure_name']}",
+                'course': row['student__course'],
+                'student_type': row['student__student_type__type'],
+                'group': {'id': row['student__group_id'], 'name': row['student__group__name']},
+                'country': {'id': row['student__country_id'], 'name': row['student__country__name']},
+                'gender': row['student__gender'],
+            },
+            'room': {
+                'id': row['room_id'],
+                'number': row['room__number'],
+                'floor': row['room__floor'],
+                'building': row['room__building__name'],
+                'building_id': row['room__building_id'],
+                'room_gender': row['room__room_gender'],
+            },
+            'privilege': row['privilege_id'],
+            'user': row['user__email'],
+            'total_price': decimal_str(row['total_price']),
+            'payed': decimal_str(row['payed']),
+            'debt': decimal_str(row['debt']),
+            'book_date': date_str(row['book_date']),
+            'book_end': date_str(row['book_end']),
+            'status': row['status_id'],
+            'day_lives': row['day_lives'].days,
+            'created_at': row['created_at'].strftime('%d.%m.%Y %H:%M') if row['created_at'] else None,
+        } for row in rows]
@@ -0,0 +1,52 @@
+from django.db.models import Count, Q, F
+
+from dormitory.models import Building, BuildingStats, Room, Booking
+
+STATS_FIELDS = ('rooms', 'busy_rooms', 'men', 'women', 'students')
+
+
+class BuildingStatsService:
+
+    @staticmethod
+    def compute(building_ids=None):
+        buildings = Building.objects.all() if building_ids is None else Building.objects.filter(pk__in=building_ids)
+        stats = {building_id: dict.fromkeys(STATS_FIELDS, 0)
+                 for building_id in buildings.values_list('id', flat=True)}
+
+        rooms = Room.objects.filter(building_id__in=stats).values('building_id').annotate(
+            total=Count('id'), busy=Count('id', filter=Q(is_full=True)))
+        for row in rooms:
+            stats[row['building_id']].update(rooms=row['total'], busy_rooms=row['busy'])
+
+        books = Booking.objects.filter(status_id=1, room__building_id__in=stats).values('room__building_id').annotate(
+            men=Count('id', filter=Q(student__gender='1')),
+            women=Count('id', filter=Q(student__gender='0')),
+            students=Count('student_id', distinct=True),
+        )
+        for row in books:
+            stats[row['room__building_id']].update(men=row['men'], women=row['women'], students=row['students'])
+        return stats
+
+    @staticmethod
+    def recompute(building_ids=None):
+        stats = BuildingStatsService.compute(building_ids)
+        BuildingStats.objects.bulk_create(
+            [BuildingStats(building_id=building_id, **values) for building_id, values in stats.items()],
+            update_conflicts=True, unique_fields=['building'], update_fields=STATS_FIELDS,
+        )
+        return stats
+
+    @staticmethod
+    def change(building_id, **deltas):
+        # deltas: rooms, busy_rooms, men, women, students; runs inside the caller's transaction
+        deltas = {field: value for field, value in deltas.items() if value}
+        if not deltas:
+            return
+        updated = BuildingStats.objects.filter(building_id=building_id).update(
+            **{field: F(field) + value for field, value in deltas.items()})
+        if not updated:
+            BuildingStatsService.recompute([building_id])
+
+    @staticmethod
+    def gender_deltas(gender, sign=1):
+        return {'men': sign if gender == '1' else 0, 'women': sign if gender == '0' else 0, 'students': sign}
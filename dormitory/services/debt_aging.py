@@ -0,0 +1,68 @@
+import datetime
+
+from django.db.models import Q, Case, When, Value, CharField, IntegerField, Count, Sum
+
+# (label, lower bound inclusive) from the largest debt down
+DEBT_BUCKETS = (
+    ('5000+', 5000),
+    ('1000-5000', 1000),
+    ('500-1000', 500),
+    ('0-500', 0),
+)
+# (label, days since the last payment, or since book_date when nothing was paid yet)
+AGE_BUCKETS = (
+    ('0-30', 30),
+    ('31-60', 60),
+    ('61-90', 90),
+)
+AGE_OLDEST = '90+'
+AGING_FIELDS = ('room__building_id', 'room__building__name', 'student__group__faculty_id',
+                'student__group__faculty__name', 'debt_bucket', 'age_bucket')
+
+
+def bucket(conditions, values, output_field):
+    # one value per condition, the last one is the default
+    *values, default = values
+    return Case(*[When(condition, then=Value(value)) for condition, value in zip(conditions, values)],
+                default=Value(default), output_field=output_field)
+
+
+def debt_conditions():
+    return [Q(debt__gte=bound) for _, bound in DEBT_BUCKETS[:-1]]
+
+
+def age_conditions(today):
+    conditions = []
+    for _, days in AGE_BUCKETS:
+        since = today - datetime.timedelta(days=days)
+        conditions.append(Q(last_payed__gte=since) | Q(last_payed__isnull=True, book_date__gte=since))
+    return conditions
+
+
+def debt_bucket():
+    return bucket(debt_conditions(), [label for label, _ in DEBT_BUCKETS], CharField())
+
+
+def debt_order():
+    # buckets sort by the debt, not by the label: 0 for the smallest
+    return bucket(debt_conditions(), range(len(DEBT_BUCKETS) - 1, -1, -1), IntegerField())
+
+
+def age_bucket(today):
+    return bucket(age_conditions(today), [label for label, _ in AGE_BUCKETS] + [AGE_OLDEST], CharField())
+
+
+def age_order(today):
+    return bucket(age_conditions(today), range(len(AGE_BUCKETS) + 1), IntegerField())
+
+
+class DebtAgingService:
+
+    @staticmethod
+    def report(queryset, today=None):
+        # one GROUP BY over the bookings that still owe money, keyed by building, faculty and both buckets
+        today = today or datetime.date.today()
+        return queryset.filter(debt__gt=0).annotate(debt_bucket=debt_bucket(), age_bucket=age_bucket(today)) \
+            .alias(debt_order=debt_order(), age_order=age_order(today)) \
+            .values(*AGING_FIELDS).annotate(count=Count('id'), total_debt=Sum('debt')) \
+            .order_by('room__building__name', 'student__group__faculty__name', 'debt_order', 'age_order')
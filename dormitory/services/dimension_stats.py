@@ -0,0 +1,98 @@
+from collections import Counter
+
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from dormitory.models import DimensionStats, Student, Booking
+
+# dimension -> path from a student to the row it is counted under
+DIMENSIONS = {
+    'group': 'group_id',
+    'faculty': 'group__faculty_id',
+    'country': 'country_id',
+    'company': 'company_id',
+}
+STATS_FIELDS = ('students', 'bookings')
+
+
+class DimensionStatsService:
+
+    @staticmethod
+    def compute(dimension, keys=None):
+        # students and active bookings are counted in separate queries, so neither is inflated by the other join
+        field = DIMENSIONS[dimension]
+        students = Student.objects.exclude(**{field: None})
+        books = Booking.objects.filter(status_id=1).exclude(**{f'student__{field}': None})
+        if keys is None:
+            # a full pass also zeroes stored rows that no longer have students
+            keys = DimensionStats.objects.filter(dimension=dimension).values_list('key', flat=True)
+        else:
+            students = students.filter(**{f'{field}__in': keys})
+            books = books.filter(**{f'student__{field}__in': keys})
+        stats = {key: dict.fromkeys(STATS_FIELDS, 0) for key in keys}
+
+        for key, total in students.order_by().values_list(field).annotate(total=Count('id')):
+            stats.setdefault(key, dict.fromkeys(STATS_FIELDS, 0))['students'] = total
+        for key, total in books.order_by().values_list(f'student__{field}').annotate(total=Count('id')):
+            stats.setdefault(key, dict.fromkeys(STATS_FIELDS, 0))['bookings'] = total
+        return stats
+
+    @staticmethod
+    def recompute(dimension=None, keys=None):
+        dimensions = DIMENSIONS if dimension is None else [dimension]
+        result = {}
+        for name in dimensions:
+            stats = DimensionStatsService.compute(name, keys)
+            DimensionStats.objects.bulk_create(
+                [DimensionStats(dimension=name, key=key, **values) for key, values in stats.items()],
+                update_conflicts=True, unique_fields=['dimension', 'key'], update_fields=STATS_FIELDS,
+            )
+            result[name] = stats
+        return result
+
+    @staticmethod
+    def change(keys, **deltas):
+        # keys: one dict per student as returned by student_keys; deltas: students, bookings.
+        # runs inside the caller's transaction, rows are updated in a fixed order to stay deadlock-free
+        counters = {field: Counter() for field in STATS_FIELDS}
+        for student in keys:
+            for dimension, key in student.items():
+                if key is None:
+                    continue
+                for field, value in deltas.items():
+                    counters[field][dimension, key] += value
+        rows = sorted(set(counters['students']) | set(counters['bookings']))
+        missing = {}
+        for dimension, key in rows:
+            values = {field: F(field) + counters[field][dimension, key]
+                      for field in STATS_FIELDS if counters[field][dimension, key]}
+            if not values:
+                continue
+            if not DimensionStats.objects.filter(dimension=dimension, key=key).update(**values):
+                missing.setdefault(dimension, set()).add(key)
+        for dimension, keys in missing.items():
+            DimensionStatsService.recompute(dimension, keys)
+
+    @staticmethod
+    def student_keys(queryset, prefix=''):
+        # one dict of dimension keys per row; prefix='student__' reads them through a booking queryset
+        rows = queryset.values_list(*[prefix + field for field in DIMENSIONS.values()])
+        return [dict(zip(DIMENSIONS, row)) for row in rows]
+
+    @staticmethod
+    def instance_keys(student):
+        return {'group': student.group_id, 'faculty': student.group.faculty_id,
+                'country': student.country_id, 'company': student.company_id}
+
+    @staticmethod
+    def annotate(queryset, dimension):
+        stats = DimensionStats.objects.filter(dimension=dimension, key=OuterRef('pk'))
+        return queryset.annotate(
+            student_count=Coalesce(Subquery(stats.values('students')[:1]), 0),
+            booking_count=Coalesce(Subquery(stats.values('bookings')[:1]), 0),
+        )
+
+    @staticmethod
+    def totals(queryset, dimension):
+        return DimensionStats.objects.filter(dimension=dimension, key__in=queryset.values('pk')).aggregate(
+            book_total=Sum('bookings'), student_total=Sum('students'))
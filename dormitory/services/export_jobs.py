@@ -0,0 +1,69 @@
+import datetime
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from dormitory.models import ExportJob
+from dormitory.utils.export_to_excel import write_workbook
+from . import worker
+
+EXPORTS = {}
+# a job running longer than this is taken for dead (its process crashed or was restarted) and queued again
+LEASE = datetime.timedelta(seconds=getattr(settings, 'EXPORT_JOB_LEASE', 30 * 60))
+
+
+def register_export(kind):
+    # the function gets the job params and user and returns (sheet_title, columns, rows, total_row) for write_workbook
+    def decorator(func):
+        EXPORTS[kind] = func
+        return func
+
+    return decorator
+
+
+class ExportJobService:
+
+    @staticmethod
+    def create(kind, params, user_id):
+        if kind not in EXPORTS:
+            raise APIException({'kind': f'{kind} нельзя экспортировать'})
+        job = ExportJob.objects.create(kind=kind, params=params, user_id=user_id)
+        worker.submit_on_commit(ExportJobService.run, job.id)
+        return job
+
+    @staticmethod
+    def run(job_id):
+        # the conditional update makes sure a job is only picked once, even with several workers
+        started_at = timezone.now()
+        if not ExportJob.objects.filter(pk=job_id, status='pending').update(status='running', started_at=started_at):
+            return
+        job = ExportJob.objects.get(pk=job_id)
+        try:
+            sheet = EXPORTS[job.kind](job.params, job.user)
+            with tempfile.TemporaryFile() as file:
+                write_workbook(file, *sheet)
+                file.seek(0)
+                job.file.save(f'{job.kind}.xlsx', File(file), save=False)
+            job.status = 'done'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+        # only written while the lease is ours, a run that outlived it leaves the job to the one that took it over
+        finished = ExportJob.objects.filter(pk=job_id, status='running', started_at=started_at).update(
+            file=job.file.name, status=job.status, error=job.error, finished_at=timezone.now())
+        if not finished and job.file:
+            job.file.delete(save=False)
+
+    @staticmethod
+    def requeue_stale():
+        # running jobs whose lease ran out go back to pending; rows from before started_at have none
+        expired = Q(started_at__lt=timezone.now() - LEASE) | Q(started_at=None)
+        return ExportJob.objects.filter(expired, status='running').update(status='pending', started_at=None)
+
+    @staticmethod
+    def pending_ids():
+        return list(ExportJob.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True))
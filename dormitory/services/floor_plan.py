@@ -0,0 +1,45 @@
+from django.db.models import FilteredRelation, Q
+
+from dormitory.models import Building, Room
+
+ROOM_COLUMNS = ('id', 'number', 'floor', 'place', 'person_count', 'room_gender', 'is_full')
+
+
+def short_name(name, last_name):
+    return f'{last_name} {name[:1]}.' if name else last_name
+
+
+# the whole building in one joined query: rooms, their capacity and the students of active bookings
+class FloorPlanService:
+
+    @staticmethod
+    def plan(building_id):
+        rows = Room.objects.filter(building_id=building_id).annotate(
+            active=FilteredRelation('booking', condition=Q(booking__status_id=1)),
+        ).values_list(
+            'id', 'number', 'floor', 'room_type__place', 'person_count', 'room_gender', 'is_full',
+            'building_id', 'building__name', 'building__floor_count',
+            'active__student_id', 'active__student__name', 'active__student__last_name',
+        ).order_by('floor', 'number', 'id', 'active__student__last_name', 'active__student_id')
+
+        # column oriented: one list per field, the n-th entry of every list belongs to the n-th room
+        columns = {column: [] for column in ROOM_COLUMNS}
+        columns['students'] = []
+        building = None
+        for row in rows:
+            room_id, *room, building_pk, building_name, floor_count, student_id, name, last_name = row
+            if building is None:
+                building = {'id': building_pk, 'name': building_name, 'floor_count': floor_count}
+            if not columns['id'] or columns['id'][-1] != room_id:
+                for column, value in zip(ROOM_COLUMNS, (room_id, *room)):
+                    columns[column].append(value)
+                columns['students'].append([])
+            if student_id is not None:
+                columns['students'][-1].append([student_id, short_name(name, last_name)])
+
+        if building is None:
+            # no rooms yet, only then the building is read separately
+            building = Building.objects.filter(pk=building_id).values('id', 'name', 'floor_count').first()
+            if building is None:
+                return None
+        return {'building': building, 'rooms': columns}
@@ -0,0 +1,72 @@
+import datetime
+
+from django.db.models import Count, Q, Sum
+
+from dormitory.models import Booking, OccupancySnapshot, Room
+
+SNAPSHOT_FIELDS = ('beds', 'busy', 'men', 'women')
+
+
+class OccupancySnapshotService:
+
+    @staticmethod
+    def beds():
+        # the current room layout is used for every day, rooms with bookings cannot be deleted
+        rows = Room.objects.order_by().values('building_id', 'floor').annotate(beds=Sum('room_type__place'))
+        return {(row['building_id'], row['floor']): row['beds'] or 0 for row in rows}
+
+    @staticmethod
+    def compute(day, beds=None):
+        # a booking counts from book_date up to and including book_end; active bookings count until checkout
+        beds = OccupancySnapshotService.beds() if beds is None else beds
+        stats = {floor: dict(beds=count, busy=0, men=0, women=0) for floor, count in beds.items()}
+        books = Booking.objects.filter(Q(status_id=1) | Q(book_end__gte=day), book_date__lte=day).order_by() \
+            .values('room__building_id', 'room__floor').annotate(
+                busy=Count('id'),
+                men=Count('id', filter=Q(student__gender='1')),
+                women=Count('id', filter=Q(student__gender='0')),
+            )
+        for row in books:
+            floor = stats.setdefault((row['room__building_id'], row['room__floor']),
+                                     dict.fromkeys(SNAPSHOT_FIELDS, 0))
+            floor.update(busy=row['busy'], men=row['men'], women=row['women'])
+        return stats
+
+    @staticmethod
+    def snapshot(day, beds=None):
+        stats = OccupancySnapshotService.compute(day, beds)
+        OccupancySnapshot.objects.bulk_create(
+            [OccupancySnapshot(date=day, building_id=building_id, floor=floor, **values)
+             for (building_id, floor), values in stats.items()],
+            update_conflicts=True, unique_fields=['date', 'building', 'floor'], update_fields=SNAPSHOT_FIELDS,
+            batch_size=500,
+        )
+        return stats
+
+    @staticmethod
+    def first_day():
+        return Booking.objects.order_by('book_date').values_list('book_date', flat=True).first()
+
+    @staticmethod
+    def backfill(date_start, date_end):
+        # one grouped query per day, the bed counts are read once for the whole range
+        beds = OccupancySnapshotService.beds()
+        day = date_start
+        days = 0
+        while day <= date_end:
+            OccupancySnapshotService.snapshot(day, beds)
+            day += datetime.timedelta(days=1)
+            days += 1
+        return days
+
+    @staticmethod
+    def series(date_start, date_end, building=None, floor=None):
+        snapshots = OccupancySnapshot.objects.filter(date__gte=date_start, date__lte=date_end)
+        if building is not None:
+            snapshots = snapshots.filter(building_id=building)
+        if floor is not None:
+            snapshots = snapshots.filter(floor=floor)
+        rows = snapshots.values('date').annotate(
+            beds=Sum('beds'), busy=Sum('busy'), men=Sum('men'), women=Sum('women')).order_by('date')
+        return [{'date': row['date'].isoformat(), 'beds': row['beds'], 'busy': row['busy'],
+                 'free': row['beds'] - row['busy'], 'men': row['men'], 'women': row['women']} for row in rows]
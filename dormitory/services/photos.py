@@ -0,0 +1,55 @@
+import logging
+
+from django.core.files.storage import default_storage
+
+from dormitory.models import Student
+from dormitory.utils.photos import render_photo, delete_photos, PHOTO_SIZES
+from . import worker
+
+logger = logging.getLogger(__name__)
+
+
+# uploads are stored as they come, the normalized copy and the thumbnails are made off the request
+class PhotoService:
+
+    @staticmethod
+    def schedule(student_id):
+        worker.submit_on_commit(PhotoService.process, student_id)
+
+    @staticmethod
+    def process(student_id):
+        name = Student.objects.filter(pk=student_id, photo_status='pending').values_list('photo', flat=True).first()
+        if not name:
+            return
+        try:
+            photos = render_photo(name)
+        except Exception:
+            logger.exception('photo of student %s could not be processed', student_id)
+            PhotoService.store(student_id, name, None)
+            return
+        PhotoService.store(student_id, name, photos)
+
+    @staticmethod
+    def store(student_id, name, photos):
+        # only written if the student still has the same upload, otherwise the copies are thrown away
+        if photos is None:
+            Student.objects.filter(pk=student_id, photo=name).update(photo_status='failed')
+            return False
+        old = Student.objects.filter(pk=student_id, photo=name).values_list('photo_thumbs', flat=True).first()
+        if Student.objects.filter(pk=student_id, photo=name).update(photo_thumbs=photos, photo_status='ready'):
+            delete_photos({label: path for label, path in (old or {}).items() if path not in photos.values()})
+            return True
+        delete_photos(photos)
+        return False
+
+    @staticmethod
+    def pending(statuses=('pending',)):
+        return list(Student.objects.filter(photo_status__in=statuses).exclude(photo='').order_by('id')
+                    .values_list('id', 'photo'))
+
+    @staticmethod
+    def urls(photos):
+        # built from the stored names only, no image file is opened
+        if not photos:
+            return None
+        return {label: default_storage.url(photos[label]) for label in PHOTO_SIZES if label in photos}
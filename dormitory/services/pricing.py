@@ -0,0 +1,40 @@
+import calendar
+from datetime import date, timedelta
+
+# months with a 31st day before the given month (index 1..12), e.g. Jan 31 and Mar 31 come before April
+MONTHS_31_BEFORE = (0, 0, 1, 1, 2, 2, 3, 3, 4, 5, 5, 6, 6)
+
+
+def count_31(day):
+    # number of 31st days from 0001-01-01 up to and including `day`
+    return (day.year - 1) * 7 + MONTHS_31_BEFORE[day.month] + (day.day == 31)
+
+
+def february_add_days(first, last):
+    # a stay touching February is billed as if February had 30 days; only the latest February counts
+    if first > last:
+        return 0
+    year = last.year if last.month >= 2 else last.year - 1
+    if first > date(year, 2, calendar.monthrange(year, 2)[1]):
+        return 0
+    return 2 if not calendar.isleap(year) else 1
+
+
+def billable_days(book_start, book_end):
+    finish_end = book_end - timedelta(days=1) if book_end.day == 31 else book_end
+    total_days = (finish_end - book_start).days
+    if total_days < 0:
+        return total_days + 1
+
+    total_31 = count_31(finish_end) - count_31(book_start - timedelta(days=1))
+    feb_add_day = february_add_days(book_start + timedelta(days=1), finish_end + timedelta(days=1))
+    return total_days + feb_add_day + 1 - total_31
+
+
+def stay_price(book_start, book_end, day_price):
+    return billable_days(book_start, book_end) * day_price
+
+
+def stay_prices(stays):
+    # stays: iterable of (book_start, book_end, day_price)
+    return [billable_days(book_start, book_end) * day_price for book_start, book_end, day_price in stays]
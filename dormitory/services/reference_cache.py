@@ -0,0 +1,66 @@
+import json
+from hashlib import md5
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .availability import counter, bump
+
+CACHE_TIMEOUT = 60 * 60 * 24
+VERSION_KEY = 'reference:version'
+
+
+# serialized reference lists (faculties, countries, privileges ...) built once per version,
+# the version is bumped on every write to one of the reference models. It starts from the clock, so after an
+# eviction it never comes back to a version whose lists are still cached
+class ReferenceCache:
+
+    @staticmethod
+    def version():
+        return counter(VERSION_KEY)
+
+    @staticmethod
+    def bump_version():
+        bump(VERSION_KEY)
+
+    @staticmethod
+    def invalidate():
+        transaction.on_commit(ReferenceCache.bump_version)
+
+    @staticmethod
+    def get(name, build):
+        key = f'reference:{ReferenceCache.version()}:{name}'
+        entry = cache.get(key)
+        if entry is None:
+            body = json.dumps(build(), cls=JSONEncoder, ensure_ascii=False)
+            entry = {'etag': '"%s"' % md5(body.encode()).hexdigest(), 'data': json.loads(body)}
+            cache.set(key, entry, CACHE_TIMEOUT)
+        return entry
+
+    @staticmethod
+    def response(request, name, build, envelope=True):
+        entry = ReferenceCache.get(name, build)
+        if_none_match = request.headers.get('If-None-Match', '')
+        if entry['etag'] in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({'data': entry['data']} if envelope else entry['data'])
+        response['ETag'] = entry['etag']
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class ReferenceListMixin:
+    # plain (unfiltered) list of a reference model served from ReferenceCache
+    reference_name = None
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        return ReferenceCache.response(
+            request, self.reference_name,
+            lambda: self.get_serializer(self.filter_queryset(self.get_queryset()), many=True).data,
+            envelope=False)
@@ -1,8 +1,138 @@
-from dormitory.models import Room
+from django.db import transaction
+from django.db.models import Count, Case, When, Value
+from rest_framework.exceptions import APIException, ValidationError
+
+from dormitory.models import Room, RoomType, Booking
+from .availability import AvailabilityIndex
+from .building_stats import BuildingStatsService
 
 
 class RoomService:
 
-    def is_full_room(self, room_id):
-        print(room_id, 'lllll')
-        pass
\ No newline at end of file
+    @staticmethod
+    def take_place(room_id, gender):
+        # must be called inside transaction.atomic: the row stays locked until commit
+        room = Room.objects.select_for_update().get(pk=room_id)
+        place = room.room_type.place
+        if room.person_count >= place:
+            raise APIException({'room': 'В этой комнате уже нет мест'})
+        if room.room_gender not in ('2', gender):
+            if room.room_gender == '0':
+                raise APIException({'gender': 'Вы можете заселить только женщин'})
+            raise APIException({'gender': 'Вы можете заселить только мужчин'})
+
+        room.person_count += 1
+        room.is_full = room.person_count >= place
+        room.room_gender = gender
+        room.save(update_fields=['person_count', 'is_full', 'room_gender'])
+        BuildingStatsService.change(room.building_id, busy_rooms=int(room.is_full),
+                                    **BuildingStatsService.gender_deltas(gender))
+        return room
+
+    @staticmethod
+    def release_place(room_id, gender):
+        room = Room.objects.select_for_update().get(pk=room_id)
+        was_full = room.is_full
+        room.person_count = max(room.person_count - 1, 0)
+        room.is_full = False
+        if room.person_count == 0:
+            room.room_gender = '2'
+        room.save(update_fields=['person_count', 'is_full', 'room_gender'])
+        BuildingStatsService.change(room.building_id, busy_rooms=-int(was_full),
+                                    **BuildingStatsService.gender_deltas(gender, -1))
+        return room
+
+    @staticmethod
+    @transaction.atomic
+    def transfer(book_id, new_room_id):
+        # lock order as everywhere else: booking, then both rooms by id, then building stats by building id
+        book = Booking.objects.select_for_update().select_related('student').filter(pk=book_id, status_id=1).first()
+        if book is None:
+            raise APIException({'student': 'студент уже не жывет в обшежитие'})
+        if book.room_id == new_room_id:
+            raise APIException({'room': 'Студент уже живет в этой комнате'})
+        rooms = {room.id: room for room in
+                 Room.objects.select_for_update().filter(pk__in=[book.room_id, new_room_id]).order_by('id')}
+        if new_room_id not in rooms:
+            raise APIException({'room': 'Комната не найдена'})
+
+        gender = book.student.gender
+        old_room_id = book.room_id
+        # take first when the new room's building comes first, so stats rows are also locked in id order
+        if rooms[new_room_id].building_id <= rooms[old_room_id].building_id:
+            room = RoomService.take_place(new_room_id, gender)
+            RoomService.release_place(old_room_id, gender)
+        else:
+            RoomService.release_place(old_room_id, gender)
+            room = RoomService.take_place(new_room_id, gender)
+        book.room_id = new_room_id
+        book.save(update_fields=['room'])
+        return room
+
+    @staticmethod
+    @transaction.atomic
+    def move_many(moves):
+        # moves: [{'booking': id, 'room': id}], applied all together so whole floors can be swapped;
+        # nothing is changed when any room would be over capacity or mixed
+        book_ids = [move['booking'] for move in moves]
+        targets = {move['booking']: move['room'] for move in moves}
+        if len(targets) != len(moves):
+            raise ValidationError({'errors': 'Контракт указан несколько раз'})
+        books = {book['id']: book for book in Booking.objects.select_for_update().filter(pk__in=book_ids, status_id=1)
+                 .order_by('id').values('id', 'room_id', 'student__gender')}
+        room_ids = set(targets.values()) | {book['room_id'] for book in books.values()}
+        rooms = {room.id: room for room in Room.objects.select_for_update().filter(pk__in=room_ids).order_by('id')}
+        places = dict(RoomType.objects.values_list('id', 'place'))
+
+        errors = []
+        for index, move in enumerate(moves):
+            if move['booking'] not in books:
+                errors.append({'row': index, 'errors': {'booking': 'студент уже не жывет в обшежитие'}})
+            elif move['room'] not in rooms:
+                errors.append({'row': index, 'errors': {'room': 'Комната не найдена'}})
+        if errors:
+            raise ValidationError({'errors': errors})
+
+        occupants = {room_id: [] for room_id in rooms}
+        for book in Booking.objects.filter(room_id__in=rooms, status_id=1).values('id', 'room_id', 'student__gender'):
+            room_id = targets.get(book['id'], book['room_id'])
+            occupants[room_id].append(book['student__gender'])
+        for room_id, room in rooms.items():
+            genders = set(occupants[room_id])
+            if len(occupants[room_id]) > places[room.room_type_id]:
+                errors.append({'room': room.id, 'errors': {'room': 'В этой комнате уже нет мест'}})
+            elif len(genders) > 1:
+                errors.append({'room': room.id, 'errors': {'gender': 'В комнате окажутся мужчины и женщины'}})
+        if errors:
+            raise ValidationError({'errors': errors})
+
+        moved = [(book_id, room_id) for book_id, room_id in targets.items() if books[book_id]['room_id'] != room_id]
+        for start in range(0, len(moved), 500):
+            chunk = moved[start:start + 500]
+            Booking.objects.filter(pk__in=[book_id for book_id, _ in chunk]).update(
+                room_id=Case(*[When(pk=book_id, then=Value(room_id)) for book_id, room_id in chunk]))
+        for room_id, room in rooms.items():
+            room.person_count = len(occupants[room_id])
+            room.is_full = room.person_count >= places[room.room_type_id]
+            room.room_gender = occupants[room_id][0] if occupants[room_id] else '2'
+        Room.objects.bulk_update(rooms.values(), ['person_count', 'is_full', 'room_gender'], batch_size=500)
+        AvailabilityIndex.rooms_changed(rooms.keys())
+        BuildingStatsService.recompute({room.building_id for room in rooms.values()})
+        return {'moved': len(moved), 'rooms': len(rooms)}
+
+    @staticmethod
+    def recount_rooms(room_ids):
+        # recompute occupancy of the given rooms from their active bookings, one UPDATE for all of them
+        rooms = list(Room.objects.select_for_update().filter(pk__in=room_ids).order_by('id'))
+        places = dict(RoomType.objects.values_list('id', 'place'))
+        counts = dict(Booking.objects.filter(room_id__in=room_ids, status_id=1).values('room_id')
+                      .annotate(total=Count('id')).values_list('room_id', 'total'))
+        for room in rooms:
+            room.person_count = counts.get(room.id, 0)
+            room.is_full = room.person_count >= places[room.room_type_id]
+            if room.person_count == 0:
+                room.room_gender = '2'
+        Room.objects.bulk_update(rooms, ['person_count', 'is_full', 'room_gender'], batch_size=500)
+        AvailabilityIndex.rooms_changed(room_ids)
+        BuildingStatsService.recompute({room.building_id for room in rooms})
+        return rooms
@@ -0,0 +1,183 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, When
+from django.db.models.functions import Coalesce, Least
+
+from dormitory.models import Student, Booking
+from dormitory.utils.main_util import normalize_name
+from . import worker
+from .availability import counter
+
+SEQ_KEY = 'student_search:seq'
+CHANGE_TIMEOUT = 60 * 60
+# more pending changes than this and a full reload is cheaper than patching
+MAX_CHANGES = 500
+
+
+def search_queryset():
+    # students that can still be booked, same rule as the booking form: no booking at all
+    return Student.objects.annotate(
+        has_booking=Exists(Booking.objects.filter(student_id=OuterRef('pk')))
+    ).filter(has_booking=False).values_list('id', 'name', 'last_name')
+
+
+# prefix index over the name and last name of students without a booking, kept per process.
+# writes append the changed student ids to a shared change log (the cache, which must be shared between workers),
+# every process replays it before searching. Full rebuilds run in the background worker; until one is done,
+# searches go to the database
+class StudentSearchIndex:
+    lock = threading.Lock()
+    rebuilding = False
+    seq = None
+    keys = []
+    ids = []
+    students = {}
+
+    @staticmethod
+    def current_seq():
+        return counter(SEQ_KEY)
+
+    @classmethod
+    def add(cls, student_id, name, last_name):
+        cls.students[student_id] = (name, last_name)
+        for key in {normalize_name(name), normalize_name(last_name)} - {''}:
+            position = bisect_left(cls.keys, key)
+            while position < len(cls.keys) and cls.keys[position] == key and cls.ids[position] < student_id:
+                position += 1
+            cls.keys.insert(position, key)
+            cls.ids.insert(position, student_id)
+
+    @classmethod
+    def remove(cls, student_id):
+        student = cls.students.pop(student_id, None)
+        if student is None:
+            return
+        for key in {normalize_name(student[0]), normalize_name(student[1])} - {''}:
+            position = bisect_left(cls.keys, key)
+            while position < len(cls.keys) and cls.keys[position] == key:
+                if cls.ids[position] == student_id:
+                    del cls.keys[position]
+                    del cls.ids[position]
+                    break
+                position += 1
+
+    @classmethod
+    def rebuild(cls):
+        # built without the lock, searches keep being served meanwhile; only the swap is locked
+        seq = cls.current_seq()
+        entries = []
+        students = {}
+        for student_id, name, last_name in search_queryset().iterator(chunk_size=5000):
+            students[student_id] = (name, last_name)
+            for key in {normalize_name(name), normalize_name(last_name)} - {''}:
+                entries.append((key, student_id))
+        entries.sort()
+        with cls.lock:
+            cls.keys = [key for key, _ in entries]
+            cls.ids = [student_id for _, student_id in entries]
+            cls.students = students
+            cls.seq = seq
+
+    @classmethod
+    def rebuild_task(cls):
+        try:
+            cls.rebuild()
+        finally:
+            cls.rebuilding = False
+
+    @classmethod
+    def schedule_rebuild(cls):
+        # called with the lock held
+        if not cls.rebuilding:
+            cls.rebuilding = True
+            worker.submit(cls.rebuild_task)
+
+    @classmethod
+    def apply(cls, student_ids, rows):
+        # called with the lock held
+        for student_id in student_ids:
+            cls.remove(student_id)
+        for student_id, name, last_name in rows:
+            cls.add(student_id, name, last_name)
+
+    @classmethod
+    def sync(cls):
+        # False when the index is missing or too far behind to be patched. The change log and the changed rows
+        # are read without the lock, only applying them is locked
+        base = cls.seq
+        seq = cls.current_seq()
+        if base is None or seq < base or seq - base > MAX_CHANGES:
+            with cls.lock:
+                cls.schedule_rebuild()
+            return False
+        if seq == base:
+            return True
+        changes = cache.get_many([f'student_search:change:{number}' for number in range(base + 1, seq + 1)])
+        if len(changes) != seq - base:
+            # part of the log expired or is not written yet
+            with cls.lock:
+                cls.schedule_rebuild()
+            return False
+        student_ids = {student_id for student_ids in changes.values() for student_id in student_ids}
+        rows = list(search_queryset().filter(pk__in=student_ids))
+        with cls.lock:
+            if cls.seq != base:
+                # another request or a rebuild moved the index meanwhile, it is current if it got this far
+                return cls.seq >= seq
+            cls.apply(student_ids, rows)
+            cls.seq = seq
+        return True
+
+    @staticmethod
+    def database_query(prefix):
+        # same order as the index: by the first key that matches, then by id
+        name = Case(When(name_key__startswith=prefix, then=F('name_key')))
+        last_name = Case(When(last_name_key__startswith=prefix, then=F('last_name_key')))
+        return search_queryset().filter(Q(name_key__startswith=prefix) | Q(last_name_key__startswith=prefix)) \
+            .alias(first_key=Least(Coalesce(name, last_name), Coalesce(last_name, name))).order_by('first_key', 'id')
+
+    @staticmethod
+    def search_database(prefix, limit):
+        return [{'id': student_id, 'name': name, 'last_name': last_name}
+                for student_id, name, last_name in StudentSearchIndex.database_query(prefix)[:limit]]
+
+    @classmethod
+    def search(cls, query, limit=4):
+        prefix = normalize_name(query)
+        result = []
+        if not prefix:
+            return result
+        if not cls.sync():
+            return StudentSearchIndex.search_database(prefix, limit)
+        with cls.lock:
+            position = bisect_left(cls.keys, prefix)
+            seen = set()
+            while position < len(cls.keys) and cls.keys[position].startswith(prefix) and len(result) < limit:
+                student_id = cls.ids[position]
+                if student_id not in seen:
+                    seen.add(student_id)
+                    name, last_name = cls.students[student_id]
+                    result.append({'id': student_id, 'name': name, 'last_name': last_name})
+                position += 1
+        return result
+
+    @staticmethod
+    def log_change(student_ids):
+        StudentSearchIndex.current_seq()
+        try:
+            seq = cache.incr(SEQ_KEY)
+        except ValueError:
+            # evicted in the meantime, the jump makes every process rebuild
+            seq = time.time_ns()
+            cache.set(SEQ_KEY, seq, None)
+        cache.set(f'student_search:change:{seq}', student_ids, CHANGE_TIMEOUT)
+
+    @staticmethod
+    def students_changed(student_ids):
+        student_ids = list(student_ids)
+        if student_ids:
+            transaction.on_commit(lambda: StudentSearchIndex.log_change(student_ids))
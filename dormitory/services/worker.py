@@ -0,0 +1,39 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'WORKER_THREADS', 2),
+                                           thread_name_prefix='dormitory-worker')
+        return _executor
+
+
+def run_task(func, *args):
+    close_old_connections()
+    try:
+        return func(*args)
+    except Exception:
+        logger.exception('background task %s failed', getattr(func, '__name__', func))
+    finally:
+        close_old_connections()
+
+
+def submit(func, *args):
+    return get_executor().submit(run_task, func, *args)
+
+
+def submit_on_commit(func, *args):
+    # the task must only see rows the current transaction has committed
+    transaction.on_commit(lambda: submit(func, *args))
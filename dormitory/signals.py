@@ -1,10 +1,20 @@
-from django.db.models.signals import post_save, pre_save
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from rest_framework.exceptions import ValidationError
 from .models import CustomUser
 from commandant.models import Commandant
 from accounts.models import Account
-from dormitory.models import Room, Booking
+from dormitory.models import (Room, Booking, Building, Student, Faculty, Country, StudentType, Privilege, RoomType,
+                              Group, Company, DimensionStats)
+from dormitory.services.availability import AvailabilityIndex
+from dormitory.services.building_stats import BuildingStatsService
+from dormitory.services.dimension_stats import DimensionStatsService
+from dormitory.services.reference_cache import ReferenceCache
+from dormitory.services.student_search import StudentSearchIndex
+from dormitory.services.photos import PhotoService
+from dormitory.services.room_service import RoomService
+from dormitory.utils.photos import delete_photos
 
 
 @receiver(post_save, sender=CustomUser)
@@ -22,6 +32,146 @@ def creat_user_check(sender, instance, created, **kwargs):
         # print('not created')
 
 
+@receiver(post_save, sender=Room)
+def room_availability(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is not None:
+        AvailabilityIndex.rooms_changed([instance.id])
+    else:
+        # an edit can move the room to another floor or building
+        AvailabilityIndex.invalidate()
+
+
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=Building)
+@receiver(post_delete, sender=Building)
+def building_availability(sender, **kwargs):
+    AvailabilityIndex.invalidate()
+
+
+@receiver(pre_save, sender=Room)
+def room_old_building(sender, instance, update_fields=None, **kwargs):
+    if instance.pk and update_fields is None:
+        instance.old_building_id = Room.objects.filter(pk=instance.pk).values_list('building_id', flat=True).first()
+
+
+@receiver(post_save, sender=Room)
+def room_stats(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        BuildingStatsService.change(instance.building_id, rooms=1)
+    elif update_fields is None:
+        BuildingStatsService.recompute({instance.building_id, getattr(instance, 'old_building_id', None)} - {None})
+
+
+@receiver(post_delete, sender=Room)
+def room_deleted_stats(sender, instance, **kwargs):
+    BuildingStatsService.change(instance.building_id, rooms=-1, busy_rooms=-int(instance.is_full))
+
+
+REFERENCE_MODELS = (Faculty, Country, StudentType, Privilege, RoomType, Building, Group, Company)
+
+
+def reference_changed(sender, **kwargs):
+    ReferenceCache.invalidate()
+
+
+for reference_model in REFERENCE_MODELS:
+    post_save.connect(reference_changed, sender=reference_model,
+                      dispatch_uid=f'reference_save_{reference_model.__name__}')
+    post_delete.connect(reference_changed, sender=reference_model,
+                        dispatch_uid=f'reference_delete_{reference_model.__name__}')
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def student_search_changed(sender, instance, **kwargs):
+    StudentSearchIndex.students_changed([instance.pk])
+
+
+@receiver(pre_save, sender=Student)
+def student_old_keys(sender, instance, **kwargs):
+    if instance.pk and not instance._state.adding:
+        keys = DimensionStatsService.student_keys(Student.objects.filter(pk=instance.pk))
+        instance.old_dimension_keys = keys[0] if keys else None
+
+
+@receiver(post_save, sender=Student)
+def student_dimension_stats(sender, instance, created, **kwargs):
+    keys = DimensionStatsService.instance_keys(instance)
+    old_keys = getattr(instance, 'old_dimension_keys', None)
+    if created or old_keys is None:
+        DimensionStatsService.change([keys], students=1)
+        return
+    for dimension, key in keys.items():
+        if old_keys[dimension] != key:
+            # the student takes its bookings along, recount both sides
+            DimensionStatsService.recompute(dimension, {old_keys[dimension], key} - {None})
+
+
+@receiver(post_delete, sender=Student)
+def student_deleted_stats(sender, instance, **kwargs):
+    DimensionStatsService.change([DimensionStatsService.instance_keys(instance)], students=-1)
+
+
+@receiver(pre_save, sender=Group)
+def group_old_faculty(sender, instance, **kwargs):
+    if instance.pk and not instance._state.adding:
+        instance.old_faculty_id = Group.objects.filter(pk=instance.pk).values_list('faculty_id', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+def group_faculty_stats(sender, instance, created, **kwargs):
+    old_faculty_id = getattr(instance, 'old_faculty_id', None)
+    if not created and old_faculty_id != instance.faculty_id:
+        # the group takes its students along, recount both faculties
+        DimensionStatsService.recompute('faculty', {old_faculty_id, instance.faculty_id} - {None})
+
+
+def dimension_deleted(sender, instance, **kwargs):
+    DimensionStats.objects.filter(dimension=sender._meta.model_name, key=instance.pk).delete()
+
+
+for dimension_model in (Group, Faculty, Country, Company):
+    post_delete.connect(dimension_deleted, sender=dimension_model,
+                        dispatch_uid=f'dimension_delete_{dimension_model.__name__}')
+
+
+@receiver(pre_save, sender=Student)
+def student_photo_uploaded(sender, instance, **kwargs):
+    # a new upload is not committed to the storage yet; it is saved as is and processed after the commit
+    instance.photo_uploaded = bool(instance.photo) and not instance.photo._committed
+    if instance.photo_uploaded or not instance.photo:
+        if instance.pk and not instance._state.adding:
+            # the copies of the replaced photo, removed once the new row is committed
+            old = Student.objects.filter(pk=instance.pk).values_list('photo_thumbs', flat=True).first()
+            if old:
+                transaction.on_commit(lambda: delete_photos(old))
+        instance.photo_status = 'pending' if instance.photo_uploaded else ''
+        instance.photo_thumbs = {}
+
+
+@receiver(post_save, sender=Student)
+def student_photo_process(sender, instance, **kwargs):
+    if getattr(instance, 'photo_uploaded', False):
+        PhotoService.schedule(instance.pk)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_search_changed(sender, instance, **kwargs):
+    StudentSearchIndex.students_changed([instance.student_id])
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted_stats(sender, instance, **kwargs):
+    # the loaded copy may be stale (checked out meanwhile), so the room and the student's rows are recounted
+    with transaction.atomic():
+        RoomService.recount_rooms([instance.room_id])
+        for keys in DimensionStatsService.student_keys(Student.objects.filter(pk=instance.student_id)):
+            for dimension, key in keys.items():
+                if key is not None:
+                    DimensionStatsService.recompute(dimension, [key])
+
+
 @receiver(post_save, sender=Booking)
 def add_room_person(sender, created, instance, **kwargs):
     pass
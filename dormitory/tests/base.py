@@ -0,0 +1,50 @@
+import datetime
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from commandant.models import Commandant
+from dormitory.models import (CustomUser, BookingStatus, Building, RoomType, Room, Country, Faculty, Group,
+                              StudentType, Company, Student)
+
+
+def seed():
+    # two buildings with two floors of three rooms each, twenty students of two groups, nobody settled yet
+    data = {}
+    data['admin'] = CustomUser.objects.create_user('admin@test.com', 'pw', first_name='A', last_name='A', role='1')
+    data['commandant'] = CustomUser.objects.create_user('com@test.com', 'pw', first_name='C', last_name='C', role='3')
+    for status_id, name in ((1, 'booking'), (2, 'process'), (3, 'canceling')):
+        BookingStatus.objects.create(id=status_id, name=name)
+    data['buildings'] = [Building.objects.create(name='B1', floor_count=2), Building.objects.create(name='B2')]
+    Commandant.objects.filter(user=data['commandant']).update(building=data['buildings'][1])
+    room_types = [RoomType.objects.create(place=2), RoomType.objects.create(place=3)]
+    data['rooms'] = [
+        Room.objects.create(number=f'{floor}0{number}', floor=floor, room_type=room_types[number % 2],
+                            building=building, user=data['admin'])
+        for building in data['buildings'] for floor in (1, 2) for number in (1, 2, 3)
+    ]
+    data['countries'] = [Country.objects.create(name='Tajikistan'), Country.objects.create(name='Uzbekistan')]
+    faculties = [Faculty.objects.create(name='Math'), Faculty.objects.create(name='Physics')]
+    data['groups'] = [Group.objects.create(name='M-1', faculty=faculties[0]),
+                      Group.objects.create(name='P-1', faculty=faculties[1])]
+    data['student_types'] = [StudentType.objects.create(type='local', price=100, day=3),
+                             StudentType.objects.create(type='foreigner', price=200, day=7)]
+    data['company'] = Company.objects.create(name='Acme')
+    data['students'] = [
+        Student.objects.create(name=f'Name{i}', last_name=f'Last{i}', born=datetime.date(2000, 1, 1),
+                               gender=str(i % 2), country=data['countries'][i % 2],
+                               student_type=data['student_types'][i % 2], group=data['groups'][i // 10],
+                               company=data['company'] if i % 5 == 0 else None, user=data['admin'])
+        for i in range(20)
+    ]
+    return data
+
+
+class DormitoryTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed()
+
+    def setUp(self):
+        cache.clear()
@@ -0,0 +1,77 @@
+import random
+from collections import Counter
+
+from django.test import SimpleTestCase
+
+from dormitory.models import Booking
+from dormitory.services.allocation import AllocationService, solve
+from .test_counters import CountersTestCase
+
+
+def make_students(count, seed=1):
+    generator = random.Random(seed)
+    return [{'id': index, 'gender': generator.choice('01'), 'group_id': generator.randint(1, 4),
+             'group__faculty_id': generator.randint(1, 2), 'country_id': generator.randint(1, 3),
+             'student_type_id': 1} for index in range(1, count + 1)]
+
+
+def make_rooms(count, seed=1):
+    generator = random.Random(seed)
+    rooms = []
+    for index in range(1, count + 1):
+        place = generator.choice((2, 3, 4))
+        person_count = generator.choice((0, 0, 1, place - 1, place))
+        rooms.append({'id': index, 'building_id': generator.randint(1, 2), 'floor': generator.randint(1, 3),
+                      'number': str(index), 'free_place': place - person_count, 'person_count': person_count,
+                      'room_gender': generator.choice('01') if person_count else '2'})
+    return rooms
+
+
+class SolveTest(SimpleTestCase):
+
+    def check(self, students, rooms):
+        assignments, unassigned = solve(students, rooms)
+        by_id = {room['id']: room for room in rooms}
+        genders = {student['id']: student['gender'] for student in students}
+        placed = Counter(assignment['room'] for assignment in assignments)
+        for room_id, count in placed.items():
+            self.assertLessEqual(count, by_id[room_id]['free_place'])
+            room_genders = {genders[a['student']] for a in assignments if a['room'] == room_id}
+            self.assertEqual(len(room_genders), 1)
+            if by_id[room_id]['person_count']:
+                self.assertEqual(room_genders, {by_id[room_id]['room_gender']})
+        self.assertEqual(sorted([a['student'] for a in assignments] + unassigned), sorted(genders))
+        return assignments, unassigned
+
+    def test_rooms_are_never_overfilled_or_mixed(self):
+        for seed in range(20):
+            self.check(make_students(60, seed), make_rooms(25, seed))
+
+    def test_same_input_in_any_order_gives_the_same_plan(self):
+        students, rooms = make_students(60), make_rooms(25)
+        expected = self.check(students, rooms)
+        for seed in range(5):
+            random.Random(seed).shuffle(students)
+            random.Random(seed + 100).shuffle(rooms)
+            self.assertEqual(solve(students, rooms), expected)
+
+    def test_nobody_is_left_out_while_a_usable_bed_is_free(self):
+        students, rooms = make_students(30), make_rooms(40)
+        assignments, unassigned = self.check(students, rooms)
+        self.assertEqual(unassigned, [])
+
+
+class AllocateTest(CountersTestCase):
+
+    def test_dry_run_plan_is_what_gets_booked(self):
+        students = AllocationService.students(group=self.data['groups'][0].id)
+        rooms = AllocationService.rooms(building=self.data['buildings'][0].id)
+        plan = AllocationService.allocate(students, rooms, self.data['admin'].id, dry_run=True)
+        self.assertFalse(Booking.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            result = AllocationService.allocate(students, rooms, self.data['admin'].id)
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['created'], len(plan['assignments']))
+        self.assertEqual(sorted(Booking.objects.values_list('student_id', 'room_id')),
+                         sorted((a['student'], a['room']) for a in plan['assignments']))
+        self.assertCountersMatch()
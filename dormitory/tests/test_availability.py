@@ -0,0 +1,43 @@
+from django.core.cache import cache
+
+from dormitory.models import Room
+from dormitory.services.availability import AvailabilityIndex
+from .base import DormitoryTestCase
+
+
+def person_count(room_id):
+    room = next(room for room in AvailabilityIndex.rooms() if room['id'] == room_id)
+    return room['person_count']
+
+
+class AvailabilityIndexTest(DormitoryTestCase):
+
+    def test_copy_loaded_before_a_commit_is_not_served(self):
+        room = self.data['rooms'][0]
+        AvailabilityIndex.rebuild()
+        # a reader takes the keys and loads the rooms, then a writer commits and bumps the building
+        keys = AvailabilityIndex.building_keys([room.building_id])
+        stale = AvailabilityIndex.load_buildings([room.building_id])
+        Room.objects.filter(pk=room.pk).update(person_count=1)
+        AvailabilityIndex.refresh_rooms([room.pk])
+        AvailabilityIndex.store(keys, stale)
+        self.assertEqual(person_count(room.pk), 1)
+
+    def test_two_writers_in_one_building_are_both_seen(self):
+        first, second = self.data['rooms'][0], self.data['rooms'][3]
+        self.assertEqual(first.building_id, second.building_id)
+        self.assertNotEqual(first.floor, second.floor)
+        AvailabilityIndex.rebuild()
+        Room.objects.filter(pk=first.pk).update(person_count=1)
+        Room.objects.filter(pk=second.pk).update(person_count=2)
+        AvailabilityIndex.refresh_rooms([first.pk])
+        AvailabilityIndex.refresh_rooms([second.pk])
+        self.assertEqual((person_count(first.pk), person_count(second.pk)), (1, 2))
+        self.assertEqual(AvailabilityIndex.check(), [])
+
+    def test_evicted_version_does_not_reuse_old_entries(self):
+        room = self.data['rooms'][0]
+        AvailabilityIndex.rebuild()
+        Room.objects.filter(pk=room.pk).update(person_count=2)
+        cache.delete(AvailabilityIndex.version_key(room.building_id))
+        self.assertEqual(person_count(room.pk), 2)
@@ -0,0 +1,179 @@
+import datetime
+import threading
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Sum
+from django.test import TransactionTestCase, skipUnlessDBFeature
+from rest_framework.exceptions import APIException
+from rest_framework.test import APIClient
+
+from accounts.services.account_service import PaymentService
+from dormitory.filters import BookFilter
+from dormitory.models import Booking, Payment
+from dormitory.services.booking import BookingService
+from dormitory.services.debt_aging import DebtAgingService
+from .base import DormitoryTestCase, seed
+from .test_counters import CountersTestCase
+
+
+class UnBookingTest(DormitoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        student = self.data['students'][0]
+        room = next(room for room in self.data['rooms'] if room.room_gender in ('2', student.gender))
+        BookingService.bulk_add_students([{'student': student.id, 'room': room.id,
+                                           'book_date': datetime.date(2023, 9, 1)}], self.data['admin'].id)
+        self.book = Booking.objects.get(student=student)
+
+    def test_payment_between_load_and_checkout_is_kept(self):
+        # the view loads the booking before un_booking takes the lock
+        stale = Booking.objects.select_related('student__student_type').get(pk=self.book.pk)
+        PaymentService.pay_logic({'booking': self.book, 'amount': Decimal(200), 'bill': '1',
+                                  'payed_date': datetime.datetime(2023, 10, 1, 12)})
+        BookingService.un_booking(stale, '2023-10-15')
+
+        book = Booking.objects.get(pk=self.book.pk)
+        paid = Payment.objects.filter(booking=book).aggregate(total=Sum('amount'))['total']
+        self.assertEqual(book.payed, paid)
+        self.assertEqual(book.payed, Decimal(200))
+        self.assertEqual(book.debt, book.total_price - book.payed)
+        self.assertEqual(book.status_id, 2)
+        self.assertEqual(book.book_end, datetime.date(2023, 10, 15))
+
+
+class DebtFilterTest(DormitoryTestCase):
+
+    def test_overpaid_checkout_counts_as_settled(self):
+        student = self.data['students'][0]
+        room = next(room for room in self.data['rooms'] if room.room_gender in ('2', student.gender))
+        BookingService.bulk_add_students([{'student': student.id, 'room': room.id,
+                                           'book_date': datetime.date(2023, 9, 1)}], self.data['admin'].id)
+        book = Booking.objects.get(student=student)
+        PaymentService.pay_logic({'booking': book, 'amount': book.total_price, 'bill': '1',
+                                  'payed_date': datetime.datetime(2023, 9, 2, 12)})
+        # an early checkout reprices the contract below what was already paid
+        BookingService.un_booking(book, '2023-09-10')
+        self.assertLess(Booking.objects.get(pk=book.pk).debt, 0)
+
+        settled = BookFilter({'debt': 1}, queryset=Booking.objects.all()).qs
+        owing = BookFilter({'debt': 2}, queryset=Booking.objects.all()).qs
+        self.assertEqual(list(settled.values_list('id', flat=True)), [book.pk])
+        self.assertFalse(owing.exists())
+
+
+class DebtAgingTest(DormitoryTestCase):
+
+    def test_buckets_are_ordered_by_size(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        pairs = [(students[0], rooms[0]), (students[2], rooms[0]), (students[4], rooms[0]), (students[6], rooms[2]),
+                 (students[8], rooms[2])]
+        rows = [{'student': student.id, 'room': room.id, 'book_date': datetime.date(2023, 9, 1)} for student, room in pairs]
+        BookingService.bulk_add_students(rows, self.data['admin'].id)
+        today = datetime.date(2024, 1, 1)
+        debts = [(6000, 100), (2000, 10), (700, 10), (100, 10), (6000, 40)]
+        for book, (debt, days) in zip(Booking.objects.order_by('id'), debts):
+            Booking.objects.filter(pk=book.pk).update(debt=debt, last_payed=today - datetime.timedelta(days=days))
+        report = DebtAgingService.report(Booking.objects.all(), today)
+        self.assertEqual([(row['debt_bucket'], row['age_bucket'], row['count']) for row in report],
+                         [('0-500', '0-30', 1), ('500-1000', '0-30', 1), ('1000-5000', '0-30', 1),
+                          ('5000+', '31-60', 1), ('5000+', '90+', 1)])
+
+
+class BulkBookingTest(CountersTestCase):
+
+    def test_rows_over_capacity_or_gender_are_rejected(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        double = rooms[1]
+        self.assertEqual(double.room_type.place, 2)
+        rows = [{'student': student.id, 'room': double.id, 'book_date': datetime.date(2023, 9, 1)}
+                for student in (students[0], students[1], students[2], students[4], students[0])]
+        with self.captureOnCommitCallbacks(execute=True):
+            result = BookingService.bulk_add_students(rows, self.data['admin'].id)
+        self.assertEqual(result['created'], 2)
+        self.assertEqual([(error['row'], list(error['errors'])) for error in result['errors']],
+                         [(1, ['gender']), (3, ['room']), (4, ['student', 'room'])])
+        self.assertEqual(set(Booking.objects.filter(room=double).values_list('student_id', flat=True)),
+                         {students[0].id, students[2].id})
+        self.assertCountersMatch()
+
+    def test_body_must_be_an_object(self):
+        client = APIClient()
+        client.force_authenticate(self.data['admin'])
+        row = {'student': self.data['students'][0].id, 'room': self.data['rooms'][0].id}
+        self.assertEqual(client.post('/api/booking/bulk', [row], format='json').status_code, 400)
+        self.assertEqual(client.post('/api/booking/bulk', {'bookings': row}, format='json').status_code, 400)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_student_is_booked_once(self):
+        student, room = self.data['students'][0], self.data['rooms'][0]
+        book = {'student': student, 'room': room, 'privilege': None, 'book_date': datetime.date(2023, 9, 1)}
+        BookingService.add_student(dict(book), self.data['admin'].id)
+        with self.assertRaises(APIException):
+            BookingService.add_student(dict(book, room=self.data['rooms'][2]), self.data['admin'].id)
+        self.assertEqual(Booking.objects.filter(student=student).count(), 1)
+        self.assertCountersMatch()
+
+
+class CheckoutTest(CountersTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.data['admin'])
+
+    def test_floor_needs_a_building(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        self.book((students[0], rooms[0]), (students[1], rooms[6]))
+        response = self.client.post('/api/booking/checkout', {'floor': 1, 'book_end': '2023-12-31'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Booking.objects.filter(status_id=1).count(), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/booking/checkout', {'building': rooms[0].building_id, 'floor': 1,
+                                                                  'book_end': '2023-12-31'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data'], {'closed': 1, 'rooms': 1})
+        self.assertCountersMatch()
+
+    def test_end_before_a_book_date_changes_nothing(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        books = self.book((students[0], rooms[0]), (students[2], rooms[0]))
+        Booking.objects.filter(pk=books[1].pk).update(book_date=datetime.date(2023, 11, 1))
+        response = self.client.post('/api/booking/checkout', {'building': rooms[0].building_id,
+                                                              'book_end': '2023-10-01'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Booking.objects.filter(status_id=1).count(), 2)
+        self.assertCountersMatch()
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentBookingTest(TransactionTestCase):
+
+    def test_parallel_requests_do_not_overfill_a_room(self):
+        data = seed()
+        room = data['rooms'][1]
+        students = [student for student in data['students'] if student.gender == '0'][:6]
+        barrier = threading.Barrier(len(students))
+        results = []
+
+        def book(student):
+            try:
+                barrier.wait()
+                BookingService.add_student({'student': student, 'room': room, 'privilege': None,
+                                            'book_date': datetime.date(2023, 9, 1)}, data['admin'].id)
+                results.append('ok')
+            except APIException:
+                results.append('full')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(student,)) for student in students]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), ['full'] * 4 + ['ok'] * 2)
+        room.refresh_from_db()
+        self.assertEqual(room.person_count, 2)
+        self.assertEqual(Booking.objects.filter(room=room).count(), 2)
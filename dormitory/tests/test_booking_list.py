@@ -0,0 +1,52 @@
+import datetime
+import json
+from decimal import Decimal
+
+from rest_framework.test import APIClient
+from rest_framework.utils.encoders import JSONEncoder
+
+from accounts.services.account_service import PaymentService
+from dormitory import serializers
+from dormitory.models import Booking, Privilege
+from dormitory.services.booking import BookingService
+from .base import DormitoryTestCase
+
+
+def plain(data):
+    return json.loads(json.dumps(data, cls=JSONEncoder))
+
+
+class BookingListTest(DormitoryTestCase):
+    # the joined values() rows must give exactly what the serializers gave per instance
+
+    def setUp(self):
+        super().setUp()
+        students, rooms = self.data['students'], self.data['rooms']
+        privilege = Privilege.objects.create(name='Orphan')
+        rows = [{'student': students[0].id, 'room': rooms[0].id, 'book_date': datetime.date(2023, 9, 1)},
+                {'student': students[2].id, 'room': rooms[0].id, 'book_date': datetime.date(2023, 9, 15),
+                 'privilege': privilege.id},
+                {'student': students[1].id, 'room': rooms[6].id, 'book_date': datetime.date(2024, 1, 31)}]
+        BookingService.bulk_add_students(rows, self.data['admin'].id)
+        books = list(Booking.objects.order_by('id'))
+        PaymentService.pay_logic({'booking': books[0], 'amount': Decimal('150.50'), 'bill': '1',
+                                  'payed_date': datetime.datetime(2023, 9, 2, 12)})
+        BookingService.un_booking(books[2], '2024-03-31')
+        self.client = APIClient()
+        self.client.force_authenticate(self.data['admin'])
+
+    def test_booking_list_matches_book_serializer(self):
+        response = self.client.get('/api/booking')
+        expected = serializers.BookSerializer(
+            Booking.objects.select_related('room__building', 'student__country', 'student__group', 'user')
+            .order_by('created_at'), many=True).data
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(plain(response.data['results']), plain(expected))
+
+    def test_contract_list_matches_contract_serializer(self):
+        response = self.client.get('/api/contract')
+        expected = serializers.ContractSerializer(
+            Booking.objects.filter(user=self.data['admin']).order_by('-created_at'), many=True).data
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(plain(response.data['results']), plain(expected))
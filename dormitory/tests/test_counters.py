@@ -0,0 +1,214 @@
+import datetime
+
+from django.db.models import Count
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.test import APIClient
+
+from dormitory.models import (Booking, BuildingStats, DimensionStats, Faculty, Group, OccupancySnapshot, Room,
+                              Student)
+from dormitory.services.availability import AvailabilityIndex
+from dormitory.services.booking import BookingService
+from dormitory.services.building_stats import BuildingStatsService, STATS_FIELDS as BUILDING_FIELDS
+from dormitory.services.dimension_stats import DimensionStatsService, DIMENSIONS, STATS_FIELDS as DIMENSION_FIELDS
+from dormitory.services.occupancy import OccupancySnapshotService, SNAPSHOT_FIELDS
+from dormitory.services.room_service import RoomService
+from .base import DormitoryTestCase
+
+
+# the stored counters must always equal a recount from the bookings
+class CountersTestCase(DormitoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        BuildingStatsService.recompute()
+        DimensionStatsService.recompute()
+
+    def book(self, *pairs):
+        rows = [{'student': student.id, 'room': room.id, 'book_date': datetime.date(2023, 9, 1)}
+                for student, room in pairs]
+        with self.captureOnCommitCallbacks(execute=True):
+            result = BookingService.bulk_add_students(rows, self.data['admin'].id)
+        self.assertEqual(result['errors'], [])
+        return list(Booking.objects.filter(student__in=[student for student, _ in pairs]).order_by('id'))
+
+    def assertCountersMatch(self):
+        stored = {row['building_id']: {field: row[field] for field in BUILDING_FIELDS}
+                  for row in BuildingStats.objects.values('building_id', *BUILDING_FIELDS)}
+        self.assertEqual(stored, BuildingStatsService.compute())
+        for dimension in DIMENSIONS:
+            stored = {row['key']: {field: row[field] for field in DIMENSION_FIELDS}
+                      for row in DimensionStats.objects.filter(dimension=dimension).values('key', *DIMENSION_FIELDS)}
+            self.assertEqual(stored, DimensionStatsService.compute(dimension), dimension)
+        counts = dict(Booking.objects.filter(status_id=1).values('room_id').annotate(total=Count('id'))
+                      .values_list('room_id', 'total'))
+        for room in Room.objects.select_related('room_type'):
+            self.assertEqual(room.person_count, counts.get(room.id, 0), room.id)
+            self.assertEqual(room.is_full, room.person_count >= room.room_type.place, room.id)
+        self.assertEqual(AvailabilityIndex.check(), [])
+
+
+class BookingCountersTest(CountersTestCase):
+
+    def test_booking_and_checkout(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        AvailabilityIndex.rebuild()
+        books = self.book((students[0], rooms[0]), (students[2], rooms[0]), (students[1], rooms[6]))
+        self.assertCountersMatch()
+        with self.captureOnCommitCallbacks(execute=True):
+            BookingService.un_booking(books[0], '2023-10-01')
+        self.assertCountersMatch()
+
+    def test_deleting_an_active_booking(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        AvailabilityIndex.rebuild()
+        books = self.book((students[0], rooms[1]), (students[2], rooms[1]), (students[1], rooms[6]))
+        client = APIClient()
+        client.force_authenticate(self.data['admin'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.delete(f'/api/booking/{books[0].pk}')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Booking.objects.filter(pk=books[0].pk).exists())
+        self.assertCountersMatch()
+
+    def test_deleting_a_booking_checked_out_after_it_was_loaded(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        book, = self.book((students[0], rooms[0]))
+        stale = Booking.objects.get(pk=book.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            BookingService.un_booking(book, '2023-10-01')
+        with self.captureOnCommitCallbacks(execute=True):
+            stale.delete()
+        self.assertCountersMatch()
+
+
+class TransferCountersTest(CountersTestCase):
+
+    def test_transfer_between_buildings(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        AvailabilityIndex.rebuild()
+        book, other = self.book((students[0], rooms[0]), (students[1], rooms[6]))
+        with self.captureOnCommitCallbacks(execute=True):
+            RoomService.transfer(book.pk, rooms[7].id)
+        self.assertEqual(Booking.objects.get(pk=book.pk).room_id, rooms[7].id)
+        self.assertCountersMatch()
+        # a man can not move into the room the woman now lives in
+        with self.assertRaises(APIException):
+            RoomService.transfer(other.pk, rooms[7].id)
+        self.assertCountersMatch()
+
+    def test_move_many_swaps_two_full_rooms(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        women, men = rooms[1], rooms[4]
+        AvailabilityIndex.rebuild()
+        books = self.book((students[0], women), (students[2], women), (students[1], men), (students[3], men))
+        moves = [{'booking': book.pk, 'room': men.id if book.room_id == women.id else women.id} for book in books]
+        with self.captureOnCommitCallbacks(execute=True):
+            result = RoomService.move_many(moves)
+        self.assertEqual(result, {'moved': 4, 'rooms': 2})
+        self.assertEqual(Room.objects.get(pk=women.pk).room_gender, '1')
+        self.assertEqual(Room.objects.get(pk=men.pk).room_gender, '0')
+        self.assertCountersMatch()
+
+    def test_move_many_over_capacity_changes_nothing(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        books = self.book((students[0], rooms[0]), (students[2], rooms[0]), (students[4], rooms[2]))
+        before = list(Booking.objects.order_by('id').values_list('id', 'room_id'))
+        with self.assertRaises(ValidationError):
+            RoomService.move_many([{'booking': book.pk, 'room': rooms[1].id} for book in books])
+        self.assertEqual(list(Booking.objects.order_by('id').values_list('id', 'room_id')), before)
+        self.assertCountersMatch()
+
+    def test_move_body_must_be_an_object(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        book, = self.book((students[0], rooms[0]))
+        client = APIClient()
+        client.force_authenticate(self.data['admin'])
+        response = client.post('/api/contract/move', [{'booking': book.pk, 'room': rooms[2].id}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Booking.objects.get(pk=book.pk).room_id, rooms[0].id)
+
+
+class DimensionCountersTest(CountersTestCase):
+
+    def test_student_edits_and_deletes(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        self.book((students[0], rooms[0]), (students[10], rooms[0]))
+        student = Student.objects.get(pk=students[0].pk)
+        student.group, student.country, student.company = self.data['groups'][1], self.data['countries'][1], None
+        student.save()
+        self.assertCountersMatch()
+        Student.objects.get(pk=students[4].pk).delete()
+        self.assertCountersMatch()
+
+    def test_group_moved_to_another_faculty(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        self.book((students[0], rooms[0]))
+        group = Group.objects.get(pk=self.data['groups'][0].pk)
+        other = self.data['groups'][1].faculty_id
+        DimensionStats.objects.filter(dimension='faculty', key=other).update(students=-1)
+        group.faculty = Faculty.objects.create(name='Chemistry')
+        group.save()
+        # only the old and the new faculty are recounted
+        self.assertEqual(DimensionStats.objects.get(dimension='faculty', key=other).students, -1)
+        DimensionStatsService.recompute('faculty', [other])
+        self.assertCountersMatch()
+
+    def test_group_rename_does_not_recount(self):
+        group = Group.objects.get(pk=self.data['groups'][0].pk)
+        group.name = 'Renamed'
+        # the old faculty and the update, no stats queries
+        with self.assertNumQueries(2):
+            group.save()
+        self.assertCountersMatch()
+
+    def test_bulk_checkout(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        self.book((students[0], rooms[0]), (students[2], rooms[0]), (students[1], rooms[6]), (students[12], rooms[2]))
+        with self.captureOnCommitCallbacks(execute=True):
+            BookingService.bulk_un_booking(Booking.objects.filter(student__group=self.data['groups'][0]),
+                                           datetime.date(2023, 12, 31))
+        self.assertEqual(Booking.objects.filter(status_id=1).count(), 1)
+        self.assertCountersMatch()
+
+
+class OccupancyCountersTest(CountersTestCase):
+
+    def recount(self, day):
+        # every room and booking checked one by one
+        stats = {}
+        for room in Room.objects.select_related('room_type'):
+            floor = stats.setdefault((room.building_id, room.floor), dict.fromkeys(SNAPSHOT_FIELDS, 0))
+            floor['beds'] += room.room_type.place
+        for book in Booking.objects.select_related('room', 'student'):
+            if book.book_date <= day and (book.status_id == 1 or book.book_end >= day):
+                floor = stats[book.room.building_id, book.room.floor]
+                floor['busy'] += 1
+                floor['men' if book.student.gender == '1' else 'women'] += 1
+        return stats
+
+    def test_snapshots_match_a_recount(self):
+        students, rooms = self.data['students'], self.data['rooms']
+        books = self.book((students[0], rooms[0]), (students[2], rooms[0]), (students[1], rooms[3]),
+                          (students[3], rooms[9]))
+        Booking.objects.filter(pk=books[2].pk).update(book_date=datetime.date(2023, 9, 3))
+        with self.captureOnCommitCallbacks(execute=True):
+            BookingService.un_booking(Booking.objects.get(pk=books[0].pk), '2023-09-02')
+        first, last = datetime.date(2023, 8, 31), datetime.date(2023, 9, 4)
+        self.assertEqual(OccupancySnapshotService.backfill(first, last), 5)
+        day = first
+        while day <= last:
+            stored = {(row.building_id, row.floor): {field: getattr(row, field) for field in SNAPSHOT_FIELDS}
+                      for row in OccupancySnapshot.objects.filter(date=day)}
+            self.assertEqual(stored, self.recount(day), day)
+            day += datetime.timedelta(days=1)
+
+        client = APIClient()
+        client.force_authenticate(self.data['admin'])
+        response = client.get('/api/building/occupancy', {'start_date': '2023-09-02', 'end_date': '2023-09-03',
+                                                          'building': rooms[0].building_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['date'], row['busy']) for row in response.data['data']],
+                         [('2023-09-02', 2), ('2023-09-03', 2)])
+        self.assertEqual(client.get('/api/building/occupancy', {'start_date': '2023-09'}).status_code, 400)
+        self.assertEqual(client.get('/api/building/occupancy', {'start_date': '2023-09-01', 'end_date': '2023-09-02',
+                                                                'floor': 'x'}).status_code, 400)
@@ -0,0 +1,97 @@
+import datetime
+import shutil
+import tempfile
+
+from django.core.files.storage import default_storage
+from django.test import override_settings
+from django.utils import timezone
+from openpyxl import load_workbook
+from rest_framework.test import APIClient
+
+from dormitory.models import ExportJob
+from dormitory.services.export_jobs import ExportJobService, EXPORTS, LEASE
+from .base import DormitoryTestCase
+from .test_counters import CountersTestCase
+
+
+class ExportJobLeaseTest(DormitoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def job(self, **fields):
+        return ExportJob.objects.create(kind='country', user=self.data['admin'], **fields)
+
+    def test_job_of_a_crashed_worker_is_run_again(self):
+        crashed = self.job(status='running', started_at=timezone.now() - LEASE - datetime.timedelta(minutes=1))
+        legacy = self.job(status='running')
+        alive = self.job(status='running', started_at=timezone.now())
+        # what export_worker does on every poll, without its threads
+        self.assertEqual(ExportJobService.requeue_stale(), 2)
+        self.assertEqual(set(ExportJobService.pending_ids()), {crashed.pk, legacy.pk})
+        for job_id in ExportJobService.pending_ids():
+            ExportJobService.run(job_id)
+        for job in (crashed, legacy):
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'done')
+            self.assertTrue(default_storage.exists(job.file.name))
+        alive.refresh_from_db()
+        self.assertEqual(alive.status, 'running')
+
+    def test_run_that_lost_its_lease_does_not_overwrite_the_job(self):
+        job = self.job()
+        original = EXPORTS['country']
+
+        def taken_over(params, user):
+            # the lease runs out while the sheet is built and another worker takes the job
+            ExportJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - LEASE * 2)
+            ExportJobService.requeue_stale()
+            ExportJob.objects.filter(pk=job.pk).update(status='running', started_at=timezone.now())
+            return original(params, user)
+
+        EXPORTS['country'] = taken_over
+        self.addCleanup(EXPORTS.__setitem__, 'country', original)
+        ExportJobService.run(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'running')
+        self.assertEqual(job.file.name, '')
+
+
+class ExportScopeTest(CountersTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        students, rooms = self.data['students'], self.data['rooms']
+        self.book((students[0], rooms[0]), (students[2], rooms[0]), (students[1], rooms[6]))
+
+    def exported_buildings(self, kind, user):
+        job = ExportJob.objects.create(kind=kind, user=user)
+        ExportJobService.run(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done', job.error)
+        with job.file.open('rb') as file:
+            rows = list(load_workbook(file, read_only=True).active.iter_rows(min_row=2, values_only=True))
+        return sorted(row[2 if kind == 'booking' else 1] for row in rows)
+
+    def test_commandant_exports_its_building_only(self):
+        own = self.data['buildings'][1].name
+        self.assertEqual(self.exported_buildings('booking', self.data['commandant']), [own])
+        self.assertEqual(self.exported_buildings('aging', self.data['commandant']), [own])
+        everything = sorted([self.data['buildings'][0].name] * 2 + [own])
+        self.assertEqual(self.exported_buildings('booking', self.data['admin']), everything)
+
+        client = APIClient()
+        client.force_authenticate(self.data['commandant'])
+        response = client.get('/api/booking/aging')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['room__building__name'] for row in response.data['data']}, {own})
@@ -0,0 +1,83 @@
+from django.db import IntegrityError
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from dormitory.models import Student, Country
+from dormitory.exceptions import duplicate_names_as, is_duplicate_name
+from dormitory.serializers import CountrySerializer, StudentEditSerializer
+from .base import DormitoryTestCase
+
+
+class LegacyDuplicateTest(DormitoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.data['admin'])
+        # a duplicate from before the unique keys: same names, NULL name_key as left by the 0005 backfill
+        original = self.data['students'][0]
+        self.duplicate = Student.objects.create(
+            name=original.name + ' copy', last_name=original.last_name, born=original.born, gender=original.gender,
+            country=original.country, student_type=original.student_type, group=original.group,
+            user=self.data['admin'])
+        Student.objects.filter(pk=self.duplicate.pk).update(name=original.name, name_key=None)
+
+    def test_unrelated_edit_keeps_the_null_key(self):
+        response = self.client.patch(f'/api/student/{self.duplicate.pk}', {'phone': '123'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        student = Student.objects.get(pk=self.duplicate.pk)
+        self.assertEqual(student.phone, '123')
+        self.assertIsNone(student.name_key)
+
+    def test_rename_gets_a_key(self):
+        student = Student.objects.get(pk=self.duplicate.pk)
+        student.name = 'Renamed'
+        student.save()
+        self.assertEqual(Student.objects.get(pk=student.pk).name_key, 'renamed')
+
+    def test_reference_legacy_duplicate_can_be_saved(self):
+        Country.objects.create(name='Tajikistan x')
+        Country.objects.filter(name='Tajikistan x').update(name='Tajikistan', name_key=None)
+        country = Country.objects.get(name='Tajikistan', name_key=None)
+        country.save()
+        self.assertIsNone(Country.objects.get(pk=country.pk).name_key)
+
+
+class StudentBulkTest(DormitoryTestCase):
+
+    def test_body_must_be_an_object(self):
+        client = APIClient()
+        client.force_authenticate(self.data['admin'])
+        students = Student.objects.count()
+        self.assertEqual(client.post('/api/student/bulk', [{'name': 'New'}], format='json').status_code, 400)
+        self.assertEqual(client.post('/api/student/bulk', 'students', format='json').status_code, 400)
+        self.assertEqual(Student.objects.count(), students)
+
+
+class NameKeyRaceTest(DormitoryTestCase):
+
+    def test_name_taken_after_validation_is_a_bad_request(self):
+        serializer = CountrySerializer(data={'name': 'Kazakhstan'})
+        self.assertTrue(serializer.is_valid())
+        # a concurrent request inserts the same name between validate() and save()
+        Country.objects.create(name=' kazakhstan ')
+        with self.assertRaises(ValidationError):
+            serializer.save()
+        self.assertEqual(Country.objects.filter(name_key='kazakhstan').count(), 1)
+
+    def test_student_renamed_into_a_taken_name_after_validation(self):
+        first, second = self.data['students'][:2]
+        serializer = StudentEditSerializer(second, data={'name': 'Taken', 'last_name': 'Name'}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        Student.objects.filter(pk=first.pk).update(name='Taken', last_name='Name', name_key='taken',
+                                                   last_name_key='name')
+        with self.assertRaises(ValidationError):
+            serializer.save()
+
+    def test_other_integrity_errors_are_not_duplicates(self):
+        self.assertFalse(is_duplicate_name(IntegrityError('NOT NULL constraint failed: student.country_id')))
+        self.assertFalse(is_duplicate_name(IntegrityError('UNIQUE constraint failed: dimension_stats.key')))
+        with self.assertRaises(IntegrityError):
+            with duplicate_names_as({'error': 'duplicate'}):
+                Student.objects.create(name='No', last_name='Country', born=self.data['students'][0].born,
+                                       gender='0', user=self.data['admin'])
@@ -0,0 +1,54 @@
+import datetime
+
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from dormitory.models import Booking
+from dormitory.services.booking import BookingService
+from .base import DormitoryTestCase
+
+
+class CursorPaginationTest(DormitoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.data['admin'])
+
+    def walk(self, url):
+        # follows the next links, returns the ids of every page
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data['pagination']['next']
+        return pages
+
+    def test_cursor_pages_cover_the_numbered_pages(self):
+        cursor = self.walk('/api/student?pagination=cursor&page_size=3')
+        numbered = self.walk('/api/student?page_size=3')
+        self.assertEqual(cursor, numbered)
+        self.assertEqual(len(sum(cursor, [])), len(self.data['students']))
+
+    def book_half(self):
+        rows = [{'student': student.id, 'room': self.data['rooms'][index % 6].id,
+                 'book_date': datetime.date(2023, 9, 1)} for index, student in enumerate(self.data['students'][::2])]
+        self.assertEqual(BookingService.bulk_add_students(rows, self.data['admin'].id)['errors'], [])
+        return sorted(Booking.objects.values_list('id', flat=True))
+
+    def test_previous_link_returns_the_page_before(self):
+        self.book_half()
+        pages = self.walk('/api/booking?pagination=cursor&page_size=3')
+        response = self.client.get('/api/booking?pagination=cursor&page_size=3')
+        while response.data['pagination']['next']:
+            response = self.client.get(response.data['pagination']['next'])
+        previous = self.client.get(response.data['pagination']['previous'])
+        self.assertEqual([row['id'] for row in previous.data['results']], pages[-2])
+
+    def test_rows_with_the_same_position_are_neither_skipped_nor_repeated(self):
+        booking_ids = self.book_half()
+        Booking.objects.update(created_at=timezone.now())
+        ids = sum(self.walk('/api/booking?pagination=cursor&page_size=3'), [])
+        self.assertEqual(sorted(ids), booking_ids)
+        self.assertEqual(len(ids), len(set(ids)))
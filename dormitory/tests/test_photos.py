@@ -0,0 +1,53 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from PIL import Image
+
+from dormitory.models import Student
+from dormitory.services.photos import PhotoService
+from .base import DormitoryTestCase
+
+
+def upload(name, color):
+    buffer = BytesIO()
+    Image.new('RGB', (800, 600), color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class PhotoReplaceTest(DormitoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        schedule = mock.patch.object(PhotoService, 'schedule')
+        schedule.start()
+        self.addCleanup(schedule.stop)
+
+    def save_photo(self, photo):
+        student = Student.objects.get(pk=self.data['students'][0].pk)
+        student.photo = photo
+        with self.captureOnCommitCallbacks(execute=True):
+            student.save()
+        PhotoService.process(student.pk)
+        return Student.objects.get(pk=student.pk).photo_thumbs
+
+    def test_replaced_and_removed_photos_leave_no_copies(self):
+        first = self.save_photo(upload('first.jpg', 'red'))
+        self.assertEqual(len(first), 4)
+        self.assertTrue(all(default_storage.exists(name) for name in first.values()))
+
+        second = self.save_photo(upload('second.jpg', 'blue'))
+        self.assertTrue(all(default_storage.exists(name) for name in second.values()))
+        self.assertFalse(any(default_storage.exists(name) for name in first.values()))
+
+        self.assertEqual(self.save_photo(None), {})
+        self.assertFalse(any(default_storage.exists(name) for name in second.values()))
@@ -0,0 +1,53 @@
+import datetime
+from datetime import date, timedelta
+
+from django.test import SimpleTestCase
+
+from dormitory.services.pricing import billable_days, stay_price, stay_prices
+
+
+def loop_price(book_start, book_end, day):
+    # the day by day loop un_booking used before the closed form, kept as the reference
+    current_date = book_start
+    total_31 = 0
+    feb_add_day = 0
+    feb_last_day = 0
+    finish_end = book_end - timedelta(1) if book_end.day == 31 else book_end
+    while current_date <= finish_end:
+        if current_date.day == 31:
+            total_31 += 1
+        current_date += timedelta(days=1)
+        if current_date.month == 2:
+            next_month = (current_date.month % 12) + 1
+            feb_last_day = (datetime.datetime(current_date.year, next_month, 1) - timedelta(days=1)).day
+    if feb_last_day in [28, 29]:
+        feb_add_day = 30 - feb_last_day
+    total_days = (finish_end - book_start).days
+    return (total_days + feb_add_day + 1) * day - total_31 * day
+
+
+def days(first, last, step=1):
+    while first <= last:
+        yield first
+        first += timedelta(days=step)
+
+
+class StayPriceTest(SimpleTestCase):
+
+    def test_short_stays_around_february_match_the_loop(self):
+        starts = list(days(date(2022, 12, 20), date(2023, 3, 10))) + list(days(date(2023, 12, 20), date(2024, 3, 10)))
+        for start in starts:
+            for length in range(-3, 75):
+                end = start + timedelta(days=length)
+                self.assertEqual(stay_price(start, end, 3), loop_price(start, end, 3), (start, end))
+
+    def test_long_stays_match_the_loop(self):
+        for start in days(date(2022, 8, 25), date(2024, 9, 5), 5):
+            for length in range(60, 800, 23):
+                end = start + timedelta(days=length)
+                self.assertEqual(billable_days(start, end), loop_price(start, end, 1), (start, end))
+
+    def test_stay_prices_is_stay_price_per_row(self):
+        stays = [(date(2023, 9, 1), date(2024, 6, 30), 3), (date(2024, 1, 31), date(2024, 3, 31), 7),
+                 (date(2024, 2, 29), date(2024, 2, 29), 5)]
+        self.assertEqual(stay_prices(stays), [stay_price(*stay) for stay in stays])
@@ -0,0 +1,28 @@
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from dormitory.management.commands.query_plans import query_scans, sqlite_scans
+
+
+class QueryPlanTest(TestCase):
+
+    def test_endpoint_queries_do_not_scan_large_tables(self):
+        # the test tables are empty, so on mysql only scans without any usable index count
+        scans = query_scans(usable_index=connection.vendor == 'mysql')
+        self.assertTrue(scans)
+        self.assertEqual({name: tables for name, tables in scans.items() if tables}, {})
+
+
+class SqlitePlanTest(SimpleTestCase):
+
+    def test_only_scans_without_an_index_are_reported(self):
+        plan = '\n'.join([
+            '3 0 0 SCAN room USING INDEX room_building_floor_idx',
+            '5 0 0 SCAN student USING COVERING INDEX student_name_idx',
+            '7 0 0 SEARCH booking USING INDEX booking_status_room_idx (status_id=? AND room_id=?)',
+            '9 0 0 SCAN payment',
+            '11 0 0 SCAN TABLE group',
+            '13 0 0 SCAN CONSTANT ROW',
+            '15 0 0 USE TEMP B-TREE FOR ORDER BY',
+        ])
+        self.assertEqual(sqlite_scans(plan), ['payment', 'group', 'CONSTANT'])
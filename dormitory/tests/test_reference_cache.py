@@ -0,0 +1,29 @@
+from django.core.cache import cache
+
+from dormitory.models import Country
+from dormitory.services.reference_cache import ReferenceCache, VERSION_KEY
+from .base import DormitoryTestCase
+
+
+def country_names():
+    return ReferenceCache.get('countries', lambda: sorted(Country.objects.values_list('name', flat=True)))['data']
+
+
+class ReferenceCacheTest(DormitoryTestCase):
+
+    def test_write_is_seen(self):
+        self.assertEqual(country_names(), ['Tajikistan', 'Uzbekistan'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Country.objects.create(name='Kazakhstan')
+        self.assertEqual(country_names(), ['Kazakhstan', 'Tajikistan', 'Uzbekistan'])
+
+    def test_evicted_version_does_not_come_back_to_cached_lists(self):
+        country_names()
+        # the version is dropped, then a write lands before anybody reads it again
+        cache.delete(VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            Country.objects.create(name='Kazakhstan')
+        self.assertEqual(country_names(), ['Kazakhstan', 'Tajikistan', 'Uzbekistan'])
+        cache.delete(VERSION_KEY)
+        Country.objects.filter(name='Kazakhstan').update(name='Kyrgyzstan')
+        self.assertEqual(country_names(), ['Kyrgyzstan', 'Tajikistan', 'Uzbekistan'])
@@ -0,0 +1,79 @@
+import datetime
+from unittest import mock
+
+from dormitory.models import Student
+from dormitory.services.booking import BookingService
+from dormitory.services import student_search
+from dormitory.services.student_search import StudentSearchIndex
+from dormitory.utils.main_util import normalize_name
+from .base import DormitoryTestCase
+
+
+def ids(result):
+    return {student['id'] for student in result}
+
+
+class StudentSearchIndexTest(DormitoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        StudentSearchIndex.seq = None
+        StudentSearchIndex.rebuilding = False
+        StudentSearchIndex.keys, StudentSearchIndex.ids, StudentSearchIndex.students = [], [], {}
+
+    def test_missing_index_is_built_in_the_background(self):
+        with mock.patch('dormitory.services.student_search.worker.submit') as submit:
+            result = StudentSearchIndex.search('last1', 100)
+            StudentSearchIndex.search('last1', 100)
+        submit.assert_called_once_with(StudentSearchIndex.rebuild_task)
+        self.assertEqual(ids(result), ids(StudentSearchIndex.search_database('last1', 100)))
+        self.assertEqual(len(result), 11)
+
+    def test_index_matches_database(self):
+        StudentSearchIndex.rebuild()
+        for query in ('name', 'Name1', ' LAST 1', 'last19', 'nobody'):
+            prefix = normalize_name(query)
+            self.assertEqual(ids(StudentSearchIndex.search(query, 100)),
+                             ids(StudentSearchIndex.search_database(prefix, 100)), query)
+
+    def test_index_and_database_return_the_same_order(self):
+        StudentSearchIndex.rebuild()
+        # the last name matches before the name for some students
+        Student.objects.filter(pk=self.data['students'][5].pk).update(name='Lasta', name_key='lasta')
+        StudentSearchIndex.rebuild()
+        for query in ('la', 'last1', 'name', 'n'):
+            self.assertEqual(StudentSearchIndex.search(query, 6),
+                             StudentSearchIndex.search_database(normalize_name(query), 6), query)
+
+    def test_changes_are_read_outside_the_lock(self):
+        StudentSearchIndex.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            student = Student.objects.get(pk=self.data['students'][2].pk)
+            student.last_name = 'Other'
+            student.save()
+        locked = []
+        original = student_search.search_queryset
+
+        def checked():
+            locked.append(StudentSearchIndex.lock.locked())
+            return original()
+
+        with mock.patch('dormitory.services.student_search.search_queryset', checked):
+            self.assertEqual(ids(StudentSearchIndex.search('other', 100)), {student.id})
+        self.assertEqual(locked, [False])
+
+    def test_booked_and_renamed_students_are_replayed(self):
+        StudentSearchIndex.rebuild()
+        booked, renamed = self.data['students'][1], self.data['students'][2]
+        with self.captureOnCommitCallbacks(execute=True):
+            BookingService.bulk_add_students([{'student': booked.id, 'room': self.data['rooms'][0].id,
+                                               'book_date': datetime.date(2023, 9, 1)}], self.data['admin'].id)
+        with self.captureOnCommitCallbacks(execute=True):
+            student = Student.objects.get(pk=renamed.pk)
+            student.last_name = 'Other'
+            student.save()
+        with mock.patch('dormitory.services.student_search.worker.submit') as submit:
+            self.assertNotIn(booked.id, ids(StudentSearchIndex.search('last1', 100)))
+            self.assertNotIn(renamed.id, ids(StudentSearchIndex.search('last2', 100)))
+            self.assertIn(renamed.id, ids(StudentSearchIndex.search('other', 100)))
+        submit.assert_not_called()
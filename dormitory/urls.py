@@ -1,7 +1,7 @@
 from django.urls import path
 from .views import (CountryView, FacultyView, BuildingView, RoomTypeView, StudentView, RoomView,
                     PrivilegeView, BookView, FreePlaceApi, ManagerRegisterApi, StudentTypeApi, CompanyApi, GroupApi,
-                    CatApi, ContractDormApi, MainDormitoryApi)
+                    CatApi, ContractDormApi, MainDormitoryApi, ExportJobApi)
 from rest_framework.routers import DefaultRouter
 from accounts.views import PaymentApi
 
@@ -20,6 +20,7 @@ router.register(r'privilege', PrivilegeView, basename='privilege')
 router.register(r'company', CompanyApi, basename='company')
 router.register(r'group', GroupApi, basename='group')
 router.register(r'contract', ContractDormApi, basename='contract')
+router.register(r'export', ExportJobApi, basename='export')
 # account
 
 #dd
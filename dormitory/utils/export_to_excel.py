@@ -1,24 +1,53 @@
+import tempfile
 from datetime import datetime
-from datetime import timedelta
+from wsgiref.util import FileWrapper
+
 from openpyxl import Workbook
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from openpyxl.utils import get_column_letter
 
+CHUNK_SIZE = 2000
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
-def export_data(request, totals, book_name):
-    faculty_queryset = request
 
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    )
+def write_workbook(target, sheet_title, columns, rows, total_row=None):
+    # write-only mode streams rows to a temporary file, memory stays flat whatever the row count
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_title)
+
+    for col_num, (column_title, column_width) in enumerate(columns, 1):
+        column_letter = get_column_letter(col_num)
+        worksheet.column_dimensions[column_letter].width = column_width
+    worksheet.append([column_title for column_title, column_width in columns])
+
+    row_num = 1
+    for item, row in enumerate(rows, 1):
+        worksheet.append([item, *row])
+        row_num += 1
+
+    if total_row is not None:
+        # total label spans every column before the counters
+        worksheet.append(total_row)
+        last_label_column = get_column_letter(len(columns) - 2)
+        worksheet.merged_cells.add(f'A{row_num + 1}:{last_label_column}{row_num + 1}')
+
+    workbook.save(target)
+
+
+def workbook_response(book_name, sheet_title, columns, rows, total_row):
+    file = tempfile.TemporaryFile()
+    write_workbook(file, sheet_title, columns, rows, total_row)
+    file.seek(0)
+
+    response = StreamingHttpResponse(FileWrapper(file, 64 * 1024), content_type=XLSX_CONTENT_TYPE)
     response['Content-Disposition'] = 'attachment; filename={date}-{book_name}.xlsx'.format(
         date=datetime.now().strftime('%Y-%m-%d'),
         book_name=book_name
     )
-    workbook = Workbook()
+    return response
 
-    worksheet = workbook.active
-    worksheet.title = book_name.title()
+
+def data_sheet(queryset, totals, book_name):
     if book_name == 'faculty':
         title = 'Факультет'
     else:
@@ -31,52 +60,12 @@ def export_data(request, totals, book_name):
         ('Заселены', 15),
 
     ]
-    row_num = 1
-
-    for col_num, (column_title, column_width) in enumerate(columns, 1):
-        cell = worksheet.cell(row=row_num, column=col_num)
-        cell.value = column_title
-        column_letter = get_column_letter(col_num)
-        column_dimensions = worksheet.column_dimensions[column_letter]
-        column_dimensions.width = column_width
-
-    for item, faculty in enumerate(faculty_queryset):
-        row_num += 1
-
-        row = [
-            item + +1,
-            faculty.name,
-            faculty.student_count,
-            faculty.booking_count
-        ]
+    rows = queryset.values_list('name', 'student_count', 'booking_count').iterator(chunk_size=CHUNK_SIZE)
+    total_row = ['Общее количество', '', totals['student_total'], totals['book_total']]
+    return book_name.title(), columns, rows, total_row
 
-        for col_num, cell_value in enumerate(row, 1):
-            cell = worksheet.cell(row=row_num, column=col_num)
-            cell.value = cell_value
 
-    last_row = worksheet.max_row
-    worksheet.append(['Общее количество', '', totals['student_total'], totals['book_total']])
-    worksheet.merge_cells(f'A{last_row + 1}:B{last_row + 1}')
-
-    workbook.save(response)
-
-    return response
-
-
-def export_group(request, totals, book_name):
-    queryset = request
-
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    )
-    response['Content-Disposition'] = 'attachment; filename={date}-{book_name}.xlsx'.format(
-        date=datetime.now().strftime('%Y-%m-%d'),
-        book_name=book_name
-    )
-    workbook = Workbook()
-
-    worksheet = workbook.active
-    worksheet.title = book_name.title()
+def group_sheet(queryset, totals, book_name):
     if book_name == 'group':
         title = 'Группа'
     else:
@@ -90,34 +79,15 @@ def export_group(request, totals, book_name):
         ('Заселены', 15),
 
     ]
-    row_num = 1
-
-    for col_num, (column_title, column_width) in enumerate(columns, 1):
-        cell = worksheet.cell(row=row_num, column=col_num)
-        cell.value = column_title
-        column_letter = get_column_letter(col_num)
-        column_dimensions = worksheet.column_dimensions[column_letter]
-        column_dimensions.width = column_width
+    rows = queryset.values_list('name', 'faculty__name', 'student_count', 'booking_count') \
+        .iterator(chunk_size=CHUNK_SIZE)
+    total_row = ['Общее количество', '', '', totals['student_total'], totals['book_total']]
+    return book_name.title(), columns, rows, total_row
 
-    for item, data in enumerate(queryset):
-        row_num += 1
 
-        row = [
-            item ++1,
-            data.name,
-            data.faculty.name,
-            data.student_count,
-            data.booking_count
-        ]
-
-        for col_num, cell_value in enumerate(row, 1):
-            cell = worksheet.cell(row=row_num, column=col_num)
-            cell.value = cell_value
-
-    last_row = worksheet.max_row
-    worksheet.append(['Общее количество', '',        '', totals['student_total'], totals['book_total']])
-    worksheet.merge_cells(f'A{last_row + 1}:C{last_row + 1}')
+def export_data(request, totals, book_name):
+    return workbook_response(book_name, *data_sheet(request, totals, book_name))
 
-    workbook.save(response)
 
-    return response
+def export_group(request, totals, book_name):
+    return workbook_response(book_name, *group_sheet(request, totals, book_name))
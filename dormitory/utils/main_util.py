@@ -1,10 +1,18 @@
 from abc import ABC
-from rest_framework.pagination import PageNumberPagination
+from functools import partial
+from django.core.paginator import Paginator
+from hashlib import md5
+from django.core.cache import cache
+from django.db.models import QuerySet
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.response import Response
 
 from datetime import date
 import uuid
 
+COUNT_CACHE_TIMEOUT = 60
+
 
 def upload_path(prefix, instance, filename):
     ext = filename.split('.')[-1]
@@ -20,10 +28,81 @@ def upload_photo(instance, filename):
     return upload_path('student/diploma', instance, filename)
 
 
+def upload_export(instance, filename):
+    return upload_path('export', instance, filename)
+
+
+def normalize_name(value):
+    # case-folded with collapsed whitespace: "  Tajik  State " and "tajik state" are the same name
+    return ' '.join(str(value or '').split()).casefold()
+
+
+def body_list(data, name):
+    # bulk endpoints take {name: [...]}; a list or a plain value as the body is a bad request, not a 500
+    if not isinstance(data, dict):
+        raise ValidationError({name: f'Ожидается объект {{"{name}": [...]}}'})
+    return data.get(name)
+
+
+def cached_count(queryset):
+    # COUNT(*) over a large filtered table is as slow as the page itself, reuse it for a minute
+    key = 'count:' + md5(str(queryset.query).encode()).hexdigest()
+    return cache.get_or_set(key, queryset.count, COUNT_CACHE_TIMEOUT)
+
+
+class CountedPaginator(Paginator):
+    # paginator for views that already know the row count (e.g. from a rollup table) and can skip COUNT(*)
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
+
+
+class CustomCursorPagination(CursorPagination):
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        page_size = request.query_params.get('page_size', self.page_size)
+        if page_size is not None:
+            return min(int(page_size), self.max_page_size)
+        return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        # keyset on the ordering the view already uses: -id, created_at, -payed_date ...
+        ordering = tuple(field for field in queryset.query.order_by if isinstance(field, str))
+        if not ordering:
+            return ('-id',)
+        # rows with the same position are skipped by an offset, that needs a fixed order among them
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.total = cached_count(queryset) if request.query_params.get('total') else None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'pagination': {
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link(),
+                'total': self.total,
+                'page_size': self.page_size,
+                'current_page_number': None,
+                'total_pages': None,
+            },
+            'results': data,
+        })
+
+
 class CustomPagination(PageNumberPagination, ABC):
     page_size = 20
     max_page_size = 100
     page_size_query_param = 'page_size'
+    cursor_pagination = None
 
     def get_page_size(self, request):
         page_size = request.query_params.get('page_size', self.page_size)
@@ -31,7 +110,18 @@ class CustomPagination(PageNumberPagination, ABC):
             return min(int(page_size), self.max_page_size)
         return self.page_size
 
+    def paginate_queryset(self, queryset, request, view=None):
+        # ?pagination=cursor (or a cursor from a previous page) switches to keyset pagination, no OFFSET scans
+        use_cursor = request.query_params.get('pagination') == 'cursor' or 'cursor' in request.query_params
+        if use_cursor and isinstance(queryset, QuerySet):
+            self.cursor_pagination = CustomCursorPagination()
+            return self.cursor_pagination.paginate_queryset(queryset, request, view)
+        self.django_paginator_class = partial(CountedPaginator, count=getattr(view, 'total_count', None))
+        return super().paginate_queryset(queryset, request, view)
+
     def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
         return Response({
             'pagination': {
                 'next': self.get_next_link(),
@@ -0,0 +1,41 @@
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# longest side in pixels of every generated copy; 'original' is the normalized full photo
+PHOTO_SIZES = {
+    'original': 1600,
+    'large': 640,
+    'medium': 256,
+    'small': 64,
+}
+JPEG_QUALITY = 85
+
+
+def save_jpeg(image, name):
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def render_photo(name):
+    # decodes one stored upload and writes the normalized copy and the thumbnails next to it.
+    # no database access here, so it runs in the worker threads as well as in the backfill processes
+    with default_storage.open(name, 'rb') as file:
+        image = Image.open(file)
+        image.draft('RGB', (PHOTO_SIZES['original'], PHOTO_SIZES['original']))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    base = name.rsplit('.', 1)[0]
+    photos = {}
+    # largest first, every copy is resized from the previous one
+    for label, size in sorted(PHOTO_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.LANCZOS)
+        photos[label] = save_jpeg(image, f'{base}_{label}.jpg')
+    return photos
+
+
+def delete_photos(photos):
+    for name in photos.values():
+        default_storage.delete(name)
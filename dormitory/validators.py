@@ -1,18 +1,25 @@
 from rest_framework.exceptions import APIException
-from .models import (Building, RoomType, Faculty, CustomUser)
+from .models import (Building, RoomType, Faculty, CustomUser, Student)
+from .utils.main_util import normalize_name
 
 
-def common_validate(object, data, title):
-    main = object.objects.filter(name__iexact=data['name'])
-    if main:
+def name_taken(object, name, instance=None, **scope):
+    # a single probe on the unique name_key index
+    query = object.objects.filter(name_key=normalize_name(name), **scope)
+    if instance is not None:
+        query = query.exclude(pk=instance.pk)
+    return query.exists()
+
+
+def common_validate(object, data, title, instance=None):
+    if 'name' in data and name_taken(object, data['name'], instance):
         raise APIException({title: f'{data["name"]} уже добавлено'})
     return data
 
 
-def validate_building(data):
+def validate_building(data, instance=None):
     errors = []
-    building = Building.objects.filter(name__iexact=data['name'])
-    if building:
+    if 'name' in data and name_taken(Building, data['name'], instance):
         errors.append(f'{data["name"]} уже добавлено')
     return errors
 
@@ -26,22 +33,49 @@ def validate_room(data):
     return errors
 
 
-def validate_faculty(data):
+def validate_faculty(data, instance=None):
     errors = []
-    faculty = Faculty.objects.filter(name__iexact=data['name'])
-    if faculty:
+    if 'name' in data and name_taken(Faculty, data['name'], instance):
         errors.append(f'{data["name"]} уже добавлено')
     return errors
 
 
-def validate_city_country(data, object):
+def validate_city_country(data, object, instance=None):
     errors = []
-    country = object.objects.filter(name__iexact=data['name'])
-    if country:
+    if 'name' in data and name_taken(object, data['name'], instance):
         errors.append(f'{data["name"]} уже добавлено')
     return errors
 
 
+def student_key(data, instance=None):
+    name = data.get('name', getattr(instance, 'name', ''))
+    last_name = data.get('last_name', getattr(instance, 'last_name', ''))
+    return normalize_name(name), normalize_name(last_name)
+
+
+def student_taken(data, instance=None):
+    name_key, last_name_key = student_key(data, instance)
+    query = Student.objects.filter(name_key=name_key, last_name_key=last_name_key)
+    if instance is not None:
+        query = query.exclude(pk=instance.pk)
+    return query.exists()
+
+
+def taken_students(rows):
+    # batch check for imports: (name_key, last_name_key) pairs already stored or repeated inside `rows`
+    keys = [student_key(row) for row in rows]
+    stored = Student.objects.filter(name_key__in={key[0] for key in keys},
+                                    last_name_key__in={key[1] for key in keys}) \
+        .values_list('name_key', 'last_name_key')
+    taken = set(stored) & set(keys)
+    seen = set()
+    for key in keys:
+        if key in seen:
+            taken.add(key)
+        seen.add(key)
+    return taken
+
+
 def validate_register(data):
     errors = []
     user = CustomUser.objects.filter(first_name__iexact=data['first_name'],
@@ -1,22 +1,36 @@
 import datetime
 
 from django.contrib.auth import authenticate
-from django.db.models import Count, Sum, F, Exists, OuterRef, Q, ProtectedError
-from rest_framework.exceptions import APIException
+from django.http import FileResponse
+from django.db import transaction
+from django.db.models import F, Exists, OuterRef, Q, ProtectedError
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import APIException, ValidationError, NotFound
 from rest_framework.generics import get_object_or_404
-from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.parsers import FormParser, MultiPartParser, JSONParser
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import mixins, viewsets, generics
-from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import (Country, Faculty, Building, RoomType, Room, Student,
-                     Booking, Privilege, CustomUser, Company, Group, StudentType)
+                     Booking, Privilege, CustomUser, Company, Group, StudentType, ExportJob)
 from . import serializers
 from rest_framework.decorators import action
-from .utils import CustomPagination
+from .utils import CustomPagination, body_list
 from rest_framework.permissions import IsAuthenticated
+from .authentication import tokens_for_user, user_building, scope_bookings
 from .services.booking import BookingService
+from .services.room_service import RoomService
+from .services.availability import AvailabilityIndex
+from .services.export_jobs import EXPORTS, ExportJobService
+from .services.reference_cache import ReferenceCache, ReferenceListMixin
+from .services.student_search import StudentSearchIndex
+from .services.booking_list import BookingListService
+from .services.debt_aging import DebtAgingService
+from .services.dimension_stats import DimensionStatsService
+from .services.occupancy import OccupancySnapshotService
+from .services.floor_plan import FloorPlanService
+from .services.allocation import AllocationService
 from django_filters import rest_framework as filters
 from .filters import StudentFilter, FreeRoomFilter, BookFilter, RoomFilter, GroupFilter
 from .utils import export_to_excel
@@ -98,7 +112,7 @@ class LoginApi(mixins.CreateModelMixin,
                 else:
                     user_data = serializers.CommandantUserSerializer(user, many=False)
 
-                refresh = RefreshToken.for_user(user)
+                refresh = tokens_for_user(user)
                 data = {
                     'refresh': str(refresh),
                     'access': str(refresh.access_token),
@@ -142,7 +156,8 @@ class LoginApi(mixins.CreateModelMixin,
 #         return Response({'message': 'user not found'})
 
 
-class GroupApi(mixins.ListModelMixin,
+class GroupApi(ReferenceListMixin,
+               mixins.ListModelMixin,
                mixins.CreateModelMixin,
                mixins.UpdateModelMixin,
                mixins.DestroyModelMixin,
@@ -152,27 +167,20 @@ class GroupApi(mixins.ListModelMixin,
     permission_classes = (IsAuthenticated,)
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = GroupFilter
+    reference_name = 'group'
 
     @action(methods=['get'], detail=False)
     def total(self, request, *args, **kwargs):
-        group = Group.objects.annotate(
-            booking_count=Count('student__booking'),
-            student_count=Count('student'),
-        )
+        group = DimensionStatsService.annotate(Group.objects.select_related('faculty'), 'group')
         query = self.filter_queryset(group)
-        totals = query.aggregate(book_total=Sum('booking_count'), student_total=Sum('student_count'))
+        totals = DimensionStatsService.totals(query, 'group')
         serial = serializers.GroupCounterSerializer(query, many=True)
         return Response({'data': serial.data, 'totals': {'book_total': totals['book_total'],
                                                          'student_total': totals['student_total']}})
 
     @action(methods=['get'], detail=False)
     def export(self, request, *args, **kwargs):
-        group = Group.objects.annotate(
-            booking_count=Count('student__booking'),
-            student_count=Count('student'),
-        )
-        totals = group.aggregate(book_total=Sum('booking_count'), student_total=Sum('student_count'))
-        return export_to_excel.export_group(group, totals, 'group')
+        return export_to_excel.workbook_response('group', *EXPORTS['group'](request.query_params, request.user))
 
 
 class CompanyApi(mixins.ListModelMixin,
@@ -185,11 +193,8 @@ class CompanyApi(mixins.ListModelMixin,
 
     @action(methods=['get'], detail=False)
     def total(self, request, *args, **kwargs):
-        company = Company.objects.annotate(
-            booking_count=Count('student__booking'),
-            student_count=Count('student'),
-        )
-        totals = company.aggregate(book_total=Sum('booking_count'), student_total=Sum('student_count'))
+        company = DimensionStatsService.annotate(Company.objects.all(), 'company')
+        totals = DimensionStatsService.totals(company, 'company')
         serial = serializers.CompanyCounterSerializer(company, many=True)
         return Response({'data': serial.data, 'totals': {'book_total': totals['book_total'],
                                                          'student_total': totals['student_total']}})
@@ -206,12 +211,8 @@ class CountryView(mixins.ListModelMixin,
 
     @action(methods=['get'], detail=False)
     def total(self, request, *args, **kwargs):
-        country = Country.objects.annotate(
-            booking_count=Count('student__booking'),
-            student_count=Count('student__id'),
-        )
-
-        totals = country.aggregate(book_total=Sum('booking_count'), student_total=Sum('student_count'))
+        country = DimensionStatsService.annotate(Country.objects.all(), 'country')
+        totals = DimensionStatsService.totals(country, 'country')
         serial = serializers.CountryCounterSerializer(country, many=True)
         return Response({'data': serial.data, 'totals': {'book_total': totals['book_total'],
                                                          'student_total': totals['student_total']}})
@@ -228,12 +229,7 @@ class CountryView(mixins.ListModelMixin,
     @action(methods=['get'], detail=False)
     def export(self, request, *args, **kwargs):
         # time.sleep(1)
-        country = Country.objects.annotate(
-            booking_count=Count('student__booking'),
-            student_count=Count('student__id'),
-        )
-        totals = country.aggregate(book_total=Sum('booking_count'), student_total=Sum('student_count'))
-        return export_to_excel.export_data(country, totals, 'country')
+        return export_to_excel.workbook_response('country', *EXPORTS['country'](request.query_params, request.user))
 
 
 class StudentTypeApi(mixins.ListModelMixin,
@@ -262,23 +258,15 @@ class FacultyView(mixins.ListModelMixin,
 
     @action(methods=['get'], detail=False)
     def total(self, request, *args, **kwargs):
-        faculty = Faculty.objects.annotate(
-            booking_count=Count('group__student__booking'),
-            student_count=Count('group__student'),
-        )
-        totals = faculty.aggregate(book_total=Sum('booking_count'), student_total=Sum('student_count'))
+        faculty = DimensionStatsService.annotate(Faculty.objects.all(), 'faculty')
+        totals = DimensionStatsService.totals(faculty, 'faculty')
         serial = serializers.FacultyCounterSerializer(faculty, many=True)
         return Response({'data': serial.data, 'totals': {'book_total': totals['book_total'],
                                                          'student_total': totals['student_total']}})
 
     @action(methods=['get'], detail=False)
     def export(self, request, *args, **kwargs):
-        faculty = Faculty.objects.annotate(
-            booking_count=Count('student__booking'),
-            student_count=Count('student__id'),
-        )
-        totals = faculty.aggregate(book_total=Sum('booking_count'), student_total=Sum('student_count'))
-        return export_to_excel.export_data(faculty, totals, 'faculty')
+        return export_to_excel.workbook_response('faculty', *EXPORTS['faculty'](request.query_params, request.user))
 
     def destroy(self, request, *args, **kwargs):
         item_id = kwargs.get('pk')
@@ -290,7 +278,8 @@ class FacultyView(mixins.ListModelMixin,
             return Response({'data': f'Из этого факультета заселены студенты'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class BuildingView(mixins.ListModelMixin,
+class BuildingView(ReferenceListMixin,
+                   mixins.ListModelMixin,
                    mixins.CreateModelMixin,
                    mixins.UpdateModelMixin,
                    mixins.DestroyModelMixin,
@@ -298,6 +287,7 @@ class BuildingView(mixins.ListModelMixin,
     queryset = Building.objects.all()
     serializer_class = serializers.BuildingSerializer
     permission_classes = (IsAuthenticated,)
+    reference_name = 'building'
 
     def update(self, request, *args, **kwargs):
         build_id = kwargs.get('pk')
@@ -316,14 +306,46 @@ class BuildingView(mixins.ListModelMixin,
         except ProtectedError as e:
             return Response({'data': 'В этом здание есть комнаты'}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(methods=['get'], detail=True)
+    def floor_plan(self, request, *args, **kwargs):
+        role = self.request.user.role
+        if role not in ('1', '3'):
+            raise APIException({'error': 'You have no permission'})
+        building_id = kwargs.get('pk')
+        # a commandant only sees the building of the token
+        visible = building_id.isdigit() and (role == '1' or int(building_id) == user_building(self.request.user))
+        plan = FloorPlanService.plan(int(building_id)) if visible else None
+        if plan is None:
+            raise NotFound({'error': 'Здание не найдено'})
+        return Response({'data': plan})
 
-class RoomTypeView(mixins.ListModelMixin,
+    @action(methods=['get'], detail=False)
+    def occupancy(self, request, *args, **kwargs):
+        # daily beds and residents read from the nightly snapshots, optionally for one building or floor
+        query = request.query_params
+        try:
+            date_start = datetime.datetime.strptime(query.get('start_date', ''), '%Y-%m-%d').date()
+            date_end = datetime.datetime.strptime(query.get('end_date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            raise ValidationError({'date': 'Укажите start_date и end_date в формате ГГГГ-ММ-ДД'})
+        building = query.get('building')
+        floor = query.get('floor')
+        if not (building or '0').isdigit() or not (floor or '0').isdigit():
+            raise ValidationError({'building': 'building и floor должны быть числами'})
+        data = OccupancySnapshotService.series(date_start, date_end, int(building) if building else None,
+                                               int(floor) if floor else None)
+        return Response({'data': data})
+
+
+class RoomTypeView(ReferenceListMixin,
+                   mixins.ListModelMixin,
                    mixins.CreateModelMixin,
                    mixins.UpdateModelMixin,
                    mixins.DestroyModelMixin,
                    viewsets.GenericViewSet):
     queryset = RoomType.objects.all()
     serializer_class = serializers.RoomTypeSerializer
+    reference_name = 'room_type'
     # permission_classes = (IsAuthenticated,)
 
 
@@ -343,13 +365,13 @@ class RoomView(mixins.ListModelMixin,
         if self.request.user.role == '1':
             return Room.objects.select_related('room_type', 'user', 'building').order_by('-id')
         elif self.request.user.role == '3':
-            return Room.objects.filter(user=self.request.user).select_related('room_type', 'user', 'building').order_by(
+            return Room.objects.filter(user_id=self.request.user.id).select_related('room_type', 'user', 'building').order_by(
                 '-id')
         else:
             raise APIException({'error': 'you have no permission'})
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
 
     def update(self, request, *args, **kwargs):
         room_id = kwargs.get('pk')
@@ -374,8 +396,10 @@ class StudentView(mixins.ListModelMixin,
                   mixins.UpdateModelMixin,
                   mixins.DestroyModelMixin,
                   viewsets.GenericViewSet):
-    queryset = Student.objects.order_by('-id')
+    queryset = Student.objects.select_related('user').order_by('-id')
     # serializer_class = serializers.StudentSerializer
+    # json for the usual requests, multipart when a photo is uploaded
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
     pagination_class = CustomPagination
     permission_classes = (IsAuthenticated,)
     filter_backends = (filters.DjangoFilterBackend,)
@@ -390,7 +414,16 @@ class StudentView(mixins.ListModelMixin,
             return super().get_serializer_class()
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
+
+    @action(methods=['post'], detail=False)
+    def bulk(self, request, *args, **kwargs):
+        # duplicates across the whole import are found with one query, see StudentListSerializer
+        students = serializers.StudentSerializer(data=body_list(request.data, 'students'), many=True)
+        students.is_valid(raise_exception=True)
+        with transaction.atomic():
+            students.save(user_id=self.request.user.id)
+        return Response({'data': {'created': len(students.instance)}})
 
     def list(self, request, *args, **kwargs):
         student = self.filter_queryset(self.get_queryset())
@@ -410,14 +443,11 @@ class StudentView(mixins.ListModelMixin,
 
     @action(methods=['get'], detail=False)
     def categories(self, request):
-        faculty = serializers.FacultySerializer(Faculty.objects.all(), many=True)
-        country = serializers.CountrySerializer(Country.objects.all(), many=True)
-        student_type = serializers.StudentTypeSerializer(StudentType.objects.all(), many=True)
-        return Response({'data': {
-            'faculty': faculty.data,
-            'country': country.data,
-            'student_type': student_type.data
-        }})
+        return ReferenceCache.response(request, 'student_categories', lambda: {
+            'faculty': serializers.FacultySerializer(Faculty.objects.all(), many=True).data,
+            'country': serializers.CountrySerializer(Country.objects.all(), many=True).data,
+            'student_type': serializers.StudentTypeSerializer(StudentType.objects.all(), many=True).data
+        })
 
 
 class BookView(mixins.ListModelMixin,
@@ -441,15 +471,13 @@ class BookView(mixins.ListModelMixin,
                                               'user').order_by('created_at')
 
     def list(self, request, *args, **kwargs):
-        query = self.filter_queryset(self.get_queryset())
+        query = BookingListService.values(self.filter_queryset(self.get_queryset()), datetime.date.today())
         page = self.paginate_queryset(query)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            result = self.get_paginated_response(serializer.data)
+            result = self.get_paginated_response(BookingListService.to_representation(page))
             data = result.data  # pagination data
         else:
-            serializer = self.get_serializer(query, many=True)
-            data = serializer.data
+            data = BookingListService.to_representation(query)
         return Response(data)
 
     def create(self, request, *args, **kwargs):
@@ -460,6 +488,42 @@ class BookView(mixins.ListModelMixin,
         serial = serializers.FreeAddPlaceSerializer(book_data)
         return Response({'data': serial.data})
 
+    @action(methods=['post'], detail=False)
+    def bulk(self, request, *args, **kwargs):
+        books = serializers.BookBulkItemSerializer(data=body_list(request.data, 'bookings'), many=True)
+        books.is_valid(raise_exception=True)
+        result = BookingService.bulk_add_students(books.validated_data, self.request.user.id)
+        return Response({'data': result})
+
+    @action(methods=['post'], detail=False)
+    def checkout(self, request, *args, **kwargs):
+        checkout = serializers.BookCheckoutSerializer(data=request.data)
+        checkout.is_valid(raise_exception=True)
+        data = checkout.validated_data
+        query = Booking.objects.all()
+        if 'building' in data:
+            query = query.filter(room__building_id=data['building'])
+        if 'floor' in data:
+            query = query.filter(room__floor=data['floor'])
+        if 'group' in data:
+            query = query.filter(student__group_id=data['group'])
+        if 'ids' in data:
+            query = query.filter(pk__in=data['ids'])
+        result = BookingService.bulk_un_booking(query, data['book_end'])
+        return Response({'data': result})
+
+    @action(methods=['get'], detail=False)
+    def aging(self, request, *args, **kwargs):
+        # debts grouped by building, faculty, debt size and days without payment
+        bookings = scope_bookings(Booking.objects.all(), request.user)
+        report = list(DebtAgingService.report(self.filter_queryset(bookings)))
+        totals = {'count': sum(row['count'] for row in report), 'total_debt': sum(row['total_debt'] for row in report)}
+        return Response({'data': report, 'totals': totals})
+
+    @action(methods=['get'], detail=False)
+    def aging_export(self, request, *args, **kwargs):
+        return export_to_excel.workbook_response('aging', *EXPORTS['aging'](request.query_params, request.user))
+
     @action(methods=['get'], detail=False)
     def room_place(self, request, *args, **kwargs):
         room_id = request.query_params.get('id')
@@ -479,7 +543,8 @@ class BookView(mixins.ListModelMixin,
         raise APIException({'student': 'студент уже не жывет в обшежитие'})
 
 
-class PrivilegeView(mixins.ListModelMixin,
+class PrivilegeView(ReferenceListMixin,
+                    mixins.ListModelMixin,
                     mixins.CreateModelMixin,
                     mixins.UpdateModelMixin,
                     mixins.DestroyModelMixin,
@@ -487,6 +552,7 @@ class PrivilegeView(mixins.ListModelMixin,
     queryset = Privilege.objects.all()
     serializer_class = serializers.PrivilegeSerializer
     permission_classes = (IsAuthenticated,)
+    reference_name = 'privilege'
 
     def create(self, request, *args, **kwargs):
         privilege = self.get_serializer(data=request.data)
@@ -517,62 +583,60 @@ class ContractDormApi(mixins.ListModelMixin,
     filterset_class = BookFilter
 
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user).order_by('-created_at')
+        return Booking.objects.filter(user_id=self.request.user.id).order_by('-created_at')
 
     def list(self, request, *args, **kwargs):
-        query = self.filter_queryset(self.get_queryset())
+        query = BookingListService.values(self.filter_queryset(self.get_queryset()))
         page = self.paginate_queryset(query)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            result = self.get_paginated_response(serializer.data)
+            result = self.get_paginated_response(BookingListService.to_representation(page))
             data = result.data  # pagination data
         else:
-            serializer = self.get_serializer(query, many=True)
-            data = serializer.data
+            data = BookingListService.to_representation(query)
         return Response(data)
 
     def update(self, request, *args, **kwargs):
-        book_id = kwargs.get('pk')
-        new_room_id = self.request.data.get('room')
-        newRoom = Room.objects.get(pk=new_room_id)
-        if newRoom.person_count >= newRoom.room_type.place:
-            raise APIException({'room_is_full': 'Это комната уже заполнена'})
+        transfer = serializers.BookTransferSerializer(data=request.data)
+        transfer.is_valid(raise_exception=True)
+        RoomService.transfer(int(kwargs.get('pk')), transfer.validated_data['room'])
+        return Response({'room': 'change room'})
+
+    @action(methods=['post'], detail=False)
+    def move(self, request, *args, **kwargs):
+        moves = serializers.BookTransferSerializer(data=body_list(request.data, 'moves'), many=True)
+        moves.is_valid(raise_exception=True)
+        result = RoomService.move_many(moves.validated_data)
+        return Response({'data': result})
+
+    @action(methods=['post'], detail=False)
+    def allocate(self, request, *args, **kwargs):
+        # settles a batch of students into the free beds automatically, dry_run only returns the plan
+        if self.request.user.role == '1':
+            user_id = None
+        elif self.request.user.role == '3':
+            user_id = self.request.user.id
         else:
-            booking = get_object_or_404(Booking, pk=book_id)
-            old_book = booking.room_id
-            booking.room_id = new_room_id
-            newRoom.person_count += 1
-            newRoom.save()
-            booking.save()
-            if newRoom.person_count == newRoom.room_type.place:
-                newRoom.is_full = 1
-                newRoom.save()
-            if newRoom.room_gender == '2':
-                newRoom.room_gender = booking.student.gender
-                newRoom.save()
-            oldRoom = Room.objects.get(pk=old_book)
-            oldRoom.person_count -= 1
-            oldRoom.save()
-            if oldRoom.person_count == 0:
-                oldRoom.is_full = 0
-                oldRoom.room_gender = 2
-                oldRoom.save()
-            elif oldRoom.person_count < oldRoom.room_type.place:
-                oldRoom.is_full = 0
-                oldRoom.save()
-            return Response({'room': 'change room'})
+            raise APIException({'error': 'you have no permission'})
+        allocation = serializers.AllocationSerializer(data=request.data)
+        allocation.is_valid(raise_exception=True)
+        data = allocation.validated_data
+        students = AllocationService.students(
+            data.get('students'), gender=data.get('gender'), group=data.get('group'), faculty=data.get('faculty'),
+            country=data.get('country'), student_type=data.get('student_type'),
+        )
+        rooms = AllocationService.rooms(data.get('building'), data.get('floor'), user_id)
+        result = AllocationService.allocate(students, rooms, self.request.user.id, data.get('book_date'),
+                                            data['dry_run'])
+        return Response({'data': result})
 
     @action(methods=['get'], detail=False)
     def free_room(self, request, *args, **kwargs):
         apartment = self.request.query_params.get('room')
         floor = self.request.query_params.get('floor')
-        if apartment:
-            room = Room.objects. \
-                       filter(number__startswith=apartment, floor=floor, is_full=0, user_id=self.request.user.id). \
-                       values('number', 'id', 'person_count', 'room_gender').order_by('-number')[0:10]
-        else:
-            room = Room.objects.filter(floor=floor, is_full=0, user_id=self.request.user.id). \
-                       values('number', 'id', 'person_count', 'room_gender').order_by('number')[0:10]
+        if floor is None or not floor.isdigit():
+            return Response({'data': []})
+        room = AvailabilityIndex.first_free(int(floor), user_id=self.request.user.id, number=apartment or None,
+                                            reverse=bool(apartment))
         serial = serializers.FreeRoomSerializer(room, many=True)
         return Response({'data': serial.data})
 
@@ -590,17 +654,31 @@ class FreePlaceApi(mixins.ListModelMixin,
         if self.request.user.role == '1':
             return Room.objects.select_related('room_type', 'user', 'building').order_by('-id')
         elif self.request.user.role == '3':
-            return Room.objects.filter(user=self.request.user).select_related('room_type', 'user', 'building').order_by(
+            return Room.objects.filter(user_id=self.request.user.id).select_related('room_type', 'user', 'building').order_by(
                 '-id')
         else:
             raise APIException({'error': 'you have no permission'})
 
     def list(self, request, *args, **kwargs):
-        free = self.get_queryset().annotate(
-            free_place=F('room_type__place') - F('person_count')
-        ).values('id', 'number', 'building__name', 'building_id', 'is_full', 'floor', 'room_type__place',
-                 'person_count', 'free_place', 'room_gender').order_by('building_id', 'number', 'is_full')
-        query = self.filter_queryset(free)
+        if self.request.user.role == '1':
+            user_id = None
+        elif self.request.user.role == '3':
+            user_id = self.request.user.id
+        else:
+            raise APIException({'error': 'you have no permission'})
+        form = FreeRoomFilter(request.query_params, queryset=Room.objects.none()).form
+        if not form.is_valid():
+            raise ValidationError(form.errors)
+        params = form.cleaned_data
+        query = AvailabilityIndex.free_places(
+            building=None if params['building'] is None else int(params['building']),
+            floor=None if params['floor'] is None else int(params['floor']),
+            gender=params['gender'] or None,
+            user_id=user_id,
+            number=params['room'] or None,
+            is_full=params['is_full'],
+            place=None if params['place'] is None else int(params['place']),
+        )
         page = self.paginate_queryset(query)
         if page is not None:
             serializer = serializers.FreePlaceSerializer(page, many=True)
@@ -616,10 +694,7 @@ class FreePlaceApi(mixins.ListModelMixin,
         query = request.query_params.get('search')
 
         if query is not None and query != '':
-            students = Student.objects.annotate(
-                has_booking=Exists(Booking.objects.filter(student_id=OuterRef('pk')))
-            ).filter(has_booking=False).values('id', 'name', 'last_name')
-            student = students.filter(Q(name__istartswith=query) | Q(last_name__istartswith=query))[:4]
+            student = StudentSearchIndex.search(query, 4)
             serial = serializers.FreeStudentSearch(student, many=True)
             return Response({'data': serial.data})
         else:
@@ -644,19 +719,19 @@ class MainDormitoryApi(mixins.ListModelMixin,
         if user == '1':
             room = Building.objects
         elif user == '3':
-            room = Building.objects.filter(commandant=self.request.user.id)
+            room = Building.objects.filter(pk=user_building(self.request.user))
         else:
             raise APIException({'error': 'You have no permission'})
         query = room.annotate(
-            total_rooms=Count('room__id', distinct=True),
-            busy_rooms=Count('room', filter=Q(room__is_full=True), distinct=True),
+            total_rooms=Coalesce(F('stats__rooms'), 0),
+            busy_rooms=Coalesce(F('stats__busy_rooms'), 0),
             free_rooms=F('total_rooms') - F('busy_rooms'),
-            women=Count('room', filter=Q(room__booking__student__gender='0')),
-            men=Count('room', filter=Q(room__booking__student__gender='1')),
+            women=Coalesce(F('stats__women'), 0),
+            men=Coalesce(F('stats__men'), 0),
             build_name=F('name'),
             build_id=F('id'),
             floor_size=F('floor_count'),
-            all_student=Count('room__booking__student__id', distinct=True),
+            all_student=Coalesce(F('stats__students'), 0),
         ).values('build_name', 'build_id', 'floor_size', 'total_rooms', 'busy_rooms', 'free_rooms',
                  'all_student', 'men', 'women')
         serial = serializers.MainDormitorySerializer(query, many=True)
@@ -666,13 +741,39 @@ class MainDormitoryApi(mixins.ListModelMixin,
 class CatApi(mixins.ListModelMixin, generics.GenericAPIView):
 
     def get(self, request, *args, **kwargs):
-        faculty = serializers.FacultySerializer(Faculty.objects.all(), many=True)
-        country = serializers.CountrySerializer(Country.objects.all(), many=True)
-        student_type = serializers.StudentTypeSerializer(StudentType.objects.values('id', 'type'), many=True)
-        return Response({'data': {
-            'faculty': faculty.data,
-            'country': country.data,
-            'student_type': student_type.data
-        }})
+        return ReferenceCache.response(request, 'categories', lambda: {
+            'faculty': serializers.FacultySerializer(Faculty.objects.all(), many=True).data,
+            'country': serializers.CountrySerializer(Country.objects.all(), many=True).data,
+            'student_type': serializers.StudentTypeSerializer(StudentType.objects.values('id', 'type'), many=True).data
+        })
+
+
+class ExportJobApi(mixins.CreateModelMixin,
+                   mixins.RetrieveModelMixin,
+                   viewsets.GenericViewSet):
+    serializer_class = serializers.ExportJobSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return ExportJob.objects.filter(user_id=self.request.user.id)
+
+    def create(self, request, *args, **kwargs):
+        serial = serializers.ExportJobSerializer(data=request.data)
+        serial.is_valid(raise_exception=True)
+        job = ExportJobService.create(serial.validated_data['kind'], serial.validated_data.get('params', {}),
+                                      self.request.user.id)
+        return Response({'data': serializers.ExportJobSerializer(job).data}, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, *args, **kwargs):
+        job = self.get_object()
+        return Response({'data': serializers.ExportJobSerializer(job).data})
+
+    @action(methods=['get'], detail=True)
+    def download(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.status != 'done':
+            raise APIException({'status': f'экспорт ещё не готов ({job.status})'})
+        return FileResponse(job.file.open('rb'), as_attachment=True,
+                            filename=f'{job.created_at:%Y-%m-%d}-{job.kind}.xlsx')
 
 # class